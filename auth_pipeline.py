@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# This hashes the passwords of login and register attempts in other processes so the server never waits on them
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import hashlib  # used to encrypt the password in the database
+import multiprocessing  # used to start the worker processes
+import os  # used to get the number of cores
+import threading  # used to limit how many passwords can be waiting to be hashed
+
+# How many times the password gets hashed, this has to stay the same or no one will be able to login
+HASH_ITERATIONS = 100000
+
+
+def hash_password(password: str, salt: bytes) -> str:
+    """
+    Hash the password with the salt, this returns the hash as hex so it can be compared to the one in the database.
+    It is a module level function so that it can be sent to the worker processes.
+    """
+    return hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'), salt, HASH_ITERATIONS).hex()
+
+
+class AuthPipeline():
+    """
+    Sends the password hashing to a pool of worker processes.
+
+    The process pool runs the done callbacks of its futures on the one thread that collects every result,
+    so the hashes are handed on to a few threads of their own. Whatever the server does with a hash
+    (reading the database, sending the reply, claiming the login on a cluster) then never holds up the other hashes.
+
+    workers = How many processes hash passwords at the same time (None is one per core).
+    queue_limit = How many passwords can wait for a free worker, any more than that are turned away.
+    """
+
+    def __init__(self, workers: int | None = None, queue_limit: int = 64) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        # Spawned workers don't inherit the server's sockets and database connection like forked ones would
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # One slot for every password that is being hashed or is waiting to be hashed
+        self.slots = threading.BoundedSemaphore(self.workers + queue_limit)
+        # The threads that the callbacks of the returned futures run on
+        self.callbacks = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="auth")
+
+    def hash_password(self, password: str, salt: bytes) -> Future[str] | None:
+        """
+        Queue the password to be hashed.
+        This returns a future of the hex hash, or None if the queue is full and the server is too busy.
+        Its callbacks run on one of the callback threads.
+        """
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            hashed = self.pool.submit(hash_password, password, salt)
+        except BaseException:
+            self.slots.release()
+            raise
+        hashing: Future[str] = Future()
+
+        def hand_off(hashed: Future[str]) -> None:
+            # This is the process pool's thread, it only passes the result on
+            self.slots.release()
+            try:
+                self.callbacks.submit(copy_result, hashed, hashing)
+            except RuntimeError:
+                # The server is shutting down
+                copy_result(hashed, hashing)
+
+        hashed.add_done_callback(hand_off)
+        return hashing
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Stop the worker processes, wait for them to stop if the server is about to exit.
+        """
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+        self.callbacks.shutdown(wait=wait)
+
+
+def copy_result(source: Future[str], target: Future[str]) -> None:
+    """
+    Give target the result (or the exception) of source, this runs target's callbacks.
+    """
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Solves many boards of one size at once with numpy, for offline jobs that go through millions of boards
+
+from solve import LightChase, init_coeff_rows, solution, solver_for
+
+import time  # used to time the benchmark and the batch files
+
+try:
+    import numpy as np  # used to work on whole stacks of boards at once, only the batch tools need it
+except ImportError:
+    np = None
+
+# How many boards are worked on at once by default, so a huge file never has to fit in memory
+CHUNK_SIZE = 65536
+# Light chased rows are kept as one 64 bit word each
+MAX_CHASE_WIDTH = 64
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ImportError("Solving boards in batches needs numpy, install it with: pip3 install numpy")
+
+def packed_size(height: int, width: int) -> int:
+    """
+    How many bytes a packed board takes, bit k (row * width + column) is bit k % 8 of byte k // 8.
+    That is the same order as board_vector, so a packed board is board_vector(...).to_bytes(size, "little").
+    """
+    return (height * width + 7) // 8
+
+def pack_boards(boards: "np.ndarray", height: int, width: int) -> "np.ndarray":
+    """
+    A stack of boards as (count, packed_size(height, width)) uint8 packed bits.
+    boards is either (count, height, width) numbers, only whether they are odd matters, or already packed.
+    """
+    boards = np.asarray(boards)
+    size = packed_size(height, width)
+    if boards.ndim == 2 and boards.dtype == np.uint8 and boards.shape[1] == size:
+        return boards
+    if boards.ndim == 3 and boards.shape[1:] == (height, width):
+        bits = (boards.reshape(len(boards), height * width) & 1).astype(np.uint8)
+        return np.packbits(bits, axis=1, bitorder="little")
+    raise ValueError(f"Expected (count, {height}, {width}) boards or (count, {size}) packed bytes, got {boards.shape}")
+
+def unpack_boards(packed: "np.ndarray", height: int, width: int) -> "np.ndarray":
+    """
+    Packed boards as a (count, height, width) uint8 array of 0s (even) and 1s (odd).
+    """
+    bits = np.unpackbits(packed, axis=1, count=height * width, bitorder="little")
+    return bits.reshape(len(packed), height, width)
+
+def words_to_bytes(words: "np.ndarray", size: int) -> "np.ndarray":
+    """
+    (count, n) little endian 64 bit words as the first size bytes of every row.
+    """
+    return np.ascontiguousarray(words).view(np.uint8)[:, :size]
+
+
+class ByteTables():
+    """
+    A linear map over GF(2): bit i of the output is the parity of rows[i] AND the input.
+    Like Symmetries every byte of the input has a table of what it adds to the output,
+    so mapping a whole stack of packed inputs is one lookup and XOR per input byte instead of a bit matrix product.
+
+    rows = One int per output bit.
+    bits = How many bits the inputs have.
+    """
+
+    def __init__(self, rows: list[int], bits: int) -> None:
+        self.words = max(1, (len(rows) + 63) // 64)
+        tables = []
+        for start in range(0, bits, 8):
+            # The output bits that each bit of the byte switches
+            columns = [sum((row >> (start + k) & 1) << i for i, row in enumerate(rows)) for k in range(8)]
+            table = [0] * 256
+            for byte in range(1, 256):
+                # A byte's output is its lowest bit's column XOR the output of the byte without it
+                lowest = (byte & -byte).bit_length() - 1
+                table[byte] = table[byte & (byte - 1)] ^ columns[lowest]
+            data = b"".join(value.to_bytes(self.words * 8, "little") for value in table)
+            tables.append(np.frombuffer(data, dtype="<u8").reshape(256, self.words))
+        self.tables = tables
+
+    def apply(self, packed: "np.ndarray") -> "np.ndarray":
+        """
+        The output of every packed input, (count, bytes) uint8 to (count, words) 64 bit words.
+        """
+        output = np.zeros((len(packed), self.words), dtype="<u8")
+        for table, column in zip(self.tables, packed.T):
+            output ^= table[column]
+        return output
+
+
+class BatchSolver():
+    """
+    Solves stacks of boards of one size, it gives the same answers as the functions in solve.py
+    (the solutions are the ones solver_for(height, width).press gives) but works on every board at once.
+
+    Boards and presses are (count, packed_size(height, width)) uint8 packed bits, see pack_boards.
+    Boards that solver_for gives an Elimination are solved by mapping them through its pseudo inverse and null space
+    with ByteTables. Bigger boards are light chased with every row as a 64 bit word, one row of every board at a time.
+    """
+
+    def __init__(self, height: int, width: int) -> None:
+        require_numpy()
+        self.height = height
+        self.width = width
+        self.cells = height * width
+        self.size = packed_size(height, width)
+        self.solver = solver_for(height, width)
+        self.nullity = len(self.solver.null_basis)
+        self.chase = isinstance(self.solver, LightChase)
+        if self.chase:
+            if width > MAX_CHASE_WIDTH:
+                raise ValueError(f"Batches of boards wider than {MAX_CHASE_WIDTH} cells can't be light chased")
+            self.row_size = (width + 7) // 8
+            self.full_row = np.uint64((1 << width) - 1)
+            self.pseudo_inverse = ByteTables(self.solver.pseudo_inverse, width)
+            self.checks = ByteTables(self.solver.checks, width)
+        else:
+            self.pseudo_inverse = ByteTables(self.solver.pseudo_inverse, self.cells)
+            self.checks = ByteTables(self.solver.null_basis, self.cells)
+            self.presses = ByteTables(init_coeff_rows(height, width), self.cells)
+        # The all odd board, packed
+        self.all_odd = np.packbits(np.ones(self.cells, dtype=np.uint8), bitorder="little")
+
+    def _rows(self, packed: "np.ndarray") -> "np.ndarray":
+        """
+        Packed boards as (height, count) words, one word for every row of every board.
+        """
+        rows = np.packbits(unpack_boards(packed, self.height, self.width), axis=2, bitorder="little")
+        words = np.zeros((len(packed), self.height, 8), dtype=np.uint8)
+        words[..., :self.row_size] = rows
+        return np.ascontiguousarray(words.view("<u8")[..., 0].T)
+
+    def _packed(self, rows: "np.ndarray") -> "np.ndarray":
+        """
+        The other way round of _rows.
+        """
+        count = rows.shape[1]
+        row_bytes = np.ascontiguousarray(rows.T).view(np.uint8).reshape(count, self.height, 8)[..., :self.row_size]
+        bits = np.unpackbits(row_bytes, axis=2, count=self.width, bitorder="little")
+        return np.packbits(bits.reshape(count, self.cells), axis=1, bitorder="little")
+
+    def _spread(self, rows: "np.ndarray") -> "np.ndarray":
+        return rows ^ ((rows << np.uint64(1)) & self.full_row) ^ (rows >> np.uint64(1))
+
+    def _chase(self, rows: "np.ndarray", first_row: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        LightChase._chase for every board at once, rows is (height, count).
+        """
+        presses = np.empty_like(rows)
+        presses[0] = first_row
+        above, row = np.zeros_like(first_row), first_row
+        for i in range(self.height - 1):
+            below = rows[i] ^ self._spread(row) ^ above
+            presses[i + 1] = below
+            above, row = row, below
+        left = rows[self.height - 1] ^ self._spread(row) ^ above
+        return presses, left
+
+    def _left(self, packed: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        The rows of every board and what chasing it with no first row presses leaves on the bottom row, as bytes.
+        """
+        rows = self._rows(packed)
+        left = self._chase(rows, np.zeros(len(packed), dtype="<u8"))[1]
+        return rows, words_to_bytes(left[:, None], self.row_size)
+
+    def is_solvable(self, packed: "np.ndarray") -> "np.ndarray":
+        if self.chase:
+            packed = self._left(packed)[1]
+        return ~self.checks.apply(packed).any(axis=1)
+
+    def count_solutions(self, packed: "np.ndarray") -> "np.ndarray":
+        """
+        How many ways every board can be solved as uint64, 0 for the ones that can't be.
+        """
+        return self.is_solvable(packed).astype(np.uint64) << np.uint64(self.nullity)
+
+    def solve(self, packed: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        One way to solve every board as packed presses, and which boards can be solved at all.
+        The presses of a board that can't be solved are all 0.
+        """
+        if self.chase:
+            rows, left = self._left(packed)
+            solvable = ~self.checks.apply(left).any(axis=1)
+            presses = self._packed(self._chase(rows, self.pseudo_inverse.apply(left)[:, 0])[0])
+        else:
+            solvable = ~self.checks.apply(packed).any(axis=1)
+            presses = words_to_bytes(self.pseudo_inverse.apply(packed), self.size).copy()
+        presses[~solvable] = 0
+        return presses, solvable
+
+    def winners(self, packed: "np.ndarray") -> "np.ndarray":
+        """
+        check_if_winner for every board, 1 if it is all even, 2 if it is all odd and 0 if the game goes on.
+        """
+        winners = np.zeros(len(packed), dtype=np.uint8)
+        winners[~packed.any(axis=1)] = 1
+        winners[(packed == self.all_odd).all(axis=1)] = 2
+        return winners
+
+    def boards_of(self, presses: "np.ndarray") -> "np.ndarray":
+        """
+        The cells that every board's presses switch, LightChase.board_of for every board.
+        """
+        if not self.chase:
+            return words_to_bytes(self.presses.apply(presses), self.size)
+        rows = self._rows(presses)
+        boards = self._spread(rows)
+        boards[1:] ^= rows[:-1]
+        boards[:-1] ^= rows[1:]
+        return self._packed(boards)
+
+    def _random_presses(self, count: int, rng: "np.random.Generator") -> "np.ndarray":
+        presses = rng.integers(0, 256, size=(count, self.size), dtype=np.uint8)
+        if self.cells % 8:
+            presses[:, -1] &= (1 << self.cells % 8) - 1
+        return presses
+
+    def random_boards(self, count: int, rng: "np.random.Generator") -> "np.ndarray":
+        """
+        Random packed boards that can be solved and aren't all even or all odd, every one of them is as likely.
+        Like random_vector every board is what random presses do to an all even board,
+        the few that are already won are made again.
+        """
+        if self.cells - self.nullity < 2:
+            raise ValueError(f"Every {self.height}x{self.width} board that can be solved is already won")
+        boards = np.ascontiguousarray(self.boards_of(self._random_presses(count, rng)))
+        while True:
+            won = np.flatnonzero(self.winners(boards))
+            if not len(won):
+                return boards
+            boards[won] = self.boards_of(self._random_presses(len(won), rng))
+
+
+def solve_to_file(path: str, height: int, width: int, boards: "np.ndarray | None" = None, count: int = 0,
+                  chunk_size: int = CHUNK_SIZE, seed: int | None = None) -> int:
+    """
+    Solve boards chunk by chunk and write the results to a .npy file as they are worked out.
+    boards is anything pack_boards takes (a np.load(..., mmap_mode="r") array is only read a chunk at a time),
+    without it count random boards are made. This returns how many boards were written.
+
+    Every record of the file has the board and its presses as packed bits, whether it can be solved,
+    how many solutions it has and check_if_winner's answer for it.
+    """
+    require_numpy()
+    batch = BatchSolver(height, width)
+    rng = np.random.default_rng(seed)
+    if boards is not None:
+        count = len(boards)
+    record = np.dtype([("board", np.uint8, (batch.size,)), ("presses", np.uint8, (batch.size,)),
+                       ("solvable", np.bool_), ("solutions", np.uint64), ("winner", np.uint8)])
+    results = np.lib.format.open_memmap(path, mode="w+", dtype=record, shape=(count,))
+    started = time.perf_counter()
+    for start in range(0, count, chunk_size):
+        end = min(start + chunk_size, count)
+        if boards is None:
+            packed = batch.random_boards(end - start, rng)
+        else:
+            packed = np.ascontiguousarray(pack_boards(boards[start:end], height, width))
+        presses, solvable = batch.solve(packed)
+        chunk = results[start:end]
+        chunk["board"] = packed
+        chunk["presses"] = presses
+        chunk["solvable"] = solvable
+        chunk["solutions"] = solvable.astype(np.uint64) << np.uint64(batch.nullity)
+        chunk["winner"] = batch.winners(packed)
+        # Write every chunk out before the next one so memory stays flat
+        results.flush()
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {count} {height}x{width} boards to {path} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f} boards/s)")
+    del results
+    return count
+
+def benchmark_batch(sizes: tuple[int, ...] = (5, 10, 14, 32, 64), boards: int = 2000, batch_boards: int = 100000) -> None:
+    """
+    Time solution one board at a time against BatchSolver.solve, and check that they agree on which boards
+    can be solved and that the batch presses really solve them.
+    """
+    require_numpy()
+    print(f"{'board':>7}{'per board us':>14}{'batch us':>10}{'speedup':>10}")
+    for size in sizes:
+        batch = BatchSolver(size, size)
+        rng = np.random.default_rng(size)
+        packed = batch.random_boards(batch_boards, rng)
+        # Some boards that can't be solved too
+        packed[::7, 0] ^= 1
+        tests = unpack_boards(packed[:boards], size, size).tolist()
+
+        started = time.perf_counter()
+        expected = [solution(board) for board in tests]
+        per_board = (time.perf_counter() - started) / boards * 1e6
+        started = time.perf_counter()
+        presses, solvable = batch.solve(packed)
+        batch_time = (time.perf_counter() - started) / batch_boards * 1e6
+
+        if (solvable[:boards] != [board is not None for board in expected]).any():
+            raise AssertionError(f"The batch solver and solution don't agree on a {size}x{size} board")
+        if (batch.boards_of(presses)[solvable] != packed[solvable]).any():
+            raise AssertionError(f"The batch solver didn't solve a {size}x{size} board")
+        print(f"{f'{size}x{size}':>7}{per_board:>14.2f}{batch_time:>10.3f}{per_board / batch_time:>9.0f}x")
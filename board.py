@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# A game board, the server, the client and the solver all use it
+
+
+class Board():
+    """
+    A board that only keeps whether every cell is odd, as the bits of one int.
+    Bit k is cell k (row * width + column), the same order solve.py uses, so the solver can take the bits as they are.
+
+    odd_count is kept up to date by every press, so who has won is known without looking at the cells.
+    """
+
+    __slots__ = ("height", "width", "cells", "bits", "odd_count")
+
+    def __init__(self, height: int, width: int, bits: int = 0) -> None:
+        self.height = height
+        self.width = width
+        self.cells = height * width
+        self.bits = bits
+        self.odd_count = bits.bit_count()
+
+    @classmethod
+    def from_rows(cls, rows: list[list[int]]) -> "Board":
+        """
+        A board from a list of rows of numbers, only whether they are odd matters.
+        """
+        width = len(rows[0])
+        bits = 0
+        for i, row in enumerate(rows):
+            for j, item in enumerate(row):
+                if item & 1:
+                    bits |= 1 << (i * width + j)
+        return cls(len(rows), width, bits)
+
+    def to_rows(self) -> list[list[int]]:
+        """
+        The board as a list of rows of 0s (even) and 1s (odd), that is how it is sent to the clients.
+        """
+        return [[self.bits >> (i * self.width + j) & 1 for j in range(self.width)] for i in range(self.height)]
+
+    def __getitem__(self, cell: tuple[int, int]) -> int:
+        """
+        board[row, col] is 1 if the cell is odd and 0 if it is even.
+        """
+        row, col = cell
+        return self.bits >> (row * self.width + col) & 1
+
+    def press(self, row: int, col: int) -> None:
+        """
+        Press the cell, this switches the cell and the cells above, below, left and right of it
+        """
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise IndexError(f"({row}, {col}) is not on a {self.height}x{self.width} board")
+        k = row * self.width + col
+        mask = 1 << k
+        if row > 0:
+            mask |= 1 << (k - self.width)
+        if row < self.height - 1:
+            mask |= 1 << (k + self.width)
+        if col > 0:
+            mask |= 1 << (k - 1)
+        if col < self.width - 1:
+            mask |= 1 << (k + 1)
+        # The odd cells that were switched are even now and the even ones are odd
+        self.odd_count += mask.bit_count() - 2 * (self.bits & mask).bit_count()
+        self.bits ^= mask
+
+    @property
+    def winner(self) -> int:
+        """
+        1 if every cell is even, 2 if every cell is odd and 0 if the game goes on.
+        """
+        if self.odd_count == 0:
+            return 1
+        if self.odd_count == self.cells:
+            return 2
+        return 0
+
+    def copy(self) -> "Board":
+        return Board(self.height, self.width, self.bits)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Board):
+            return NotImplemented
+        return (self.height, self.width, self.bits) == (other.height, other.width, other.bits)
+
+    def __repr__(self) -> str:
+        return f"Board({self.height}, {self.width}, {self.bits:#x})"
+
+    def __reduce__(self) -> tuple:
+        return Board, (self.height, self.width, self.bits)
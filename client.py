@@ -14,6 +14,8 @@ import asyncio
 
 # The client socket controller that is used by the ui/client, this will have all the actions that the client can perform.
 from client_socket_connection import ClientServerSocket
+# The board sizes that the server accepts and how many players a leaderboard page has
+from protocol import LEADERBOARD_PAGE_SIZE, MAX_BOARD_SIZE, MIN_BOARD_SIZE
 
 # Used to create multiple threads (in my case allow the client to wait to join a game and be able to cancel without needing the 'join a game' function to return a value and end)
 import _thread
@@ -183,8 +185,8 @@ class HomePage(tk.Frame):  # inherit from the tk frame
         self.rows.set(str(self.board_size[0]))
         self.columns.set(str(self.board_size[1]))
         # Create a list of values for the drop down menu
-        rows_list = [str(i) for i in range(3, 15)]
-        columns_list = [str(i) for i in range(3, 15)]
+        rows_list = [str(i) for i in range(MIN_BOARD_SIZE, MAX_BOARD_SIZE + 1)]
+        columns_list = [str(i) for i in range(MIN_BOARD_SIZE, MAX_BOARD_SIZE + 1)]
         # Create the drop down menu
         def submit_board_size(_):
             self.board_size = (int(self.rows.get()), int(self.columns.get()))
@@ -213,7 +215,8 @@ class HomePage(tk.Frame):  # inherit from the tk frame
 
     def waiting_to_join(self):
         try:
-            res = asyncio.run(self.controller.SocketConnection.join_game(self.board_size))
+            res = asyncio.run(self.controller.SocketConnection.join_game(self.board_size,
+                                                                         self.controller.frames[JoinGamePage]))
         except AttributeError:  # this will throw an error if the client is trying to get into a game without being authentecated by the server
             # send the client to the login page
             self.controller.switch_frame_to(AuthenticationPage)
@@ -244,14 +247,27 @@ class JoinGamePage(tk.Frame):  # inherit from the tk frame
         # print(self.__dict__) # shows me the attributes of this variable
         self.controller = controller
         self.parent = parent
+        # Where the player is in the queue, the server sends it every few seconds
+        self.MSG = tk.StringVar()
 
         self.render()
 
     def render(self):
+        self.MSG.set("")
         tk.Label(self, text="Waiting For Another Player To Join...", font=("", 22,)).grid(
             row=0, column=0, columnspan=3, padx=80, ipadx=30, ipady=90, sticky="news")
+        tk.Label(self, textvariable=self.MSG, font=("", 15,)).grid(row=1, column=0, columnspan=3, sticky="news")
         tk.Button(self, text="Cancel", font=("arial", 20, "bold"), command=self.cancel_game).grid(
-            row=1, column=1, pady=20, ipadx=80, ipady=20, sticky="ews")
+            row=2, column=1, pady=20, ipadx=80, ipady=20, sticky="ews")
+
+    def show_progress(self, progress: dict[str, int | float]):
+        """
+        Show the player's place in the queue and about how long they have left to wait
+        """
+        if progress["estimated_wait"]:
+            self.MSG.set(f"Number {progress['position']} in the queue, about {progress['estimated_wait']:g}s to go")
+        else:
+            self.MSG.set(f"Number {progress['position']} in the queue")
 
     def cancel_game(self):
         """
@@ -304,6 +320,8 @@ class GamePage(tk.Frame):  # inherit from the tk frame
             self.end_game_btn.grid(
                 row=0, column=1, ipadx=30, ipady=20, padx=10, pady=10)
             self.end_game_btn.grid_remove()
+            tk.Button(end_of_game_section, text="Hint", font=("arial", 14), command=self.get_hint).grid(
+                row=0, column=2, ipadx=30, ipady=20, padx=10, pady=10)
             self.msg_label = tk.Label(
                 end_of_game_section, textvariable=self.MSG, font=("arial", 14))
             self.msg_label.grid(row=0, sticky="news")
@@ -316,11 +334,11 @@ class GamePage(tk.Frame):  # inherit from the tk frame
          <difficulty>  Tkinter doesnt like buttons being generated in a for loop, (all buttons will have the same command as the last button generated)
          ie in a 3 x 3 board you will always select possition (2,2) AKA the last box. 
         """
-        size = max(len(self.controller.SocketConnection.game_data["board"]), len(
-            self.controller.SocketConnection.game_data["board"][0]))
-        for row in range(len(self.controller.SocketConnection.game_data["board"])):
-            for column in range(len(self.controller.SocketConnection.game_data["board"][row])):
-                slotState = self.controller.SocketConnection.game_data["board"][row][column]
+        board = self.controller.SocketConnection.game_data["board"]
+        size = max(board.height, board.width)
+        for row in range(board.height):
+            for column in range(board.width):
+                slotState = board[row, column]
                 if slotState % 2 == 0:
                     tk.Button(boardSection, bg="#0000FF", command=lambda row=row, col=column: self.take_turn(row, col)).grid(
                         row=row, column=column, ipadx=150 / size, ipady=150 / size, padx=5, pady=5)
@@ -341,6 +359,12 @@ class GamePage(tk.Frame):  # inherit from the tk frame
         except:
             pass
 
+    def get_hint(self):
+        try:
+            asyncio.run(self.controller.SocketConnection.get_hint())
+        except:
+            pass
+
 
 class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
     """
@@ -358,6 +382,9 @@ class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
         self.MSG = tk.StringVar()
         self.MSG.set("Your Rank Is:")
         self.userDatas = []
+        # Where every page that was looked at starts, the server only sends one page at a time
+        self.page_starts = [None]
+        self.page = 0
 
         # render view
         self.render()
@@ -368,7 +395,7 @@ class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
             username = tk.StringVar()
             username.set(self.controller.SocketConnection.user_data[0])
 
-            asyncio.run(self.get_all_user_data_sorted())
+            asyncio.run(self.get_leaderboard_page())
             Leaderboard = ttk.Treeview(self, columns=('username', 'wins', 'losses', 'games_played'))
             Leaderboard.column('#0', width=60, anchor='center')
             Leaderboard.heading('#0', text='Ranking')
@@ -381,8 +408,9 @@ class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
             Leaderboard.column('games_played', width=120, anchor='center')
             Leaderboard.heading('games_played', text='Games Played')
 
-            for index in range(0, (20 if (len(self.userDatas) > 19) else len(self.userDatas))):  # Display top 20 players!
-                Leaderboard.insert("", tk.END, text=str(index+1), values=self.userDatas[index] )
+            first_rank = self.page * LEADERBOARD_PAGE_SIZE + 1
+            for index, userdata in enumerate(self.userDatas):
+                Leaderboard.insert("", tk.END, text=str(first_rank + index), values=userdata)
 
             Leaderboard.grid(row=0,  padx=10, pady=20,
                               ipady=140, sticky="nw")
@@ -394,6 +422,11 @@ class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
 
             tk.Button(right_action_section, text="Update Board", font=(
                 "arial", 16), command=self.render).grid(row=0, columnspan=2, sticky="new", ipadx=10, ipady=10)
+            tk.Button(right_action_section, text="< Previous", font=("arial", 14), command=self.previous_page,
+                      state=tk.NORMAL if self.page > 0 else tk.DISABLED).grid(row=3, column=0, sticky="new", padx=5)
+            tk.Button(right_action_section, text="Next >", font=("arial", 14), command=self.next_page,
+                      state=tk.NORMAL if len(self.page_starts) > self.page + 1 else tk.DISABLED).grid(
+                row=3, column=1, sticky="new", padx=5)
 
             # search player section
             search_player_section = tk.Frame(right_action_section)
@@ -415,28 +448,47 @@ class LeaderBoardPage(tk.Frame):  # inherit from the tk frame
             tk.Label(search_player_section, textvariable=self.MSG, wrap=255, font=(
                 "arial", 14)).grid(row=4, columnspan=2, sticky="sw", pady=20)
 
-    async def get_all_user_data_sorted(self):
+    async def get_leaderboard_page(self):
         """
-        get all user datas from the database via the server connection
+        get the page of the leaderboard that is being looked at from the server
         """
-        # get all user stats data from the server (username, wins, loses, games_played)
-        # fetch_all_user_stats = [("isaac", 12,0,12), ("test1", 0,10,10), ("test2", 4,10,14), ("test3", 10,4,14)]
-        try:
-            self.MSG.set("")
-            fetch_all_user_stats = await self.controller.SocketConnection.get_all_player_stats()
-            if fetch_all_user_stats != True:
-                self.MSG.set(fetch_all_user_stats)
-            self.userDatas = self.controller.SocketConnection.leaderboard
-        except:
-            raise
+        self.MSG.set("")
+        # Forget the pages after this one, the leaderboard could have changed since they were looked at
+        del self.page_starts[self.page + 1:]
+        if self.page == 0:
+            # The first page comes from the best players, the server only sends them again when they change
+            result = await self.controller.SocketConnection.get_leaderboard()
+            if result != True:
+                self.MSG.set(result)
+            top_players = self.controller.SocketConnection.top_players
+            self.userDatas = top_players[:LEADERBOARD_PAGE_SIZE]
+            if len(top_players) > LEADERBOARD_PAGE_SIZE:
+                last = top_players[LEADERBOARD_PAGE_SIZE - 1]
+                self.page_starts.append((last[1] - last[2], last[0]))
+            return
+        result = await self.controller.SocketConnection.get_leaderboard_page(self.page_starts[self.page])
+        if result != True:
+            self.MSG.set(result)
+        self.userDatas = self.controller.SocketConnection.leaderboard
+        if self.controller.SocketConnection.leaderboard_next is not None:
+            self.page_starts.append(self.controller.SocketConnection.leaderboard_next)
+
+    def next_page(self):
+        if len(self.page_starts) > self.page + 1:
+            self.page += 1
+            self.render()
+
+    def previous_page(self):
+        if self.page > 0:
+            self.page -= 1
+            self.render()
 
     def find_user_rank(self, username: str):
-        for i, userdata in enumerate(self.userDatas):
-            if userdata[0] == username:
-                return self.MSG.set(f"Rank of {username}: {i+1} ")
-            else:
-                pass
-        return self.MSG.set(f"Could not find {username}")
+        # The server works out the rank, players with the same score share it
+        result = asyncio.run(self.controller.SocketConnection.get_player_rank(username))
+        if type(result) is not dict:
+            return self.MSG.set(result)
+        return self.MSG.set(f"Rank of {username}: {result['rank']} (score {result['score']}) ")
 
 
 class AuthenticationPage(tk.Frame):  # inherit from the tk frame
@@ -3,10 +3,18 @@
 
 # This is the client of the project. It will be used to talk to the server.
 
+from protocol import BINARY, FrameDecoder, HEADERSIZE, LEADERBOARD_PAGE_SIZE, RECV_SIZE, encode_document
+from board import Board
+from leaderboard import leaderboard_key
+from collections import deque
+from typing import TYPE_CHECKING
+
 import socket  # used to create the client socket connection with the server socket.
-import pickle  # parser that is used to accept and send any python class.
 import uuid  # used to generate a unique id for the game
-import tkinter as tk  # used to get datatype
+
+if TYPE_CHECKING:
+    # Only needed for a type hint, so the client can be imported on a computer without a display
+    import tkinter as tk
 
 # Set up the socket
 
@@ -14,7 +22,8 @@ import tkinter as tk  # used to get datatype
 class ClientServerSocket(socket.socket):
     # Default the host will be "socket.gethostname()" which in the current computer.
     # socket_host_data will have to be passed if the server isnt running on the current computer.
-    def __init__(self, socket_host_data=(socket.gethostname(), 4201)) -> None:
+    # wire_format can be set to protocol.PICKLE to talk to the server with the original pickle format.
+    def __init__(self, socket_host_data=(socket.gethostname(), 4201), wire_format: str = BINARY) -> None:
         super().__init__(socket.AF_INET, socket.SOCK_STREAM)
         """"
         - socket.AF_INET is saying our socket host's IP is going to be a IPv4 (Internet Protical version 4)
@@ -29,7 +38,13 @@ class ClientServerSocket(socket.socket):
             )
 
         # Define the size of the length of the header needs to be the same on the server
-        self.HEADERSIZE = 10
+        self.HEADERSIZE = HEADERSIZE
+        # The format that documents are sent and received in, the server answers in the same one
+        self.wire_format = wire_format
+        # The bytes that have been read but are not a whole document yet
+        self.decoder = FrameDecoder(wire_format)
+        # Documents that arrived in the same read as an earlier one and haven't been handled yet
+        self.pending_docs: deque[object] = deque()
 
         # Is the user successfully authenticated?
         self.is_auth: bool = False
@@ -39,28 +54,34 @@ class ClientServerSocket(socket.socket):
         self.is_in_game: bool = False
 
         self.user_data: tuple[str, int, int, int]
-        self.game_data: dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] | int |
+        self.game_data: dict[str, uuid.UUID | list[tuple[str, int, int, int]] | Board | int |
                              list[socket.socket] | tuple[str, int, int, int]]
         # Leaderboard
         self.leaderboard: list[tuple[str, int, int, int]]
+        # Where the page after the leaderboard page that was got last starts, None if it was the last page
+        self.leaderboard_next: tuple[int, str] | None = None
+        # The best players and the version of the leaderboard they come from, so only the changes have to be sent
+        self.top_players: list[tuple[str, int, int, int]] = []
+        self.top_players_version: str | None = None
 
         # if self.isAuth is False:
         #    raise(BaseException("Password Or Username Was Incorrect"))
 
     async def recv_doc_manager(self):
+        """
+        Return the next document from the server, reading more from the socket until a whole one has arrived
+        """
         try:
-            # get the header size
-            message_header = self.recv(self.HEADERSIZE)
+            while not self.pending_docs:
+                data = self.recv(RECV_SIZE)
 
-            # this occures if the user disconnects or sends back no data
-            if not len(message_header):
-                return False
-            # this line will remove the extra spaces that we added in the HEADERSIZE and cast the tring into a integer
-            document_length = int(message_header.decode('utf-8').strip())
-            # this will store the actual document that was sent to the server
-            doc = self.recv(document_length)
+                # this occures if the user disconnects or sends back no data
+                if not len(data):
+                    return False
+                # a read can hold part of a document or many of them
+                self.pending_docs.extend(self.decoder.feed(data))
 
-            return pickle.loads(doc)
+            return self.pending_docs.popleft()
         except BlockingIOError:
             return
         except:
@@ -69,8 +90,7 @@ class ClientServerSocket(socket.socket):
     def pkg_doc_manager(self, action, document):
         """
         Handle the the document that the user wants to send to the socket server
-        This will be done by pickling the doc object and adding the heading (length of
-        the object in bytes)
+        This will be done by encoding the doc object in the client's wire format (see protocol.py)
 
         action  = The action type that is being packaged up.
         document = The data attached to the action
@@ -80,15 +100,7 @@ class ClientServerSocket(socket.socket):
         if not document:
             raise (BaseException("You can't send an empty document"))
 
-        doc = {"action": action, "data": document}
-
-        # this turns the python class into bytes that can be sent to the server
-        pkged_doc = pickle.dumps(doc)
-
-        # The header will contain the length of the pkged_document bytes
-        pkged_doc_with_header = bytes(f"{len(pkged_doc):<{self.HEADERSIZE}}", 'utf-8') + pkged_doc
-
-        return pkged_doc_with_header
+        return encode_document(action, document, self.wire_format)
 
     #
     # This will get passed in a username and passwor -> the socket server will validate the user's Credential
@@ -139,7 +151,11 @@ class ClientServerSocket(socket.socket):
             # successfully created user account
             return results["data"]
 
-    async def join_game(self, board_size: tuple[int, int]):
+    async def join_game(self, board_size: tuple[int, int], frame: "tk.Frame | None" = None):
+        """
+        Ask the server for a game and wait until it starts or the client cancels.
+        frame = Shown where the client is in the queue (frame.show_progress) while it waits.
+        """
         # Checks if the client is already authenticated
         if self.is_auth is True and self.is_waiting is False and self.is_in_game is False:
             data: tuple[str, tuple[int, int]] = (self.user_data[0], board_size)
@@ -158,6 +174,9 @@ class ClientServerSocket(socket.socket):
                 return
 
             while results["action"] == "[JOIN GAME - WAITING]":
+                # {"position", "estimated_wait"}, where we are in the queue and how long we should have to wait
+                if frame is not None:
+                    frame.show_progress(results["data"])
                 results = await self.recv_doc_manager()
                 if results is None:
                     self.is_waiting = False
@@ -167,6 +186,11 @@ class ClientServerSocket(socket.socket):
                 # No in the waiting game queue
                 return results["data"]
 
+            if results["action"] == "[JOIN GAME - FAIL]":
+                # The server doesn't have boards of that size
+                self.is_waiting = False
+                return results["data"]
+
             self.is_waiting = False
             # if  results["action"] == "[JOIN GAME - CANCELLED]":
             #     # Vancelled game
@@ -177,6 +201,9 @@ class ClientServerSocket(socket.socket):
                 # Duccessfully joined a game
                 self.is_in_game = True
                 self.game_data = results["data"]
+                # With the pickle format the board is sent as rows of numbers, only whether they are odd matters
+                if type(self.game_data["board"]) is not Board:
+                    self.game_data["board"] = Board.from_rows(self.game_data["board"])
                 return True
 
             if results["action"] == "[CANCEL GAME - SUCCESS]":
@@ -193,7 +220,7 @@ class ClientServerSocket(socket.socket):
             packaged_leave_game_queue_document = self.pkg_doc_manager("[CANCEL GAME]", self.user_data[0])
             self.send(packaged_leave_game_queue_document)
 
-    async def start_game_loop(self, frame: tk.Frame) -> None:
+    async def start_game_loop(self, frame: "tk.Frame") -> None:
         """
         Listens to any updates from the server 
         """
@@ -204,17 +231,33 @@ class ClientServerSocket(socket.socket):
                 self.is_waiting = False
                 return "Error: no connection to the socket"
 
-            while results["action"] == "[GAME - TURN]":
-                self.game_data = results["data"]
-                frame.render()
+            while results["action"] in ("[GAME - MOVE]", "[GAME - TURN]", "[MOVE - FAIL]", "[GET HINT - SUCCESS]",
+                                        "[GET HINT - FAIL]"):
+                if results["action"] == "[GAME - MOVE]":
+                    self.apply_move(results["data"])
+                    frame.render()
+                elif results["action"] == "[GAME - TURN]":
+                    # With the pickle format the server sends the whole game after every move
+                    self.game_data.update(results["data"])
+                    self.game_data["board"] = Board.from_rows(results["data"]["board"])
+                    frame.render()
+                elif results["action"] == "[GET HINT - SUCCESS]":
+                    hint = results["data"]
+                    frame.MSG.set(f"Hint: press row {hint['row'] + 1}, column {hint['col'] + 1} "
+                                  f"({hint['presses']} presses left to win)")
+                    frame.msg_label.grid()
+                else:
+                    # The server turned down our move
+                    frame.MSG.set(results["data"])
+                    frame.msg_label.grid()
                 results = await self.recv_doc_manager()
                 if results is None:
                     self.is_in_game = False
                     return "Error: no connection to the socket"
 
             if results["action"] == "[GAME - END]":
-                self.game_data = results["data"]
-                self.user_data = self.game_data["updated_user_data"]
+                self.apply_move(results["data"])
+                self.user_data = results["data"]["updated_user_data"]
                 # Game ended
                 frame.MSG.set("Player " + str(self.game_data["winner"]) + " has won!")
                 frame.render()
@@ -228,31 +271,41 @@ class ClientServerSocket(socket.socket):
             self.game_data = {}
             raise
 
-    def switch_cell(self, matrix: list[list[int]], x: int, y: int) -> list[list[int]]:
-        matrix[x][y] += 1
-        if x > 0:
-            matrix[x - 1][y] += 1
-        if x < len(matrix) - 1:
-            matrix[x + 1][y] += 1
-        if y > 0:
-            matrix[x][y - 1] += 1
-        if y < len(matrix[0]) - 1:
-            matrix[x][y + 1] += 1
-        return matrix
+    def switch_cell(self, board: Board, x: int, y: int) -> Board:
+        board.press(x, y)
+        return board
+
+    def apply_move(self, move: dict[str, uuid.UUID | int | tuple[str, int, int, int]]) -> None:
+        """
+        Press the cell of a move that the server sent on our copy of the board
+        """
+        self.game_data["board"] = self.switch_cell(self.game_data["board"], move["row"], move["col"])
+        self.game_data["seq"] = move["seq"]
+        self.game_data["player_turn"] = move["player_turn"]
+        self.game_data["winner"] = move["winner"]
 
     async def take_turn(self, rowCol):
         """
-        Make an action on the board by sending the data to the socket server
+        Make an action on the board by sending the move to the socket server
+        The board is only updated once the server sends the move back
         """
         # Make sure the player is in a game
         if self.is_auth is True and self.is_in_game is True:
+            # Send the move action to the server
+            move: tuple[uuid.UUID, int, int, int] = (self.game_data["id"], rowCol[0], rowCol[1],
+                                                     self.game_data["seq"] + 1)
+            packaged_move_action_document = self.pkg_doc_manager("[MOVE]", move)
+            self.send(packaged_move_action_document)
+        return
 
-            # Update board
-            self.game_data["board"] = self.switch_cell(self.game_data["board"], rowCol[0], rowCol[1])
-
-            # Send the take turn action to the server
-            packaged_game_board_action_document = self.pkg_doc_manager("[TAKE TURN]", self.game_data)
-            self.send(packaged_game_board_action_document)
+    async def get_hint(self) -> None:
+        """
+        Ask the server which cell to press next, the answer comes to the game loop
+        """
+        # Make sure the player is in a game
+        if self.is_auth is True and self.is_in_game is True:
+            packaged_get_hint_document = self.pkg_doc_manager("[GET HINT]", self.game_data["id"])
+            self.send(packaged_get_hint_document)
         return
 
     async def get_all_player_stats(self) -> bool | str | None:
@@ -280,6 +333,87 @@ class ClientServerSocket(socket.socket):
         except:
             raise
 
+    async def get_leaderboard_page(self, after: tuple[int, str] | None = None,
+                                   limit: int = LEADERBOARD_PAGE_SIZE) -> bool | str | None:
+        """
+        Get one page of the leaderboard, already sorted by the server.
+        after is where the page starts, the leaderboard_next of the page before (None for the first page).
+        The page goes in self.leaderboard and where the next one starts in self.leaderboard_next.
+        """
+        # Make sure the client is authenticated and not in a game
+        if self.is_auth is True and self.is_in_game is False:
+            packaged_get_leaderboard_page_document = self.pkg_doc_manager("[GET LEADERBOARD PAGE]", (after, limit))
+            self.send(packaged_get_leaderboard_page_document)
+            results: bool | dict[str, str | dict[str, list[tuple[str, int, int, int]] | tuple[int, str] | None]] | None \
+                = await self.recv_doc_manager()
+
+            # Nothing was sent back, something broke on the server (disconnected)
+            if results is None or results is False:
+                return "Error: no connection to the socket"
+
+            if results["action"] == "[GET LEADERBOARD PAGE - FAIL]":
+                self.leaderboard = []
+                self.leaderboard_next = None
+                return results["data"]
+
+            self.leaderboard = [tuple(player) for player in results["data"]["players"]]
+            self.leaderboard_next = results["data"]["next"]
+            return True
+
+    async def get_player_rank(self, username: str) -> dict[str, int | list[tuple[str, int, int, int]]] | str:
+        """
+        Get a player's rank and score and the players around them on the leaderboard.
+        The reply is a dict with "rank", "score", "players" and "position" (where the player is in "players"),
+        or an error message.
+        """
+        # Make sure the client is authenticated and not in a game
+        if self.is_auth is True and self.is_in_game is False:
+            packaged_get_player_rank_document = self.pkg_doc_manager("[GET PLAYER RANK]", username)
+            self.send(packaged_get_player_rank_document)
+            results: bool | dict[str, str | dict[str, int | list[tuple[str, int, int, int]]]] | None \
+                = await self.recv_doc_manager()
+
+            # Nothing was sent back, something broke on the server (disconnected)
+            if results is None or results is False:
+                return "Error: no connection to the socket"
+
+            # The rank on success and why it failed otherwise
+            return results["data"]
+
+    async def get_leaderboard(self) -> bool | str | None:
+        """
+        Get the best players of the leaderboard into self.top_players.
+        The server is told which version is already here, so it only sends what changed since (or nothing at all).
+        """
+        # Make sure the client is authenticated and not in a game
+        if self.is_auth is True and self.is_in_game is False:
+            packaged_get_leaderboard_document = self.pkg_doc_manager("[GET LEADERBOARD]",
+                                                                       {"version": self.top_players_version})
+            self.send(packaged_get_leaderboard_document)
+            results: bool | dict[str, str | dict[str, str | list[tuple[str, int, int, int]] | list[str]]] | None \
+                = await self.recv_doc_manager()
+
+            # Nothing was sent back, something broke on the server (disconnected)
+            if results is None or results is False:
+                return "Error: no connection to the socket"
+
+            if results["action"] == "[GET LEADERBOARD - FAIL]":
+                return results["data"]
+
+            if results["action"] == "[GET LEADERBOARD - CHANGES]":
+                # Take out the players that changed or left and put the changed ones back where they go now
+                players = {player[0]: player for player in self.top_players}
+                for username in results["data"]["removed"]:
+                    del players[username]
+                for player in results["data"]["players"]:
+                    players[player[0]] = tuple(player)
+                self.top_players = sorted(players.values(), key=leaderboard_key)
+            elif results["action"] == "[GET LEADERBOARD - SUCCESS]":
+                self.top_players = [tuple(player) for player in results["data"]["players"]]
+            self.top_players_version = results["data"]["version"]
+            return True
+        return "Error: you can't see the leaderboard right now"
+
 
 if __name__ == "__main__":  # Only run this code if this python file is the root file execution
     try:
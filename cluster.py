@@ -0,0 +1,443 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# This runs the server as many worker processes on the same port, so every core can be used
+
+from concurrent.futures import Future
+from itertools import count
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.reduction import recv_handle, send_handle
+from matchmaking import Matchmaker, Ticket
+
+import socket  # used to turn the file descriptor of a handed off client back into a socket
+import multiprocessing  # used to fork the workers
+import os  # used to make the key that workers need to talk to the coordinator
+import signal  # used to stop the workers when the supervisor is stopped
+import sys  # used to exit the program
+import shutil  # used to remove the coordinator's socket file
+import tempfile  # used to make a private folder for the coordinator's socket file
+import threading  # used to serve every worker at the same time
+
+
+"""
+How it works
+
+The supervisor forks the workers, each one is a normal SocketServer in the select engine that binds the same port
+with SO_REUSEPORT, so the kernel shares the new connections out between them.
+Two things need to know about every worker, so they are kept by the coordinator, which runs in the supervisor and
+talks to the workers over a Unix socket:
+ - The usernames that are logged in, so a user can't log in twice on different workers.
+ - The players that are waiting for a game, so 2 players can be paired up even if they connected to different workers.
+Every worker keeps its own count of how many players have every score to rank players and its own list of the best
+players, so when a worker changes a player's stats the coordinator passes the change on to the other workers.
+
+When 2 players on different workers are paired up, the worker of the player that waited longest hosts the game.
+The other worker stops reading from its player and hands the connection (the file descriptor, the user's data and
+the bytes of a half read document) to the host through the coordinator. The client doesn't notice, it keeps
+using the same connection.
+
+Messages between the workers and the coordinator are dicts with a "type", requests that need an answer also have an
+"id" that the "reply" is sent back with.
+"""
+
+
+class Coordinator():
+    """
+    Keeps the logged in usernames and the matchmaking queue of every worker.
+    A waiting player is known by (worker index, client number on that worker).
+    """
+
+    def __init__(self, listener: Listener, progress_interval: float = 5) -> None:
+        self.listener = listener
+        self.workers: dict[int, Connection] = {}
+        self.send_locks: dict[int, threading.Lock] = {}
+        # username -> index of the worker the user is connected to
+        self.usernames: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.game_numbers = count()
+        self.matchmaker = Matchmaker(self._start_game, self._send_progress, progress_interval)
+
+    def serve_forever(self) -> None:
+        while True:
+            connection = self.listener.accept()
+            hello = connection.recv()
+            index: int = hello["worker"]
+            with self.lock:
+                self.workers[index] = connection
+                self.send_locks[index] = threading.Lock()
+            threading.Thread(target=self._serve_worker, args=(index, connection), daemon=True).start()
+
+    def _send(self, index: int, message: dict, fd: int | None = None) -> bool:
+        """
+        Send a message to a worker, with a file descriptor straight after it if there is one.
+        This returns False if the worker is gone.
+        """
+        connection = self.workers.get(index)
+        if connection is None:
+            return False
+        try:
+            with self.send_locks[index]:
+                connection.send(message)
+                if fd is not None:
+                    send_handle(connection, fd, None)
+            return True
+        except OSError:
+            return False
+
+    def _serve_worker(self, index: int, connection: Connection) -> None:
+        try:
+            while True:
+                message = connection.recv()
+                message_type = message["type"]
+
+                if message_type == "claim":
+                    # Log the user in, unless they are already logged in on any worker
+                    with self.lock:
+                        claimed = message["username"] not in self.usernames
+                        if claimed:
+                            self.usernames[message["username"]] = index
+                    self._send(index, {"type": "reply", "id": message["id"], "result": claimed})
+                elif message_type == "release":
+                    with self.lock:
+                        self.usernames.pop(message["username"], None)
+                elif message_type == "join":
+                    self.matchmaker.join((index, message["cid"]), message["username"], message["board_size"],
+                                         message["score"])
+                elif message_type == "cancel":
+                    cancelled = self.matchmaker.cancel((index, message["cid"]))
+                    self._send(index, {"type": "reply", "id": message["id"], "result": cancelled})
+                elif message_type == "handoff":
+                    # The file descriptor of the client comes straight after the message
+                    fd = recv_handle(connection)
+                    try:
+                        with self.lock:
+                            self.usernames[message["state"]["user_data"][0]] = message["to"]
+                        self._send(message["to"], dict(message, type="adopt", worker=index), fd)
+                    finally:
+                        os.close(fd)
+                elif message_type == "handoff-failed":
+                    self._send(message["to"], {"type": "abort", "game": message["game"],
+                                               "player": (index, message["cid"])})
+                elif message_type == "player":
+                    # The other workers' score counts and leaderboards need the change too
+                    with self.lock:
+                        others = [other for other in self.workers if other != index]
+                    for other in others:
+                        self._send(other, message)
+        except (EOFError, OSError):
+            pass
+
+        # The worker has stopped, so have all of its clients
+        print(f"Worker {index} has stopped")
+        with self.lock:
+            del self.workers[index]
+            for username, owner in list(self.usernames.items()):
+                if owner == index:
+                    del self.usernames[username]
+        for player in [player for player in list(self.matchmaker.tickets) if player[0] == index]:
+            self.matchmaker.cancel(player)
+
+    def _send_progress(self, ticket: Ticket, progress: dict[str, int | float]) -> None:
+        index, cid = ticket.client
+        self._send(index, {"type": "progress", "cid": cid, "progress": progress})
+
+    def _start_game(self, tickets: list[Ticket]) -> None:
+        """
+        The worker of the player that waited longest hosts the game, the other players are handed off to it.
+        """
+        host = tickets[0].client[0]
+        game = next(self.game_numbers)
+        players = [{"worker": ticket.client[0], "cid": ticket.client[1], "username": ticket.username,
+                    "board_size": ticket.board_size, "score": ticket.score} for ticket in tickets]
+        # The host has to know about the game before any of the players arrive
+        self._send(host, {"type": "match", "game": game, "players": players})
+        for player in players:
+            if player["worker"] != host:
+                if not self._send(player["worker"], {"type": "handoff", "game": game, "cid": player["cid"],
+                                                     "to": host}):
+                    self._send(host, {"type": "abort", "game": game, "player": (player["worker"], player["cid"])})
+
+
+class ClusterLink():
+    """
+    A worker's connection to the coordinator.
+    The SocketServer uses it as its matchmaker (join and cancel) and to log users in and out.
+    """
+
+    def __init__(self, index: int, address: str, authkey: bytes) -> None:
+        self.index = index
+        self.connection = Client(address, family="AF_UNIX", authkey=authkey)
+        self.connection.send({"type": "hello", "worker": index})
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.server = None
+
+        self.request_ids = count()
+        self.requests: dict[int, Future] = {}
+        # Every waiting client gets a number, that is what the coordinator knows it by
+        self.cids = count()
+        self.tickets: dict[int, Ticket] = {}
+        self.ticket_cids: dict[object, int] = {}
+        # The games this worker hosts that are waiting for players to be handed off to it
+        self.games: dict[int, dict] = {}
+
+    def attach(self, server: object) -> None:
+        """
+        Start listening to the coordinator for the server.
+        """
+        self.server = server
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _send(self, message: dict, fd: int | None = None) -> None:
+        with self.send_lock:
+            self.connection.send(message)
+            if fd is not None:
+                send_handle(self.connection, fd, None)
+
+    def _request(self, message: dict) -> object:
+        """
+        Send a message and wait for the coordinator's reply.
+        """
+        reply: Future = Future()
+        with self.lock:
+            request_id = next(self.request_ids)
+            self.requests[request_id] = reply
+        self._send(dict(message, id=request_id))
+        return reply.result()
+
+    def claim(self, username: str) -> bool:
+        """
+        Log the user in on the cluster, this returns False if they are already logged in on any worker.
+        """
+        return bool(self._request({"type": "claim", "username": username}))
+
+    def release(self, username: str) -> None:
+        self._send({"type": "release", "username": username})
+
+    def player_changed(self, player: tuple[str, int, int, int], old_score: int | None) -> None:
+        """
+        Tell the other workers that a player's stats changed, old_score is None for a new player.
+        """
+        self._send({"type": "player", "player": player, "old": old_score})
+
+    def join(self, client: object, username: str, board_size: tuple[int, int], score: int = 0) -> None:
+        with self.lock:
+            if client in self.ticket_cids:
+                return
+            cid = next(self.cids)
+            self.tickets[cid] = Ticket(client, username, (board_size[0], board_size[1]), score, cid)
+            self.ticket_cids[client] = cid
+        self._send({"type": "join", "cid": cid, "username": username, "board_size": (board_size[0], board_size[1]),
+                    "score": score})
+
+    def requeue(self, ticket: Ticket) -> None:
+        """
+        Put a player whose game couldn't start back in the queue, the coordinator starts their wait over.
+        """
+        self.join(ticket.client, ticket.username, ticket.board_size, ticket.score)
+
+    def cancel(self, client: object) -> bool:
+        with self.lock:
+            cid = self.ticket_cids.get(client)
+        if cid is None:
+            return False
+        if not self._request({"type": "cancel", "cid": cid}):
+            # The client has already been paired up
+            return False
+        with self.lock:
+            self.tickets.pop(cid, None)
+            self.ticket_cids.pop(client, None)
+        return True
+
+    def is_waiting(self, client: object) -> bool:
+        return client in self.ticket_cids
+
+    def _take_ticket(self, cid: int) -> Ticket | None:
+        """
+        Forget about a waiting client that has been paired up. Call this with the lock held.
+        """
+        ticket = self.tickets.pop(cid, None)
+        if ticket is not None:
+            self.ticket_cids.pop(ticket.client, None)
+        return ticket
+
+    def _listen(self) -> None:
+        try:
+            while True:
+                message = self.connection.recv()
+                message_type = message["type"]
+
+                if message_type == "reply":
+                    with self.lock:
+                        reply = self.requests.pop(message["id"])
+                    reply.set_result(message["result"])
+                elif message_type == "progress":
+                    with self.lock:
+                        ticket = self.tickets.get(message["cid"])
+                    if ticket is not None:
+                        try:
+                            self.server.send_waiting(ticket, message["progress"])
+                        except OSError:
+                            pass
+                elif message_type == "match":
+                    self._on_match(message)
+                elif message_type == "handoff":
+                    self._on_handoff(message)
+                elif message_type == "adopt":
+                    # The file descriptor of the client comes straight after the message
+                    self._on_adopt(message, recv_handle(self.connection))
+                elif message_type == "player":
+                    player = message["player"]
+                    self.server.scores.move(message["old"], player[1] - player[2])
+                    self.server.leaderboard.update(player)
+                elif message_type == "abort":
+                    with self.lock:
+                        game = self.games.get(message["game"])
+                        if game is not None:
+                            game["remote"].discard(tuple(message["player"]))
+                            game["failed"] = True
+                    self._try_to_start(message["game"])
+        except (EOFError, OSError):
+            # The worker can't pair players up or log anyone in without the coordinator
+            print(f"Worker {self.index} lost the coordinator")
+            os._exit(1)
+
+    def _on_match(self, message: dict) -> None:
+        """
+        This worker is hosting a game, find its own players and wait for the other players to be handed off.
+        """
+        game = {"tickets": [], "remote": set(), "failed": False}
+        with self.lock:
+            for player in message["players"]:
+                if player["worker"] == self.index:
+                    ticket = self._take_ticket(player["cid"])
+                    if ticket is None or ticket.client not in self.server.clients:
+                        # The player left before the game was made
+                        ticket = None
+                        game["failed"] = True
+                    game["tickets"].append(ticket)
+                else:
+                    game["tickets"].append(None)
+                    game["remote"].add((player["worker"], player["cid"]))
+            game["players"] = message["players"]
+            self.games[message["game"]] = game
+        self._try_to_start(message["game"])
+
+    def _on_handoff(self, message: dict) -> None:
+        """
+        A player of this worker has been paired up with a player on another worker, send them over.
+        """
+        with self.lock:
+            ticket = self._take_ticket(message["cid"])
+        if ticket is None:
+            self._send({"type": "handoff-failed", "game": message["game"], "cid": message["cid"],
+                        "to": message["to"]})
+            return
+
+        def hand_off() -> None:
+            # This runs on the select loop so that nothing is half way through reading from the client
+            state = self.server.detach_client(ticket.client)
+            if state is None:
+                self._send({"type": "handoff-failed", "game": message["game"], "cid": message["cid"],
+                            "to": message["to"]})
+                return
+            try:
+                self._send(dict(message, state=state, board_size=ticket.board_size, score=ticket.score),
+                           ticket.client.fileno())
+            finally:
+                ticket.client.close()
+
+        self.server.call_in_select_loop(hand_off)
+
+    def _on_adopt(self, message: dict, fd: int) -> None:
+        client = socket.socket(fileno=fd)
+        self.server.adopt_client(client, message["state"])
+        player = (message["worker"], message["cid"])
+        with self.lock:
+            game = self.games.get(message["game"])
+            arrived = game is not None and player in game["remote"]
+            if arrived:
+                game["remote"].discard(player)
+                slot = [(p["worker"], p["cid"]) for p in game["players"]].index(player)
+                game["tickets"][slot] = Ticket(client, message["state"]["user_data"][0], message["board_size"],
+                                               message["score"], slot)
+        if not arrived:
+            # The game was called off before the player got here, put them back in the queue
+            self.join(client, message["state"]["user_data"][0], message["board_size"], message["score"])
+            return
+        self._try_to_start(message["game"])
+
+    def _try_to_start(self, game_id: int) -> None:
+        """
+        Start the game once every player has arrived. If a player couldn't make it the others go back in the queue.
+        """
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is None or game["remote"]:
+                return
+            del self.games[game_id]
+        tickets: list[Ticket] = [ticket for ticket in game["tickets"] if ticket is not None]
+        if game["failed"]:
+            for ticket in tickets:
+                if ticket.client in self.server.clients:
+                    self.join(ticket.client, ticket.username, ticket.board_size, ticket.score)
+            return
+        self.server.create_game(tickets)
+
+
+def run_worker(index: int, address: str, authkey: bytes, server_options: dict) -> None:
+    """
+    The start of a forked worker process.
+    """
+    from server import SocketServer, signal_handler
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    SocketServer(reuse_port=True, cluster=ClusterLink(index, address, authkey), **server_options)
+
+
+def run_cluster(workers: int, progress_interval: float = 5, **server_options) -> None:
+    """
+    Fork the workers and run the coordinator until the supervisor is stopped.
+
+    workers = How many SocketServer processes share the port (one per core is a good start).
+    server_options = Passed on to every SocketServer.
+    """
+    if server_options.get("kdf_workers") is None:
+        # Share the cores between the workers' password hashing processes
+        server_options["kdf_workers"] = max(1, (os.cpu_count() or 1) // workers)
+
+    folder = tempfile.mkdtemp(prefix="lights-out-")
+    address = os.path.join(folder, "coordinator.sock")
+    # Only processes that know the key can talk to the coordinator
+    authkey = os.urandom(32)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+
+    # Fork the workers before the coordinator starts any threads
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=run_worker, args=(index, address, authkey, server_options), name=f"worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(sig, frame):
+        print("Closing server")
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        coordinator = Coordinator(listener, progress_interval)
+        threading.Thread(target=coordinator.serve_forever, daemon=True).start()
+        print(f"Started {workers} workers")
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        listener.close()
+        shutil.rmtree(folder, ignore_errors=True)
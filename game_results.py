@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Writes the results of finished games to the database in the background, many games share one commit
+
+from concurrent.futures import Future
+
+from server_sql_connection import SqlServerConnection
+
+import threading  # used to write the results in the background
+import time  # used to wait for more games to finish before writing
+
+# full: every commit is synced to the disk and a game only ends once its result is written
+# normal: the same, but the WAL is only synced now and then (a power cut can lose the last few games)
+# async: a game ends straight away with the stats the server has in memory, the result is written with the next batch
+#        (the server stopping without closing the writer loses the games of the last flush interval)
+DURABILITY_MODES = ["full", "normal", "async"]
+
+
+class GameResultWriter():
+    """
+    A queue of game results that a background thread writes to the database a batch at a time.
+    Both players of a game are always in the same batch and every batch is one transaction, so however many
+    games finish at once they only cost one commit (and one sync of the disk) between them.
+
+    database = Where the results are written, its synchronous setting should match the durability.
+    flush_interval = How many seconds to wait for more games to finish after one has, before writing.
+    durability = One of DURABILITY_MODES.
+    """
+
+    def __init__(self, database: SqlServerConnection, flush_interval: float = 0.005,
+                 durability: str = "normal") -> None:
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability has to be one of {', '.join(DURABILITY_MODES)}")
+        self.DB = database
+        self.flush_interval = flush_interval
+        self.durability = durability
+        # Every game's results and the future that gets their stats once they are written
+        self.pending: list[tuple[list[tuple[tuple[str, int, int, int], bool]],
+                                 Future[list[tuple[str, int, int, int] | None]]]] = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.games = 0
+        self.commits = 0
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, results: list[tuple[tuple[str, int, int, int], bool]]
+               ) -> Future[list[tuple[str, int, int, int] | None]]:
+        """
+        Write the results of one game, every result is (the player's (username, wins, loses, games_played), won).
+        Returns a future of the players' stats after the game, in the same order, None for a player that isn't
+        in the database (nothing is written for them).
+        With "async" durability the future is done straight away, the stats are worked out from the ones passed in.
+        """
+        written: Future[list[tuple[str, int, int, int] | None]] = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The game result writer has been closed")
+            self.pending.append((results, written))
+            self.condition.notify()
+        if self.durability != "async":
+            return written
+        ended: Future[list[tuple[str, int, int, int] | None]] = Future()
+        ended.set_result([(username, wins + won, loses + (not won), games_played + 1)
+                          for (username, wins, loses, games_played), won in results])
+        return ended
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+            # Give the games that are about to finish the chance to share the commit
+            if self.flush_interval > 0 and not self.closed:
+                time.sleep(self.flush_interval)
+            with self.condition:
+                batch, self.pending = self.pending, []
+            self._write(batch)
+
+    def _write(self, batch: list[tuple[list[tuple[tuple[str, int, int, int], bool]],
+                                       Future[list[tuple[str, int, int, int] | None]]]]) -> None:
+        try:
+            players = self.DB.record_games([(player[0], won) for results, _ in batch for player, won in results])
+        except BaseException as e:
+            print(f"Could not write the results of {len(batch)} games: {e}")
+            for _, written in batch:
+                written.set_exception(e)
+            return
+        self.games += len(batch)
+        self.commits += 1
+        start = 0
+        for results, written in batch:
+            updated = players[start:start + len(results)]
+            start += len(results)
+            for (player, _), row in zip(results, updated):
+                if row is None:
+                    print(f"Could not write the result of {player[0]}, they are not in the database")
+            written.set_result(updated)
+
+    def close(self) -> None:
+        """
+        Write what is left and stop the background thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def stats(self) -> dict[str, int]:
+        return {"games": self.games, "commits": self.commits}
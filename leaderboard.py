@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Keeps how many players have every score and who the best players are in memory,
+# so ranks and the top of the leaderboard are found without reading the users table
+
+import threading  # used to share the scores between the server's threads
+import uuid  # used to tell the versions of one server apart from another's
+import bisect  # used to keep the best players in order
+from collections import OrderedDict  # used to forget the oldest leaderboard versions first
+from typing import Callable
+
+from protocol import encode_document, MAX_LEADERBOARD_PAGE_SIZE
+
+
+class ScoreTree():
+    """
+    How many players have every score (wins - loses), as a Fenwick tree with the best score first,
+    so how many players have a better score than someone is a sum of O(log(scores)) counts
+    and moving a player to a new score is O(log(scores)) too.
+
+    Players with the same score share a rank. Scores can be anything, the tree is made bigger when a score that
+    doesn't fit turns up, that only happens when the best or worst score is beaten by a lot.
+
+    counts = How many players have every score to start with.
+    """
+
+    def __init__(self, counts: dict[int, int] | None = None) -> None:
+        self.lock = threading.Lock()
+        self.counts: dict[int, int] = {score: count for score, count in (counts or {}).items() if count}
+        self.total = sum(self.counts.values())
+        self._build(min(self.counts, default=0), max(self.counts, default=0))
+
+    def _build(self, low: int, high: int) -> None:
+        """
+        Make the tree again for the scores from low to high, with some room to spare both ways.
+        """
+        room = max(16, high - low)
+        self.low, self.high = low - room, high + room
+        self.tree = [0] * (self.high - self.low + 2)
+        for score, count in self.counts.items():
+            self.tree[self._position(score)] += count
+        # Every node adds itself to its parent, that makes the tree in one pass
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def _position(self, score: int) -> int:
+        # The best score is position 1
+        return self.high - score + 1
+
+    def __len__(self) -> int:
+        return self.total
+
+    def add(self, score: int, count: int = 1) -> None:
+        """
+        count more players with the score, a negative count takes them away.
+        """
+        with self.lock:
+            self._add(score, count)
+
+    def _add(self, score: int, count: int) -> None:
+        self.total += count
+        self.counts[score] = self.counts.get(score, 0) + count
+        if not self.counts[score]:
+            del self.counts[score]
+        if not self.low <= score <= self.high:
+            self._build(min(self.low, score), max(self.high, score))
+            return
+        i = self._position(score)
+        while i < len(self.tree):
+            self.tree[i] += count
+            i += i & -i
+
+    def move(self, old: int | None, new: int) -> None:
+        """
+        A player's score went from old to new, old is None for a new player.
+        """
+        with self.lock:
+            if old is not None:
+                self._add(old, -1)
+            self._add(new, 1)
+
+    def better_than(self, score: int) -> int:
+        """
+        How many players have a better score.
+        """
+        with self.lock:
+            # Every score is in the tree, so nobody is better than the top of it and everybody is better than the bottom
+            if score >= self.high:
+                return 0
+            if score < self.low:
+                return self.total
+            i = self._position(score) - 1
+            better = 0
+            while i > 0:
+                better += self.tree[i]
+                i -= i & -i
+            return better
+
+    def rank(self, score: int) -> int:
+        """
+        The rank of a player with the score, 1 is the best.
+        """
+        return self.better_than(score) + 1
+
+
+def leaderboard_key(player: tuple[str, int, int, int]) -> tuple[int, str]:
+    # Best score first, then by username, the same order as the users_by_score index
+    return (player[2] - player[1], player[0])
+
+
+class LeaderboardCache():
+    """
+    The best players of the leaderboard as (username, wins, loses, games_played), kept in memory and changed in place
+    when a game ends, so the database is only read when the server starts
+    (or when players fall off the bottom and there is nobody to take their place).
+
+    Every change makes a new version. The replies are encoded once per version and wire format and then sent as they
+    are, a client that sends the version it has gets "not modified" or only the players that changed since then.
+
+    load = Reads a page of the leaderboard from the database, like SqlServerConnection.leaderboard_page.
+    size = How many of the best players are kept.
+    history = How many old versions are kept to work out the changes from.
+    """
+
+    def __init__(self, load: Callable[[tuple[int, str] | None, int],
+                                      tuple[list[tuple[str, int, int, int]], tuple[int, str] | None]],
+                 size: int = MAX_LEADERBOARD_PAGE_SIZE, history: int = 64) -> None:
+        self.load = load
+        self.size = size
+        self.history = history
+        self.lock = threading.Lock()
+        # A server that restarts starts counting from 0 again, so the versions have the server's own tag in front
+        self.tag = uuid.uuid4().hex[:8]
+        self.counter = 0
+        self.version = f"{self.tag}.0"
+        self.players: list[tuple[str, int, int, int]] = []
+        self.keys: list[tuple[int, str]] = []
+        self.by_username: dict[str, tuple[str, int, int, int]] = {}
+        # Whether every player is kept, otherwise there are more players than the ones kept
+        self.everyone = True
+        # The players of the old versions and the replies that are ready to send, by (wire format, version asked with)
+        self.snapshots: OrderedDict[str, tuple[tuple[str, int, int, int], ...]] = OrderedDict()
+        self.encoded: dict[tuple[str, str | None], bytes] = {}
+        self._reload()
+
+    def _reload(self) -> None:
+        """
+        Read the best players from the database again.
+        """
+        players, next_page = self.load(None, self.size)
+        players = [tuple(player) for player in players]
+        self.everyone = next_page is None
+        if players == self.players:
+            return
+        self.players = players
+        self.keys = [leaderboard_key(player) for player in players]
+        self.by_username = {player[0]: player for player in players}
+        self._changed()
+
+    def _changed(self) -> None:
+        self.counter += 1
+        self.version = f"{self.tag}.{self.counter}"
+        self.snapshots[self.version] = tuple(self.players)
+        while len(self.snapshots) > self.history:
+            self.snapshots.popitem(last=False)
+        self.encoded.clear()
+
+    def _short(self) -> bool:
+        # Players fell off the bottom and the ones that take their place aren't known
+        return not self.everyone and len(self.players) < self.size
+
+    def update(self, player: tuple[str, int, int, int]) -> None:
+        """
+        A player's stats changed (or a new player was made), move them to where they are now.
+        """
+        player = tuple(player)
+        with self.lock:
+            old = self.by_username.get(player[0])
+            if old == player:
+                return
+            changed = False
+            if old is not None:
+                i = bisect.bisect_left(self.keys, leaderboard_key(old))
+                del self.keys[i], self.players[i], self.by_username[player[0]]
+                changed = True
+            key = leaderboard_key(player)
+            # Everyone that isn't kept is below the last kept player, so a player only goes in if they are above them
+            if self.everyone or (self.keys and key < self.keys[-1]):
+                i = bisect.bisect_left(self.keys, key)
+                self.keys.insert(i, key)
+                self.players.insert(i, player)
+                self.by_username[player[0]] = player
+                changed = True
+                if len(self.players) > self.size:
+                    del self.keys[-1], self.by_username[self.players.pop()[0]]
+                    self.everyone = False
+            if changed:
+                self._changed()
+
+    def reply(self, since: str | None, wire_format: str) -> bytes:
+        """
+        The encoded reply for a client that has the version since (None if it has none):
+        - "[GET LEADERBOARD - NOT MODIFIED]" with the "version" if since is the latest version
+        - "[GET LEADERBOARD - CHANGES]" with the "version", the "players" that are new or changed since then
+          and the usernames that have been "removed", if since is a version that is still kept
+        - "[GET LEADERBOARD - SUCCESS]" with the "version" and all the "players" otherwise
+        """
+        with self.lock:
+            if self._short():
+                self._reload()
+            if since is not None and since != self.version and since not in self.snapshots:
+                since = None
+            data = self.encoded.get((wire_format, since))
+            if data is not None:
+                return data
+            if since == self.version:
+                data = encode_document("[GET LEADERBOARD - NOT MODIFIED]", {"version": self.version}, wire_format)
+            elif since is not None:
+                before = {player[0]: player for player in self.snapshots[since]}
+                data = encode_document("[GET LEADERBOARD - CHANGES]", {
+                    "version": self.version,
+                    "players": [player for player in self.players if before.get(player[0]) != player],
+                    "removed": [username for username in before if username not in self.by_username],
+                }, wire_format)
+            else:
+                data = encode_document("[GET LEADERBOARD - SUCCESS]",
+                                       {"version": self.version, "players": self.players}, wire_format)
+            self.encoded[(wire_format, since)] = data
+            return data
+
+    def first_page(self, limit: int) -> tuple[list[tuple[str, int, int, int]], tuple[int, str] | None] | None:
+        """
+        The first page of the leaderboard like SqlServerConnection.leaderboard_page, None if limit is more than is kept.
+        """
+        with self.lock:
+            if self._short():
+                self._reload()
+            if limit > self.size:
+                return None
+            players = self.players[:limit]
+            if len(self.players) > limit or (not self.everyone and len(players) == limit):
+                score, username = self.keys[limit - 1]
+                return players, (-score, username)
+            return players, None
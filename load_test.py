@@ -0,0 +1,416 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# A headless load generator. It plays full games with lots of simulated players to see how much the server can take
+
+from protocol import BINARY, PICKLE, FrameDecoder, RECV_SIZE, encode_document
+from solve import solution
+from board import Board
+from collections import deque
+
+import argparse  # used to read the options from the command line
+import asyncio  # used to run every simulated player on one thread
+import multiprocessing  # used to spread the simulated players over more than one core
+import os  # used to find the server
+import random  # used to pick moves and think times
+import shlex  # used to split the extra server options
+import shutil  # used to remove the throwaway database
+import signal  # used to stop the server
+import socket  # used to find a free port and wait for the server to start
+import subprocess  # used to start a local server
+import sys  # used to start the server with this python
+import tempfile  # used to make a folder for the throwaway database
+import time  # used to time everything
+import uuid  # used to give every run its own usernames
+
+try:
+    import resource  # used to allow more open connections, only on unix
+except ImportError:
+    resource = None
+
+PASSWORD = "load-test-password"
+
+
+class Connection():
+    """
+    A connection to the server that sends and reads documents without blocking the event loop,
+    using the same wire format as ClientServerSocket.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, wire_format: str,
+                 timeout: float) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.wire_format = wire_format
+        self.timeout = timeout
+        self.decoder = FrameDecoder(wire_format)
+        self.pending_docs: deque[dict] = deque()
+
+    @classmethod
+    async def open(cls, host: str, port: int, wire_format: str, timeout: float) -> "Connection":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        return cls(reader, writer, wire_format, timeout)
+
+    def send(self, action: str, data: object) -> None:
+        self.writer.write(encode_document(action, data, self.wire_format))
+
+    async def recv(self) -> dict:
+        """
+        Wait for the next document, raises ConnectionError if the server closes the connection
+        and TimeoutError if nothing arrives for timeout seconds.
+        """
+        while not self.pending_docs:
+            data = await asyncio.wait_for(self.reader.read(RECV_SIZE), self.timeout)
+            if not data:
+                raise ConnectionError("The server closed the connection")
+            self.pending_docs.extend(self.decoder.feed(data))
+        return self.pending_docs.popleft()
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+class Stats():
+    """
+    The latencies (seconds) of every timed action and how often each thing went wrong.
+    """
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        # (username, what they were doing) of every player that gave up waiting for the server or was disconnected
+        self.stuck: list[tuple[str, str]] = []
+        self.games = 0
+
+    def record(self, name: str, seconds: float) -> None:
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def error(self, name: str) -> None:
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def merge(self, other: "Stats") -> None:
+        for name, latencies in other.latencies.items():
+            self.latencies.setdefault(name, []).extend(latencies)
+        for name, errors in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + errors
+        self.stuck += other.stuck
+        self.games += other.games
+
+
+def percentile(latencies: list[float], percent: float) -> float:
+    """
+    The latency that percent of the latencies are at or below (nearest rank), latencies has to be sorted.
+    """
+    rank = max(1, -(-len(latencies) * percent // 100))
+    return latencies[int(rank) - 1]
+
+
+def report(stats: Stats, elapsed: float) -> None:
+    print(f"\n{stats.games} games in {elapsed:.1f}s ({stats.games / elapsed:.1f} games/s)\n")
+    print(f"{'':<14}{'count':>8}{'per sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ("register", "login", "matchmaking", "turn", "stats"):
+        latencies = sorted(stats.latencies.get(name, []))
+        if not latencies:
+            continue
+        print(f"{name:<14}{len(latencies):>8}{len(latencies) / elapsed:>10.1f}"
+              f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}"
+              f"{percentile(latencies, 99) * 1000:>10.1f}{latencies[-1] * 1000:>10.1f}")
+    if stats.errors:
+        print("\nErrors:")
+        for name, errors in sorted(stats.errors.items()):
+            print(f"  {name}: {errors}")
+    if stats.stuck:
+        print("\nPlayers that didn't finish:")
+        for username, phase in stats.stuck[:20]:
+            print(f"  {username}: {phase}")
+        if len(stats.stuck) > 20:
+            print(f"  ... and {len(stats.stuck) - 20} more")
+
+
+class SimulatedPlayer():
+    """
+    A player that registers, logs in and plays games like someone using client.py would.
+    """
+
+    def __init__(self, username: str, options: argparse.Namespace, stats: Stats) -> None:
+        self.username = username
+        self.options = options
+        self.stats = stats
+        self.connection: Connection | None = None
+        # What the player is doing and which game it is on, to say where it got stuck
+        self.phase = "register"
+        self.game = 0
+
+    async def run(self) -> None:
+        try:
+            await self.register()
+            self.phase = "login"
+            await self.login()
+            for self.game in range(1, self.options.games + 1):
+                await self.play_game()
+            if self.options.stats:
+                self.phase = "stats"
+                await self.get_all_player_stats()
+        except TimeoutError:
+            self.gave_up("timed out")
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            self.gave_up("disconnected")
+        finally:
+            if self.connection is not None:
+                await self.connection.close()
+
+    async def _authenticate(self, action: str, name: str) -> Connection | None:
+        """
+        Register or log in on a new connection, trying again while the server is too busy to hash the password.
+        """
+        for attempt in range(self.options.retries + 1):
+            connection = await Connection.open(self.options.host, self.options.port, self.options.wire,
+                                               self.options.timeout)
+            started = time.perf_counter()
+            connection.send(action, (self.username, PASSWORD))
+            reply = await connection.recv()
+            if reply["action"] == action[:-1] + " - SUCCESS]":
+                self.stats.record(name, time.perf_counter() - started)
+                return connection
+            self.stats.error(f"{name}: {reply['data']}")
+            await connection.close()
+            # Back off, with some jitter so the players that were turned away don't all come back at once
+            await asyncio.sleep(self.options.retry_delay * 2 ** min(attempt, 6) * random.uniform(0.5, 1.5))
+        raise ConnectionError(f"Could not {name}")
+
+    async def register(self) -> None:
+        # The server stops reading from a connection that has registered, like the client the player logs in again
+        await (await self._authenticate("[USER REGISTER]", "register")).close()
+
+    async def login(self) -> None:
+        self.connection = await self._authenticate("[USER LOGIN]", "login")
+
+    def gave_up(self, reason: str) -> None:
+        self.stats.error(f"{reason}: {self.phase}")
+        where = f"{self.phase} (game {self.game} of {self.options.games})" if self.game else self.phase
+        self.stats.stuck.append((self.username, f"{reason} in {where}"))
+
+    async def play_game(self) -> None:
+        connection = self.connection
+        self.phase = "matchmaking"
+        started = time.perf_counter()
+        connection.send("[JOIN GAME]", (self.username, self.options.board_size))
+        # The server sends [JOIN GAME - WAITING] every few seconds, so waiting for a game needs a timeout of its own.
+        # A player that starts late can find that everyone else has played all their games and left
+        reply = await asyncio.wait_for(self.wait_for_game(), self.options.timeout)
+        if reply["action"] != "[JOIN GAME - SUCCESS]":
+            self.stats.error(f"matchmaking: {reply['action']}")
+            return
+        self.stats.record("matchmaking", time.perf_counter() - started)
+        self.phase = "turn"
+
+        game = reply["data"]
+        # The pickle format sends the board as rows
+        board = game["board"] if type(game["board"]) is Board else Board.from_rows(game["board"])
+        me = [player[0] for player in game["player_data"]].index(self.username) + 1
+        player_turn: int = game["player_turn"]
+        seq: int = game["seq"]
+        # When our move was sent and its seq, None if we aren't waiting for one
+        move_sent_at: float | None = None
+        move_seq = 0
+
+        while True:
+            if player_turn == me and move_sent_at is None:
+                if self.options.think_time:
+                    await asyncio.sleep(random.uniform(0, 2 * self.options.think_time))
+                row, col = self.pick_move(board)
+                move_seq = seq + 1
+                move_sent_at = time.perf_counter()
+                connection.send("[MOVE]", (game["id"], row, col, move_seq))
+
+            reply = await connection.recv()
+            if reply["action"] in ("[GAME - MOVE]", "[GAME - TURN]", "[GAME - END]"):
+                # With the pickle format the server sends [GAME - TURN], the move with the whole board
+                move = reply["data"]
+                board.press(move["row"], move["col"])
+                seq, player_turn = move["seq"], move["player_turn"]
+                if move_sent_at is not None and move["seq"] == move_seq:
+                    self.stats.record("turn", time.perf_counter() - move_sent_at)
+                    move_sent_at = None
+                if reply["action"] == "[GAME - END]":
+                    if me == 1:
+                        # Both players see the end, only count the game once
+                        self.stats.games += 1
+                    return
+            elif reply["action"] == "[MOVE - FAIL]":
+                self.stats.error(f"turn: {reply['data']}")
+                move_sent_at = None
+
+    async def wait_for_game(self) -> dict:
+        reply = await self.connection.recv()
+        while reply["action"] == "[JOIN GAME - WAITING]":
+            reply = await self.connection.recv()
+        return reply
+
+    def pick_move(self, board: Board) -> tuple[int, int]:
+        """
+        Press a cell that gets the board closer to all even, or a random cell now and then.
+        Both players head for the same end so that the games finish, if they both played to win
+        they would undo each other's moves for ever.
+        """
+        if random.random() >= self.options.random_moves:
+            presses = solution(board)
+            if presses:
+                cells = [(i, j) for i, row in enumerate(presses) for j, pressed in enumerate(row) if pressed]
+                if cells:
+                    return random.choice(cells)
+        return random.randrange(board.height), random.randrange(board.width)
+
+    async def get_all_player_stats(self) -> None:
+        started = time.perf_counter()
+        self.connection.send("[GET ALL PLAYER STATS]", self.username)
+        reply = await self.connection.recv()
+        if reply["action"] == "[GET ALL PLAYER STATS - SUCCESS]":
+            self.stats.record("stats", time.perf_counter() - started)
+        else:
+            self.stats.error("stats")
+
+
+async def run_players(usernames: list[str], options: argparse.Namespace) -> Stats:
+    """
+    Run the simulated players, their starts are spread over the ramp up time.
+    """
+    stats = Stats()
+    players = []
+    for i, username in enumerate(usernames):
+        player = SimulatedPlayer(username, options, stats)
+        delay = options.ramp_up * i / len(usernames)
+        players.append(asyncio.create_task(start_later(player, delay)))
+    await asyncio.gather(*players)
+    return stats
+
+
+async def start_later(player: SimulatedPlayer, delay: float) -> None:
+    await asyncio.sleep(delay)
+    await player.run()
+
+
+def run_process(usernames: list[str], options: argparse.Namespace) -> Stats:
+    """
+    The start of a load generating process.
+    """
+    raise_open_file_limit()
+    return asyncio.run(run_players(usernames, options))
+
+
+def raise_open_file_limit() -> None:
+    # Every simulated player has a connection open
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def start_server(server_args: str) -> tuple[subprocess.Popen, str, str, int]:
+    """
+    Start server.py on a free local port with a new, empty database in a temporary folder.
+    This returns the server's process, the folder (to remove once it's done), the host and the port.
+    """
+    folder = tempfile.mkdtemp(prefix="lights-out-load-test-")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+               "--host", "127.0.0.1", "--port", str(port), "--db", os.path.join(folder, "application.db"),
+               *shlex.split(server_args)]
+    log = open(os.path.join(folder, "server.log"), "w")
+    server = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=folder)
+
+    # Wait for the server to listen
+    deadline = time.monotonic() + 15
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server stopped, see {log.name}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                server.kill()
+                raise RuntimeError(f"The server didn't start, see {log.name}")
+            time.sleep(0.1)
+    return server, folder, "127.0.0.1", port
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Play full games with lots of simulated players and report how fast the server answered.",
+        epilog="Without --connect a local server.py is started with a throwaway database. "
+               "The select engine can only watch about 1000 connections, use --server-args \"--engine asyncio\" "
+               "or \"--workers N\" for more players than that.")
+    parser.add_argument("--players", type=int, default=100, help="number of simulated players (default: 100)")
+    parser.add_argument("--games", type=int, default=1, help="games every player plays (default: 1)")
+    parser.add_argument("--board-size", type=int, nargs=2, default=(3, 3), metavar=("ROWS", "COLUMNS"),
+                        help="board size every player asks for (default: 3 3)")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="average seconds a player thinks before a move (default: 0)")
+    parser.add_argument("--random-moves", type=float, default=0.0,
+                        help="chance of a player pressing a random cell instead of playing to win (default: 0)")
+    parser.add_argument("--ramp-up", type=float, default=1.0,
+                        help="seconds over which the players start (default: 1)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="processes the players are spread over, if one core can't keep up (default: 1)")
+    parser.add_argument("--wire", choices=[BINARY, PICKLE], default=BINARY, help="wire format (default: binary)")
+    parser.add_argument("--stats", action="store_true", help="get the leaderboard after the games")
+    parser.add_argument("--retries", type=int, default=8,
+                        help="times a register or login is tried again when the server is busy (default: 8)")
+    parser.add_argument("--retry-delay", type=float, default=0.25,
+                        help="seconds before the first retry, it doubles after every retry (default: 0.25)")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds a player waits for the server before giving up (default: 60)")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="use a server that is already running")
+    parser.add_argument("--server-args", default="", help="extra options for the local server.py")
+    options = parser.parse_args()
+    if options.players < 2 or options.players % 2:
+        parser.error("--players has to be an even number, players are paired up")
+    options.board_size = tuple(options.board_size)
+
+    server = folder = None
+    if options.connect:
+        options.host, port = options.connect.rsplit(":", 1)
+        options.port = int(port)
+    else:
+        server, folder, options.host, options.port = start_server(options.server_args)
+        print(f"Started a local server on port {options.port}, its log and database are in {folder}")
+
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        usernames = [f"lt{run_id}_{i}" for i in range(options.players)]
+        processes = max(1, min(options.processes, options.players))
+        print(f"Running {options.players} players in {processes} process(es)...")
+        started = time.perf_counter()
+        stats = Stats()
+        if processes == 1:
+            stats = run_process(usernames, options)
+        else:
+            chunks = [usernames[i::processes] for i in range(processes)]
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                for process_stats in pool.starmap(run_process, [(chunk, options) for chunk in chunks]):
+                    stats.merge(process_stats)
+        report(stats, time.perf_counter() - started)
+    finally:
+        if server is not None:
+            stop_server(server)
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":  # Only run this code if this python file is the root file execution
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# This pairs up the players that are waiting to join a game
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import count
+from typing import Callable
+
+import threading  # used to wait for players without using any cpu
+import time  # used to time how long players wait
+
+
+class Ticket():
+    """
+    A player that is waiting to join a game.
+
+    score = The player's wins - loses, the same score the leaderboard is sorted by.
+    """
+
+    def __init__(self, client: object, username: str, board_size: tuple[int, int], score: int, number: int) -> None:
+        self.client = client
+        self.username = username
+        self.board_size = board_size
+        self.score = score
+        self.joined_at = time.monotonic()
+        self.last_progress_at = self.joined_at
+        # Where the ticket goes in the skill index, the number makes players with the same score first come first served
+        self.key = (score, number)
+
+
+class Bucket():
+    """
+    The players that are waiting for the same board size.
+    """
+
+    def __init__(self) -> None:
+        # Oldest ticket first
+        self.fifo: OrderedDict[object, Ticket] = OrderedDict()
+        # (score, number) of every ticket, sorted, so the nearest score can be found with a binary search
+        self.skill_index: list[tuple[int, int]] = []
+        self.by_key: dict[tuple[int, int], Ticket] = {}
+        # How long the last players of this board size waited, on average (seconds)
+        self.average_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self.fifo)
+
+    def add(self, ticket: Ticket) -> None:
+        self.fifo[ticket.client] = ticket
+        insort(self.skill_index, ticket.key)
+        self.by_key[ticket.key] = ticket
+
+    def remove(self, ticket: Ticket) -> None:
+        del self.fifo[ticket.client]
+        del self.skill_index[bisect_left(self.skill_index, ticket.key)]
+        del self.by_key[ticket.key]
+
+    def nearest(self, ticket: Ticket) -> Ticket | None:
+        """
+        The waiting player with the score closest to the ticket's (not counting the ticket itself).
+        """
+        index = bisect_left(self.skill_index, ticket.key)
+        candidates = []
+        # The ticket itself is at index if it's in the bucket
+        for i in (index - 1, index, index + 1):
+            if 0 <= i < len(self.skill_index) and self.skill_index[i] != ticket.key:
+                candidates.append(self.by_key[self.skill_index[i]])
+        if not candidates:
+            return None
+        return min(candidates, key=lambda other: (abs(other.score - ticket.score), other.joined_at))
+
+
+class Matchmaker():
+    """
+    Keeps the players that are waiting for a game and pairs them up.
+
+    Players are only paired with someone that picked the same board size, so every board size has its own bucket.
+    In a bucket the new player is paired with the waiting player whose score is closest to theirs,
+    as long as the scores are within the tolerance of one of the 2 players.
+    A player's tolerance starts at base_tolerance and grows by widen_rate every second they wait,
+    so nobody waits for ever just because there is no one of their skill online.
+
+    Nothing runs whilst the queue is empty. While players wait, a single thread wakes up every sweep_interval
+    seconds to pair up the players whose tolerance has grown enough, and to tell every waiting player their place in
+    the queue and roughly how long they have left to wait (at most once every progress_interval seconds each).
+
+    on_match = Called with the 2 tickets of a new game, the player that waited longest first.
+    send_progress = Called with a ticket and its {"position", "estimated_wait"} progress.
+    """
+
+    def __init__(self, on_match: Callable[[list[Ticket]], None], send_progress: Callable[[Ticket, dict], None],
+                 progress_interval: float = 5, sweep_interval: float = 1, base_tolerance: int = 2,
+                 widen_rate: float = 1) -> None:
+        self.on_match = on_match
+        self.send_progress = send_progress
+        self.progress_interval = progress_interval
+        self.sweep_interval = sweep_interval
+        self.base_tolerance = base_tolerance
+        self.widen_rate = widen_rate
+
+        self.buckets: dict[tuple[int, int], Bucket] = {}
+        self.tickets: dict[object, Ticket] = {}
+        self.numbers = count()
+        self.condition = threading.Condition()
+
+        threading.Thread(target=self._sweep_loop, daemon=True).start()
+
+    def join(self, client: object, username: str, board_size: tuple[int, int], score: int = 0) -> None:
+        """
+        Add the client to the queue, or start a game with the best waiting player.
+        """
+        with self.condition:
+            number = next(self.numbers)
+        self.requeue(Ticket(client, username, (board_size[0], board_size[1]), score, number))
+
+    def requeue(self, ticket: Ticket) -> None:
+        """
+        Put a ticket in the queue, or start a game with the best waiting player.
+        A ticket whose game couldn't start keeps how long it has waited, so it keeps its wider tolerance.
+        """
+        match = None
+        with self.condition:
+            if ticket.client in self.tickets:
+                ticket = self.tickets[ticket.client]
+            else:
+                bucket = self.buckets.setdefault(ticket.board_size, Bucket())
+                opponent = bucket.nearest(ticket)
+                if opponent is not None and self._can_play(ticket, opponent, time.monotonic()):
+                    match = self._pair(bucket, opponent, ticket)
+                else:
+                    bucket.add(ticket)
+                    self.tickets[ticket.client] = ticket
+                    # Wake the sweep thread up in case it was waiting for someone to join
+                    self.condition.notify()
+            progress = None if match else self._progress(ticket, self.buckets[ticket.board_size])
+
+        if match:
+            self.on_match(match)
+        else:
+            self.send_progress(ticket, progress)
+
+    def cancel(self, client: object) -> bool:
+        """
+        Take the client out of the queue, this returns False if they weren't waiting.
+        """
+        with self.condition:
+            ticket = self.tickets.pop(client, None)
+            if ticket is None:
+                return False
+            self._remove(ticket)
+            return True
+
+    def is_waiting(self, client: object) -> bool:
+        return client in self.tickets
+
+    def tolerance(self, ticket: Ticket, now: float) -> float:
+        """
+        How far away from the ticket's score an opponent's score can be.
+        """
+        return self.base_tolerance + self.widen_rate * (now - ticket.joined_at)
+
+    def _can_play(self, ticket: Ticket, opponent: Ticket, now: float) -> bool:
+        return abs(ticket.score - opponent.score) <= max(self.tolerance(ticket, now), self.tolerance(opponent, now))
+
+    def _remove(self, ticket: Ticket) -> None:
+        bucket = self.buckets[ticket.board_size]
+        bucket.remove(ticket)
+        if not len(bucket):
+            del self.buckets[ticket.board_size]
+
+    def _pair(self, bucket: Bucket, waiting: Ticket, ticket: Ticket) -> list[Ticket]:
+        """
+        Take the waiting ticket out of the queue and pair it with ticket. Call this with the condition held.
+        """
+        if waiting.client in self.tickets:
+            del self.tickets[waiting.client]
+            self._remove(waiting)
+        if ticket.client in self.tickets:
+            del self.tickets[ticket.client]
+            self._remove(ticket)
+        now = time.monotonic()
+        for player in (waiting, ticket):
+            waited = now - player.joined_at
+            # An exponential moving average, so the estimate follows how busy the server is right now
+            bucket.average_wait = waited if not bucket.average_wait else 0.8 * bucket.average_wait + 0.2 * waited
+        return [waiting, ticket] if waiting.joined_at <= ticket.joined_at else [ticket, waiting]
+
+    def _progress(self, ticket: Ticket, bucket: Bucket, position: int | None = None) -> dict[str, int | float]:
+        """
+        Where the ticket is in its bucket's queue and how long it should have to wait.
+        Call this with the condition held.
+        """
+        if position is None:
+            position = len(bucket)
+        waited = time.monotonic() - ticket.joined_at
+        return {"position": position, "estimated_wait": round(max(bucket.average_wait - waited, 0.0), 1)}
+
+    def _sweep(self) -> tuple[list[list[Ticket]], list[tuple[Ticket, dict]]]:
+        """
+        Pair up the waiting players whose tolerance has grown enough, oldest first,
+        and work out who is due a progress message. Call this with the condition held.
+        """
+        now = time.monotonic()
+        matches: list[list[Ticket]] = []
+        due: list[tuple[Ticket, dict]] = []
+        for bucket in list(self.buckets.values()):
+            for ticket in list(bucket.fifo.values()):
+                if ticket.client not in self.tickets:
+                    # Already paired in this sweep
+                    continue
+                opponent = bucket.nearest(ticket)
+                if opponent is not None and self._can_play(ticket, opponent, now):
+                    matches.append(self._pair(bucket, ticket, opponent))
+
+            for position, ticket in enumerate(bucket.fifo.values(), start=1):
+                if now - ticket.last_progress_at >= self.progress_interval:
+                    ticket.last_progress_at = now
+                    due.append((ticket, self._progress(ticket, bucket, position)))
+        return matches, due
+
+    def _sweep_loop(self) -> None:
+        while True:
+            with self.condition:
+                # Sleep until someone is waiting
+                self.condition.wait_for(lambda: self.tickets)
+            time.sleep(self.sweep_interval)
+
+            with self.condition:
+                matches, due = self._sweep()
+            for match in matches:
+                try:
+                    self.on_match(match)
+                except Exception as e:
+                    print("Could not start a game:", e)
+            for ticket, progress in due:
+                try:
+                    self.send_progress(ticket, progress)
+                except OSError:
+                    # The client is gone, it will be taken out of the queue when the server notices
+                    pass
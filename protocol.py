@@ -0,0 +1,393 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# This is how documents are framed and encoded on the wire, it is shared by the server and the client.
+#
+# There are two wire formats:
+# - binary: the default. An 8 byte header (magic byte, protocol version, action code, payload length) followed by
+#   a compact tagged encoding of the document's data. Game boards (board.Board) are packed to one bit per cell.
+# - pickle: the original format, a 10 byte ASCII length header followed by a pickled {"action", "data"} dict.
+#   It is kept so that older clients can still connect.
+# The server doesn't need to be told which one a client uses, the first byte a client sends gives it away
+# (a binary header starts with MAGIC, a pickle header starts with an ASCII digit) and the server answers in kind.
+
+from board import Board
+
+import io  # used to read the pickled documents
+import pickle  # parser that is used when accept and send any python class
+import struct  # used to pack the binary header and numbers
+import uuid  # used to send the game ids
+
+# Define the size of the length of the header, the server and the client need to use the same one
+HEADERSIZE = 10
+# How many bytes are read from a socket at a time
+RECV_SIZE = 65536
+# The biggest document that will be accepted, anything bigger is treated as a broken connection
+MAX_DOCUMENT_SIZE = 16 * 1024 * 1024
+
+# The smallest and biggest number of rows and columns a board can have, the client offers these and the server checks them
+MIN_BOARD_SIZE = 3
+MAX_BOARD_SIZE = 64
+# How many players a leaderboard page has, and the most the server hands out in one page
+LEADERBOARD_PAGE_SIZE = 20
+MAX_LEADERBOARD_PAGE_SIZE = 100
+
+# The wire formats
+BINARY = "binary"
+PICKLE = "pickle"
+
+# The first byte of every binary frame, it can't be an ASCII digit so it can't be mistaken for a pickle header
+MAGIC = 0xB7
+# Bump this whenever the binary encoding changes
+# 2: boards are only sent as Board (not lists of rows) and their cells are packed in Board.bits order
+PROTOCOL_VERSION = 2
+# magic, version, action code, payload length
+BINARY_HEADER = struct.Struct("!BBHI")
+
+# Every action has a number so that only 2 bytes are sent instead of the action's name.
+# Only ever add to the end of this list, the position of an action is its number.
+ACTIONS = [
+    "[USER LOGIN]",
+    "[USER LOGIN - FAIL]",
+    "[USER LOGIN - SUCCESS]",
+    "[USER REGISTER]",
+    "[USER REGISTER - FAIL]",
+    "[USER REGISTER - SUCCESS]",
+    "[JOIN GAME]",
+    "[JOIN GAME - WAITING]",
+    "[JOIN GAME - SUCCESS]",
+    "[CANCEL GAME]",
+    "[CANCEL GAME - SUCCESS]",
+    "[CANCEL GAME - FAIL]",
+    "[TAKE TURN]",
+    "[GAME - TURN]",
+    "[GAME - END]",
+    "[GET ALL PLAYER STATS]",
+    "[GET ALL PLAYER STATS - SUCCESS]",
+    "[GET ALL PLAYER STATS - FAIL]",
+    "[ERROR - ACTION]",
+    "[MOVE]",
+    "[MOVE - FAIL]",
+    "[GAME - MOVE]",
+    "[GET HINT]",
+    "[GET HINT - SUCCESS]",
+    "[GET HINT - FAIL]",
+    "[JOIN GAME - FAIL]",
+    "[GET LEADERBOARD PAGE]",
+    "[GET LEADERBOARD PAGE - SUCCESS]",
+    "[GET LEADERBOARD PAGE - FAIL]",
+    "[GET PLAYER RANK]",
+    "[GET PLAYER RANK - SUCCESS]",
+    "[GET PLAYER RANK - FAIL]",
+    "[GET LEADERBOARD]",
+    "[GET LEADERBOARD - SUCCESS]",
+    "[GET LEADERBOARD - CHANGES]",
+    "[GET LEADERBOARD - NOT MODIFIED]",
+    "[GET LEADERBOARD - FAIL]",
+]
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+# Dictionary keys and other strings that are sent all the time get a 1 byte code instead.
+# Only ever add to the end of this list.
+KNOWN_STRINGS = [
+    "id",
+    "player_data",
+    "board",
+    "player_turn",
+    "winner",
+    "updated_user_data",
+    "row",
+    "col",
+    "seq",
+    "position",
+    "estimated_wait",
+    "presses",
+    "players",
+    "next",
+    "rank",
+    "score",
+    "version",
+    "removed",
+]
+KNOWN_STRING_CODES = {string: code for code, string in enumerate(KNOWN_STRINGS)}
+
+# The type tags of the binary encoding
+NONE, FALSE, TRUE, INT8, INT32, INT64, BIG_INT, FLOAT, SHORT_STR, STR, KNOWN_STR, BYTES, TUPLE, LIST, DICT, UUID, \
+    BOARD = range(17)
+
+INT8_STRUCT = struct.Struct("!b")
+INT32_STRUCT = struct.Struct("!i")
+INT64_STRUCT = struct.Struct("!q")
+FLOAT_STRUCT = struct.Struct("!d")
+LENGTH_STRUCT = struct.Struct("!I")
+BOARD_SIZE_STRUCT = struct.Struct("!HH")
+
+
+def encode_value(value: object, out: bytearray) -> None:
+    """
+    Add the binary encoding of the value to out.
+    """
+    value_type = type(value)
+    if value is None:
+        out.append(NONE)
+    elif value_type is bool:
+        out.append(TRUE if value else FALSE)
+    elif value_type is int:
+        if -128 <= value < 128:
+            out.append(INT8)
+            out += INT8_STRUCT.pack(value)
+        elif -2**31 <= value < 2**31:
+            out.append(INT32)
+            out += INT32_STRUCT.pack(value)
+        elif -2**63 <= value < 2**63:
+            out.append(INT64)
+            out += INT64_STRUCT.pack(value)
+        else:
+            encoded = str(value).encode('utf-8')
+            out.append(BIG_INT)
+            out += LENGTH_STRUCT.pack(len(encoded))
+            out += encoded
+    elif value_type is float:
+        out.append(FLOAT)
+        out += FLOAT_STRUCT.pack(value)
+    elif value_type is str:
+        if value in KNOWN_STRING_CODES:
+            out.append(KNOWN_STR)
+            out.append(KNOWN_STRING_CODES[value])
+            return
+        encoded = value.encode('utf-8')
+        if len(encoded) < 256:
+            out.append(SHORT_STR)
+            out.append(len(encoded))
+        else:
+            out.append(STR)
+            out += LENGTH_STRUCT.pack(len(encoded))
+        out += encoded
+    elif value_type is bytes:
+        out.append(BYTES)
+        out += LENGTH_STRUCT.pack(len(value))
+        out += value
+    elif value_type is uuid.UUID:
+        out.append(UUID)
+        out += value.bytes
+    elif value_type is tuple:
+        out.append(TUPLE)
+        out += LENGTH_STRUCT.pack(len(value))
+        for item in value:
+            encode_value(item, out)
+    elif value_type is list:
+        out.append(LIST)
+        out += LENGTH_STRUCT.pack(len(value))
+        for item in value:
+            encode_value(item, out)
+    elif value_type is dict:
+        out.append(DICT)
+        out += LENGTH_STRUCT.pack(len(value))
+        for key, item in value.items():
+            encode_value(key, out)
+            encode_value(item, out)
+    elif value_type is Board:
+        encode_board(value, out)
+    else:
+        raise ValueError(f"Can not send a {value_type.__name__} with the binary protocol")
+
+
+def encode_board(board: Board, out: bytearray) -> None:
+    """
+    Add a board to out as its size followed by whether every cell is odd, one bit each.
+    Only Boards are sent like this, a list of lists of ints is sent as a list like any other.
+    """
+    out.append(BOARD)
+    out += BOARD_SIZE_STRUCT.pack(board.height, board.width)
+    # Board.bits as it is, cell 0 is the lowest bit of the first byte and the last byte is padded with 0 bits
+    out += board.bits.to_bytes((board.cells + 7) // 8, "little")
+
+
+def decode_value(data: memoryview, offset: int) -> tuple[object, int]:
+    """
+    Decode the value that starts at offset, this returns the value and the offset after it.
+    """
+    tag = data[offset]
+    offset += 1
+    if tag == NONE:
+        return None, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == INT8:
+        return INT8_STRUCT.unpack_from(data, offset)[0], offset + 1
+    if tag == INT32:
+        return INT32_STRUCT.unpack_from(data, offset)[0], offset + 4
+    if tag == INT64:
+        return INT64_STRUCT.unpack_from(data, offset)[0], offset + 8
+    if tag == FLOAT:
+        return FLOAT_STRUCT.unpack_from(data, offset)[0], offset + 8
+    if tag == KNOWN_STR:
+        return KNOWN_STRINGS[data[offset]], offset + 1
+    if tag == SHORT_STR:
+        length = data[offset]
+        offset += 1
+        return str(data[offset:offset + length], 'utf-8'), offset + length
+    if tag in (STR, BIG_INT, BYTES):
+        length = LENGTH_STRUCT.unpack_from(data, offset)[0]
+        offset += 4
+        if offset + length > len(data):
+            raise ValueError("Truncated value")
+        raw = bytes(data[offset:offset + length])
+        if tag == BYTES:
+            return raw, offset + length
+        if tag == BIG_INT:
+            return int(raw.decode('utf-8')), offset + length
+        return raw.decode('utf-8'), offset + length
+    if tag == UUID:
+        if offset + 16 > len(data):
+            raise ValueError("Truncated value")
+        return uuid.UUID(bytes=bytes(data[offset:offset + 16])), offset + 16
+    if tag in (TUPLE, LIST):
+        length = LENGTH_STRUCT.unpack_from(data, offset)[0]
+        offset += 4
+        items = []
+        for _ in range(length):
+            item, offset = decode_value(data, offset)
+            items.append(item)
+        return (tuple(items) if tag == TUPLE else items), offset
+    if tag == DICT:
+        length = LENGTH_STRUCT.unpack_from(data, offset)[0]
+        offset += 4
+        document = {}
+        for _ in range(length):
+            key, offset = decode_value(data, offset)
+            document[key], offset = decode_value(data, offset)
+        return document, offset
+    if tag == BOARD:
+        return decode_board(data, offset)
+    raise ValueError(f"Unknown type tag {tag}")
+
+
+def decode_board(data: memoryview, offset: int) -> tuple[Board, int]:
+    """
+    Decode a board that was encoded by encode_board.
+    """
+    rows, columns = BOARD_SIZE_STRUCT.unpack_from(data, offset)
+    offset += BOARD_SIZE_STRUCT.size
+    size = (rows * columns + 7) // 8
+    if offset + size > len(data):
+        raise ValueError("Truncated board")
+    bits = int.from_bytes(data[offset:offset + size], "little")
+    if bits >> (rows * columns):
+        raise ValueError("Board padding isn't 0")
+    return Board(rows, columns, bits), offset + size
+
+
+class RestrictedUnpickler(pickle.Unpickler):
+    """
+    Unpickling can run any code, so documents from the pickle format may only contain plain data and UUIDs.
+    """
+
+    def find_class(self, module: str, name: str) -> object:
+        if module == "uuid" and name == "UUID":
+            return uuid.UUID
+        if module == "builtins" and name in ("set", "frozenset", "complex"):
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed")
+
+
+def encode_document(action: str, document: object, wire_format: str = BINARY) -> bytes:
+    """
+    Turn the action and its data into bytes that can be sent over a socket.
+    """
+    if wire_format == PICKLE:
+        # This turns the python class into bytes that can be sent to the server.
+        pkged_doc = pickle.dumps({"action": action, "data": document})
+        # The header will contain the length of the pkged_doc in bytes.
+        return bytes(f"{len(pkged_doc):<{HEADERSIZE}}", 'utf-8') + pkged_doc
+
+    if action not in ACTION_CODES:
+        raise ValueError(f"Unknown action type {action}")
+    payload = bytearray(BINARY_HEADER.size)
+    encode_value(document, payload)
+    BINARY_HEADER.pack_into(payload, 0, MAGIC, PROTOCOL_VERSION, ACTION_CODES[action],
+                            len(payload) - BINARY_HEADER.size)
+    return bytes(payload)
+
+
+class FrameDecoder():
+    """
+    Turns the bytes read from a connection back into documents.
+
+    TCP doesn't keep the documents apart, a single read can hold half a document or many of them.
+    So every read is added to a buffer and all the complete documents are taken out of it,
+    whatever is left over waits in the buffer for the next read.
+    Every connection needs its own FrameDecoder.
+
+    wire_format = The format the other side uses, None works it out from the first byte that arrives.
+    """
+
+    def __init__(self, wire_format: str | None = None) -> None:
+        self.buffer = bytearray()
+        self.wire_format = wire_format
+
+    def feed(self, data: bytes) -> list[object]:
+        """
+        Add the bytes that were read to the buffer and return every document that is now complete.
+        Raises ValueError if the bytes are not a document, the connection should then be closed.
+        """
+        self.buffer += data
+        if self.wire_format is None:
+            if not self.buffer:
+                return []
+            self.wire_format = BINARY if self.buffer[0] == MAGIC else PICKLE
+
+        docs: list[object] = []
+        offset = 0
+        with memoryview(self.buffer) as view:
+            if self.wire_format == BINARY:
+                offset = self._feed_binary(view, docs)
+            else:
+                offset = self._feed_pickle(view, docs)
+        # Drop the documents that have been read, keep the start of the next one
+        del self.buffer[:offset]
+        return docs
+
+    def _feed_binary(self, view: memoryview, docs: list[object]) -> int:
+        offset = 0
+        while len(view) - offset >= BINARY_HEADER.size:
+            magic, version, action_code, document_length = BINARY_HEADER.unpack_from(view, offset)
+            if magic != MAGIC or version != PROTOCOL_VERSION:
+                raise ValueError(f"Unsupported protocol version {version}")
+            if action_code >= len(ACTIONS) or document_length > MAX_DOCUMENT_SIZE:
+                raise ValueError(f"Invalid frame, action {action_code}, length {document_length}")
+
+            start = offset + BINARY_HEADER.size
+            end = start + document_length
+            if end > len(view):
+                # The rest of this document hasn't arrived yet
+                break
+            try:
+                with view[:end] as frame:
+                    data, data_end = decode_value(frame, start)
+            except (struct.error, IndexError, UnicodeDecodeError) as e:
+                raise ValueError(f"Invalid frame data: {e}")
+            if data_end != end:
+                raise ValueError("Frame length doesn't match its data")
+            docs.append({"action": ACTIONS[action_code], "data": data})
+            offset = end
+        return offset
+
+    def _feed_pickle(self, view: memoryview, docs: list[object]) -> int:
+        offset = 0
+        while len(view) - offset >= HEADERSIZE:
+            # Remove the extra spaces that were added in the HEADERSIZE and cast the string into a integer.
+            document_length = int(bytes(view[offset:offset + HEADERSIZE]).decode('utf-8').strip())
+            if document_length < 0 or document_length > MAX_DOCUMENT_SIZE:
+                raise ValueError(f"Invalid document length {document_length}")
+
+            end = offset + HEADERSIZE + document_length
+            if end > len(view):
+                # The rest of this document hasn't arrived yet
+                break
+            # Turn bytes into a python object.
+            docs.append(RestrictedUnpickler(io.BytesIO(view[offset + HEADERSIZE:end])).load())
+            offset = end
+        return offset
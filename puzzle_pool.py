@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# This keeps boards ready for every board size so a new game never has to wait for one to be made
+
+from collections import deque
+from typing import Callable
+
+from board import Board
+
+import threading  # used to make the boards in the background
+import time  # used to forget how popular a board size was
+
+
+class PuzzlePool():
+    """
+    Boards that are made before anyone needs them, a game takes one in O(1).
+
+    Every board size keeps target boards ready, a size that has been asked for a lot lately keeps up to
+    max_target ready and is refilled first. How much a size is asked for halves every half_life seconds,
+    so the pool follows what people are playing right now.
+    If the pool of a size is empty (or the size isn't one of sizes) the board is made straight away, that is a miss.
+
+    make_board = Called with the height and width to make a new board.
+    sizes = The board sizes to keep boards ready for.
+    workers = How many threads make boards in the background.
+    """
+
+    def __init__(self, make_board: Callable[[int, int], Board], sizes: list[tuple[int, int]],
+                 target: int = 8, max_target: int = 32, workers: int = 1, half_life: float = 60) -> None:
+        self.make_board = make_board
+        self.target = target
+        self.max_target = max(target, max_target)
+        self.half_life = half_life
+
+        self.pools: dict[tuple[int, int], deque[Board]] = {size: deque() for size in sizes}
+        # How many boards of every size the workers are making right now
+        self.filling: dict[tuple[int, int], int] = {size: 0 for size in sizes}
+        # (how many times the size was asked for, when that was worked out)
+        self.demand: dict[tuple[int, int], tuple[float, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.condition = threading.Condition()
+
+        if target > 0:
+            for _ in range(workers):
+                threading.Thread(target=self._refill_loop, daemon=True).start()
+
+    def take(self, height: int, width: int) -> Board:
+        """
+        A new board of the size, the pool doesn't keep it so it can be changed.
+        """
+        size = (height, width)
+        board = None
+        with self.condition:
+            pool = self.pools.get(size)
+            if pool is not None:
+                now = time.monotonic()
+                self.demand[size] = (self._demand(size, now) + 1, now)
+                if pool:
+                    board = pool.popleft()
+                # Wake a worker up to make another one
+                self.condition.notify()
+            if board is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if board is None:
+            board = self.make_board(height, width)
+        return board
+
+    def stats(self) -> dict[str, int | dict[tuple[int, int], int]]:
+        """
+        How many boards were taken from the pool (hits), how many had to be made on the spot (misses)
+        and how many boards of every size are ready.
+        """
+        with self.condition:
+            return {"hits": self.hits, "misses": self.misses,
+                    "ready": {size: len(pool) for size, pool in self.pools.items()}}
+
+    def _demand(self, size: tuple[int, int], now: float) -> float:
+        count, at = self.demand.get(size, (0.0, now))
+        return count * 0.5 ** ((now - at) / self.half_life)
+
+    def size_target(self, size: tuple[int, int], now: float) -> int:
+        """
+        How many boards of the size should be ready, more for a size that is popular.
+        """
+        return min(self.target + int(self._demand(size, now)), self.max_target)
+
+    def _next_size(self) -> tuple[int, int] | None:
+        """
+        The size that is missing the most boards, weighted by how popular it is. Call this with the condition held.
+        """
+        now = time.monotonic()
+        best, best_need = None, 0.0
+        for size, pool in self.pools.items():
+            missing = self.size_target(size, now) - len(pool) - self.filling[size]
+            if missing <= 0:
+                continue
+            need = missing * (1 + self._demand(size, now))
+            if need > best_need:
+                best, best_need = size, need
+        return best
+
+    def _refill_loop(self) -> None:
+        while True:
+            with self.condition:
+                # Sleep until a size is missing some boards
+                size = self.condition.wait_for(self._next_size)
+                self.filling[size] += 1
+            try:
+                board = self.make_board(*size)
+            except Exception as e:
+                print("Could not make a board:", e)
+                board = None
+                # Don't spin if making boards of this size keeps failing
+                time.sleep(1)
+            with self.condition:
+                self.filling[size] -= 1
+                if board is not None:
+                    self.pools[size].append(board)
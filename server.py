@@ -4,360 +4,985 @@
 # This is the server of the project. it will be used to talk to the database and execute SQL
 
 from server_sql_connection import SqlServerConnection
+from auth_pipeline import AuthPipeline
+from matchmaking import Matchmaker, Ticket
+from puzzle_pool import PuzzlePool
+from leaderboard import LeaderboardCache, ScoreTree
+from game_results import DURABILITY_MODES, GameResultWriter
+from board import Board
+from cluster import ClusterLink, run_cluster
+from protocol import BINARY, FrameDecoder, HEADERSIZE, MAX_BOARD_SIZE, MAX_LEADERBOARD_PAGE_SIZE, MIN_BOARD_SIZE, \
+    PICKLE, RECV_SIZE, encode_document
+from solve import eliminations, fewest_presses, memo, new_board, solver_for
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
 from typing import Callable
 
 import socket  # used to run the socket server
 import select  # used to manage cuncurent connections to the server socket
-import pickle  # parser that is used when accept and send any python class
 import _thread  # used to create multiple threads (in my case allow many players to play)
 import uuid  # used to generate a random ID using uuid()
 import os  # used to get random bytes for the salt
-import hashlib  # used to encrypt the password in the database
 import signal  # used to handle keyboard interrupts
 import sys  # used to exit the program
-import random  # used to generate random numbers
+import asyncio  # used to run the asyncio engine of the server
+import threading  # used to know which thread is sending to an asyncio client
+import argparse  # used to read the server options from the command line
+import traceback  # used to report actions of the asyncio engine that failed
+
+
+class StreamClient():
+    """
+    Wraps the asyncio StreamWriter of a connection so it has the same send() as a socket.
+    This lets the actions reply to clients of the asyncio engine without knowing which engine is running.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, max_pending_bytes: int) -> None:
+        self.writer = writer
+        self.max_pending_bytes = max_pending_bytes
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+
+    def send(self, data: bytes) -> int:
+        # StreamWriter is not thread safe, so writes from other threads are handed to the event loop.
+        if threading.get_ident() == self.loop_thread:
+            self._write(data)
+        else:
+            self.loop.call_soon_threadsafe(self._write, data)
+        return len(data)
+
+    def _write(self, data: bytes) -> None:
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        # The transport keeps whatever the client hasn't read yet, a client that stops reading is dropped
+        # instead of letting its buffer grow for ever
+        if transport.get_write_buffer_size() + len(data) > self.max_pending_bytes:
+            print(f"Dropping slow client {self.getpeername()}")
+            transport.abort()
+            return
+        self.writer.write(data)
+
+    def getpeername(self) -> tuple[str, int]:
+        return self.writer.get_extra_info("peername")
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class OutboundQueue():
+    """
+    The bytes waiting to be sent to a client socket of the select engine.
+
+    The client sockets don't block, so a send only writes what fits in the socket's buffer.
+    What doesn't fit waits here and the select loop sends it once the client has read enough,
+    so a thread that is sending to a slow client never waits for it (a game move goes to both players straight away).
+    A client that has more than max_pending_bytes waiting is too slow to keep up and gets dropped.
+
+    on_pending = Called when bytes start waiting, the select loop should then wait for the socket to be writable.
+    on_overflow = Called when the client has too much waiting and should be closed.
+    """
+
+    def __init__(self, client: socket.socket, max_pending_bytes: int, on_pending: Callable[[socket.socket], None],
+                 on_overflow: Callable[[socket.socket], None]) -> None:
+        self.client = client
+        self.max_pending_bytes = max_pending_bytes
+        self.on_pending = on_pending
+        self.on_overflow = on_overflow
+        self.chunks: deque[memoryview] = deque()
+        self.pending_bytes = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def push(self, data: bytes) -> None:
+        """
+        Send the bytes, or queue them behind the bytes that are already waiting.
+        """
+        pending = overflow = False
+        with self.lock:
+            if self.closed:
+                return
+            view = memoryview(data)
+            if not self.chunks:
+                # Nothing is waiting, so the bytes can go straight out
+                try:
+                    view = view[self.client.send(view):]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    # The client has gone, the select loop will notice and close it
+                    self.closed = True
+                    return
+                if not len(view):
+                    return
+                pending = True
+            if self.pending_bytes + len(view) > self.max_pending_bytes:
+                self.closed = True
+                self.chunks.clear()
+                overflow = True
+            else:
+                self.chunks.append(view)
+                self.pending_bytes += len(view)
+
+        if overflow:
+            self.on_overflow(self.client)
+        elif pending:
+            self.on_pending(self.client)
+
+    def flush(self) -> bool:
+        """
+        Send as much of what is waiting as the socket will take.
+        This returns True if there is still something waiting.
+        """
+        with self.lock:
+            while self.chunks:
+                chunk = self.chunks[0]
+                try:
+                    sent = self.client.send(chunk)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    self.closed = True
+                    self.chunks.clear()
+                    self.pending_bytes = 0
+                    break
+                self.pending_bytes -= sent
+                if sent < len(chunk):
+                    self.chunks[0] = chunk[sent:]
+                    break
+                self.chunks.popleft()
+            return bool(self.chunks)
+
+    def take(self) -> bytes:
+        """
+        Stop sending and return everything that is waiting, so another worker can send it.
+        """
+        with self.lock:
+            self.closed = True
+            waiting = b"".join(self.chunks)
+            self.chunks.clear()
+            self.pending_bytes = 0
+            return waiting
 
 
 class SocketServer(socket.socket):
 
-    def __init__(self) -> None:
+    def __init__(self, engine: str = "select", kdf_workers: int | None = None, kdf_queue_limit: int = 64,
+                 reuse_port: bool = False, cluster: ClusterLink | None = None, host: str | None = None,
+                 port: int = 4201, backlog: int = 128, max_connections: int = 1000,
+                 max_pending_bytes: int = 4 * 1024 * 1024, database: str = "application.db",
+                 solver_cache: str | None = None, puzzle_pool: int = 8,
+                 solver_memo_bytes: int = 8 * 1024 * 1024, db_readers: int = 4,
+                 result_flush_interval: float = 0.005, durability: str = "normal", action_threads: int = 16) -> None:
         super().__init__(socket.AF_INET, socket.SOCK_STREAM)
         """
         - socket.AF_INET is saying our socket host's IP is going to be a IPv4 (Internet Protocol version 4)
         - socket.SOCK_STREAM is saying that the port that the socket will be using is a TCP (Transmission Control Protocol)
+        - reuse_port lets the workers of a cluster bind the same port, the kernel shares the connections out between them
+        - cluster is the worker's link to the coordinator (see cluster.py), None when the server runs on its own
+        - host and port are where the server listens, host None is the computer's hostname (internal network),
+          use "" for an external network
+        - backlog is how many new connections can wait to be accepted
+        - max_connections is how many clients can be connected at once, any more are closed straight away
+          (select can't watch sockets past 1024 on most systems)
+        - max_pending_bytes is how much can wait to be sent to a single client before it is dropped as too slow
+        - database is the path of the sqlite database file, it is made if it doesn't exist
+        - solver_cache is a file to keep the worked out press matrix of every board size in, so restarts are faster
+        - puzzle_pool is how many boards of every size are made before they are needed (0 makes every board when
+          its game starts)
+        - solver_memo_bytes is roughly how much memory the solutions of boards that were seen before can use
+        - db_readers is how many connections can read the database at the same time (writes use one of their own)
+        - result_flush_interval is how many seconds the results of a finished game wait for other games to finish,
+          so they can all be written with one commit
+        - durability is how sure a game's result is to be on the disk when the players are told the game ended,
+          see game_results.py
+        - action_threads is how many actions of the asyncio engine can run at the same time,
+          logins and registers look the user up on threads of their own (one per db_readers)
         """
-        # Gets the current host, internal network. replace with ("", PORT) for external network
-        socket_host_data = (socket.gethostname(), 4201)
+        if cluster is not None and engine != "select":
+            raise ValueError("The workers of a cluster use the select engine")
+        # Restarting the server straight away doesn't have to wait for the old connections to time out
+        self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        socket_host_data = (socket.gethostname() if host is None else host, port)
         # Binds the socket server to the current host name and listens to active connections
         self.bind(socket_host_data)
         print(f"Server started on Host: {socket_host_data[0]} , Port: {socket_host_data[1]}")
 
-        # Set max connection to 6
-        self.listen(6)
+        self.backlog = backlog
+        self.listen(backlog)
+        self.max_connections = max_connections
+        self.max_pending_bytes = max_pending_bytes
         self.sockets_list: list[socket.socket] = [self]
-
-        # This SET will keep track of which client/s what is waiting to join a game
-        self.waiting_queue: set[socket.socket] = set()
-        # This will keep track of all on going games
-        self.ongoing_games: dict[uuid.UUID, dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] |
+        # Login and register attempts finish on other threads, they write to this socket to wake up the select loop
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.sockets_list.append(self.wakeup_reader)
+        # Things other threads need the select loop to do, like handing a client off to another worker
+        self.loop_calls: deque[Callable[[], None]] = deque()
+        # Every client has its own buffer of the bytes that have been read but not made into documents yet,
+        # this also knows which wire format the client uses
+        self.decoders: dict[socket.socket | StreamClient, FrameDecoder] = {}
+        # What is waiting to be sent to every client socket of the select engine,
+        # and the sockets that the select loop has to wait to be writable
+        self.outbound: dict[socket.socket, OutboundQueue] = {}
+        self.writers: set[socket.socket] = set()
+        # The address of every client socket of the select engine, saved when it connects because
+        # getpeername() fails once the client has reset the connection
+        self.addresses: dict[socket.socket, tuple[str, int]] = {}
+
+        # This will keep track of all on going games, the games_lock makes sure only one move is made at a time
+        self.games_lock = threading.Lock()
+        self.ongoing_games: dict[uuid.UUID, dict[str, uuid.UUID | list[tuple[str, int, int, int]] | Board |
                                                  int | list[socket.socket] | tuple[str, int, int, int]]] = {}
         # This will store all connected users
         self.clients: dict[socket.socket, tuple[str, int, int, int]] = {}
+        # Makes sure the same user can't be logged in twice when two logins finish at the same time
+        self.clients_lock = threading.Lock()
 
         # Define the size of the length of the header
-        self.HEADERSIZE = 10
+        self.HEADERSIZE = HEADERSIZE
+        # How many seconds there are between telling a waiting client that it is still waiting
+        self.WAITING_INTERVAL = 5
         # Connect to the database
-        self.DB = SqlServerConnection()
+        self.DB = SqlServerConnection(database, db_readers, synchronous="FULL" if durability == "full" else "NORMAL")
+        # The results of finished games are written in batches in the background
+        self.results = GameResultWriter(self.DB, result_flush_interval, durability)
+        # How many players have every score, kept in memory so a player's rank doesn't have to be counted in the database
+        self.scores = ScoreTree(self.DB.score_counts())
+        # How many players above and below a player [GET PLAYER RANK] sends
+        self.RANK_NEIGHBOURS = 2
+        # The best players, changed as games end, so asking for the top of the leaderboard doesn't read the database
+        self.leaderboard = LeaderboardCache(self.DB.leaderboard_page)
+        # Work out the press matrix of the board sizes up to 14x14 before anyone asks for a game, most games use them.
+        # Bigger boards are solved by light chasing, that is worked out the first time a size is asked for
+        board_sizes = [(rows, columns) for rows in range(MIN_BOARD_SIZE, 15) for columns in range(MIN_BOARD_SIZE, 15)]
+        eliminations.warm(board_sizes, solver_cache)
+        # Boards are made in the background so starting a game only has to take one
+        self.puzzles = PuzzlePool(new_board, board_sizes, target=puzzle_pool)
+        # Hints for boards (or turned and flipped boards) that were seen before are looked up instead of worked out
+        memo.max_bytes = solver_memo_bytes
+        # Hashing passwords is slow, so it is done by other processes
+        self.auth_pipeline = AuthPipeline(kdf_workers, kdf_queue_limit)
+        # This will keep track of which client/s what is waiting to join a game and pair them up
+        # In a cluster the players of every worker wait in the coordinator's queue
+        self.cluster = cluster
+        if cluster is not None:
+            self.matchmaker = cluster
+            cluster.attach(self)
+        else:
+            self.matchmaker = Matchmaker(self.create_game, self.send_waiting, self.WAITING_INTERVAL)
 
         # Actions that authenticated users can call
         self.actions: dict[str, Callable[..., object]] = {
             "[JOIN GAME]": self.join_game,
             "[CANCEL GAME]": self.cancel_game,
-            "[TAKE TURN]": self.take_turn,
-            "[GET ALL PLAYER STATS]": self.get_all_player_stats
+            "[MOVE]": self.take_turn,
+            "[TAKE TURN]": self.legacy_take_turn,
+            "[GET HINT]": self.get_hint,
+            "[GET ALL PLAYER STATS]": self.get_all_player_stats,
+            "[GET LEADERBOARD PAGE]": self.get_leaderboard_page,
+            "[GET PLAYER RANK]": self.get_player_rank,
+            "[GET LEADERBOARD]": self.get_leaderboard
         }
 
-        self._action_handler()
+        if engine == "asyncio":
+            # Every connection gets its own reader and writer on the event loop's thread,
+            # the actions read the database so they run on a pool of action_threads threads
+            self.action_threads = ThreadPoolExecutor(action_threads, thread_name_prefix="action")
+            # Logins have a pool of their own, so a lot of players logging in at once can't hold up the games
+            self.login_threads = ThreadPoolExecutor(db_readers, thread_name_prefix="login")
+            self.coroutine_actions: dict[str, Callable[..., object]] = {
+                action_type: self._coroutine_action(action)
+                for action_type, action in self.actions.items()
+            }
+            # Keep a reference to the running action tasks so they don't get garbage collected
+            self.action_tasks: set[asyncio.Task] = set()
+        try:
+            if engine == "asyncio":
+                try:
+                    asyncio.run(self._async_action_handler())
+                finally:
+                    self.action_threads.shutdown(wait=True)
+                    self.login_threads.shutdown(wait=True)
+            else:
+                self._action_handler()
+        finally:
+            puzzles = self.puzzles.stats()
+            print(f"Puzzle pool: {puzzles['hits']} boards were ready, {puzzles['misses']} had to be made on the spot")
+            solutions = memo.stats()
+            print(f"Solution memo: {solutions['hit_rate']:.0%} of {solutions['hits'] + solutions['misses']} lookups "
+                  f"were hits, {solutions['entries']} boards kept")
+            # Stop the hashing processes, a worker of a cluster waits for them before it can exit
+            self.auth_pipeline.shutdown(wait=True)
+            # Write the results that are still waiting before the database is closed
+            self.results.close()
+            results = self.results.stats()
+            print(f"Game results: {results['games']} games were written with {results['commits']} commits")
+            self.DB.close()
 
     def _action_handler(self) -> None:
         while True:
             # Defines our read, write and errored listed sockets
-            read_sockets, _write, error_sockets = select.select(self.sockets_list, [], self.sockets_list)
+            read_sockets, write_sockets, error_sockets = select.select(self.sockets_list, list(self.writers),
+                                                                        self.sockets_list)
 
             # Report any errors
             for error_socket in error_sockets:
-                print(f"Error: {socket.socket(error_socket).getpeername()} has left the server")
+                print(f"Error: {self.addresses.get(error_socket)} has left the server")
+
+            # Send what is waiting to the clients that have read enough to make room for it
+            for user_socket in write_sockets:
+                outbound = self.outbound.get(user_socket)
+                if outbound is None or not outbound.flush():
+                    self.writers.discard(user_socket)
 
             for user_socket in read_sockets:
+                if user_socket == self.wakeup_reader:
+                    # Another thread wants the select loop to do something
+                    self.wakeup_reader.recv(1024)
+                    while self.loop_calls:
+                        self.loop_calls.popleft()()
+                    continue
+
                 if user_socket == self:
                     """
                     These will be the client sockets trying to connect to the server socket.
-                    So in this block i will be authenticating client sockets.
+                    They are read like every other socket, but only login and register documents are accepted
+                    until they have been authenticated.
                     """
                     # Accept connections from server, this is so i can read the package
                     client_socket, client_address = self.accept()
+                    if len(self.decoders) >= self.max_connections:
+                        print(f"Turned away {client_address[0]}:{client_address[1]}, the server is full")
+                        client_socket.close()
+                        continue
                     print(client_socket, client_address)
+                    self._add_socket(client_socket, client_address, FrameDecoder())
+                    continue
 
-                    # Handle the incomming document action
-                    client_action_document = self.recv_doc_manager(client_socket)
+                if user_socket not in self.decoders:
+                    # It was closed or handed off earlier in this loop
+                    continue
 
-                    if client_action_document is False or type(client_action_document) is not dict:
-                        # Disconnection, left the sockect
-                        continue
+                # A single read can hold any number of documents
+                client_action_documents = self.recv_doc_manager(user_socket)
+
+                if client_action_documents is False:
+                    # Disconnection, left the sockect
+                    self.close_client(user_socket)
+                    continue
 
-                    # HANDLE UNAUTHENTICATED USERS
-                    if client_action_document["action"] == '[USER LOGIN]':  # Login attempt
-                        """
-                        Authenticate the user, this should return the user data in the database
-                        if the username and password is correct. 
-                        """
-                        # Get user data from database
-                        data: tuple[str, str] = client_action_document["data"]  # type: ignore
-                        user = self.login_manager(data)
-
-                        if user["result"] is False or type(user["data"]) is not tuple:
-                            # Client failed to authenticate
-                            # user[data] is the error message
-                            client_socket.send(self.pkg_doc_manager("[USER LOGIN - FAIL]", user["data"]))
-                            continue
-
-                        # Login user successful
-                        # user[data] is the users account data
-                        client_socket.send(self.pkg_doc_manager("[USER LOGIN - SUCCESS]", user["data"]))
-                        self.sockets_list.append(client_socket)  # Accept future request from this socket.
-                        self.clients[client_socket] = user["data"]  # keep track of who is logged in.
-                        print(
-                            f'Accepted new connection from {client_address[0]}:{client_address[1]}, action_type: {client_action_document["action"]}, Username: {user["data"][0]}'
-                        )
+                for client_action_document in client_action_documents:
+                    if type(client_action_document) is not dict or type(client_action_document.get("action")) is not str:
                         continue
 
-                    if client_action_document["action"] == '[USER REGISTER]':  # Register attempt
-                        # Register the user in the db
-                        data: tuple[str, str] = client_action_document["data"]  # type: ignore
-                        create_account_status = self.registration_manager(data)
-
-                        if create_account_status["result"] is False:
-                            # Something went wrong whilst creating the user account on the database
-                            client_socket.send(
-                                self.pkg_doc_manager("[USER REGISTER - FAIL]", create_account_status["msg"]))
-                            continue
-
-                        # Tell the client that they have successfully created an account tn the database
-                        client_socket.send(
-                            self.pkg_doc_manager("[USER REGISTER - SUCCESS]", create_account_status["msg"]))
-                        print('Created new account from {}:{}, action_type: {}'.format(
-                            *client_address, client_action_document["action"]))
+                    if user_socket not in self.clients:
+                        # HANDLE UNAUTHENTICATED USERS
+                        self._handle_unauthenticated_document(user_socket, client_action_document)
                         continue
 
-                else:
                     """
                     At this point the connected client socket has already been authenticated
                     """
-                    client_action_document = self.recv_doc_manager(user_socket)
-
-                    if client_action_document is False or client_action_document is None or type(
-                            client_action_document) is bool:
-                        # Disconnection, left the sockect
-                        print(f'Closed connection from User:{self.clients[user_socket][0]}')
-                        self.sockets_list.remove(user_socket)
-                        del self.clients[user_socket]
+                    # Handle any other action being passed to the server
+                    print(f"{client_action_document['action']}: UserName: {self.clients[user_socket][0]}")
+                    action = self.actions.get(client_action_document["action"])
+                    if action is None:
+                        # This happends when the action type sent to the server isnt known
+                        self.send_doc(user_socket, "[ERROR - ACTION]",
+                                      f"Unregistered action type {client_action_document['action']}")
+                        continue
+
+                    # Start a new thread so that the action that is being sent doesn't hault reading other client messages
+                    _thread.start_new_thread(action, (user_socket, client_action_document["data"]))
+
+    def _handle_unauthenticated_document(self, client_socket: socket.socket,
+                                         client_action_document: dict[str, object]) -> None:
+        """
+        Handle a document from a client socket that hasn't been authenticated yet.
+        """
+        client_address = self.addresses[client_socket]
+
+        if client_action_document["action"] == '[USER LOGIN]':  # Login attempt
+            """
+            Authenticate the user, this should return the user data in the database
+            if the username and password is correct. 
+            """
+            # The password is checked by the auth pipeline, the reply is sent once it has finished
+            data: tuple[str, str] = client_action_document["data"]  # type: ignore
+            self.login_manager(data).add_done_callback(
+                lambda login: self._finish_login(client_socket, client_address, login.result()))
+            return
+
+        if client_action_document["action"] == '[USER REGISTER]':  # Register attempt
+            # Register the user in the db once the password has been hashed
+            data: tuple[str, str] = client_action_document["data"]  # type: ignore
+            self.registration_manager(data).add_done_callback(
+                lambda register: self._finish_registration(client_socket, client_address, register.result()))
+            return
+
+    def close_client(self, client_socket: socket.socket) -> None:
+        """
+        Forget about a client socket of the select engine that has disconnected.
+        """
+        # Logins finish and games end on other threads, they change self.clients with the lock held too
+        with self.clients_lock:
+            user_data = self.clients.pop(client_socket, None)
+            if user_data is not None:
+                print(f'Closed connection from User:{user_data[0]}')
+                if self.cluster is not None:
+                    self.cluster.release(user_data[0])
+        self.matchmaker.cancel(client_socket)
+        self.sockets_list.remove(client_socket)
+        del self.decoders[client_socket]
+        del self.addresses[client_socket]
+        self.outbound.pop(client_socket).take()
+        self.writers.discard(client_socket)
+        client_socket.close()
+
+    def _add_socket(self, client_socket: socket.socket, client_address: tuple[str, int],
+                    decoder: FrameDecoder) -> None:
+        """
+        Start reading from and sending to a client socket on the select loop.
+        """
+        client_socket.setblocking(False)
+        self.decoders[client_socket] = decoder
+        self.addresses[client_socket] = client_address
+        self.outbound[client_socket] = OutboundQueue(client_socket, self.max_pending_bytes,
+                                                     self._wait_until_writable, self._drop_slow_client)
+        self.sockets_list.append(client_socket)
+
+    def _wait_until_writable(self, client_socket: socket.socket) -> None:
+        self.call_in_select_loop(lambda: self.writers.add(client_socket)
+                                 if client_socket in self.outbound else None)
+
+    def _drop_slow_client(self, client_socket: socket.socket) -> None:
+        """
+        The client isn't reading what it is sent, close it so it doesn't hold everyone else up.
+        """
+        print(f"Dropping slow client {self.addresses.get(client_socket)}")
+        self.call_in_select_loop(lambda: self.close_client(client_socket)
+                                 if client_socket in self.decoders else None)
+
+    def call_in_select_loop(self, call: Callable[[], None]) -> None:
+        """
+        Run the call on the select loop's thread, between reads.
+        """
+        self.loop_calls.append(call)
+        self.wakeup_writer.send(b"\0")
+
+    def detach_client(self, client_socket: socket.socket) -> dict[str, object] | None:
+        """
+        Stop reading from a client socket without closing it, so it can be handed off to another worker.
+        This returns what the other worker needs to carry on where this one stopped,
+        or None if the client has already gone. Only call this on the select loop's thread.
+        """
+        decoder = self.decoders.pop(client_socket, None)
+        if decoder is None:
+            return None
+        self.sockets_list.remove(client_socket)
+        self.writers.discard(client_socket)
+        with self.clients_lock:
+            user_data = self.clients.pop(client_socket)
+        return {"user_data": user_data, "wire_format": decoder.wire_format, "buffer": bytes(decoder.buffer),
+                "outbound": self.outbound.pop(client_socket).take(), "address": self.addresses.pop(client_socket)}
+
+    def adopt_client(self, client_socket: socket.socket, state: dict[str, object]) -> None:
+        """
+        Start reading from a client socket that another worker has handed off to this one.
+        """
+        decoder = FrameDecoder(state["wire_format"])  # type: ignore
+        decoder.buffer += state["buffer"]  # type: ignore
+        with self.clients_lock:
+            self.clients[client_socket] = state["user_data"]  # type: ignore
+        self.decoders[client_socket] = decoder
+        self.addresses[client_socket] = state["address"]  # type: ignore
+        # Anything sent from now on has to wait behind what the other worker didn't get to send
+        self.outbound[client_socket] = OutboundQueue(client_socket, self.max_pending_bytes,
+                                                     self._wait_until_writable, self._drop_slow_client)
+        client_socket.setblocking(False)
+        if state["outbound"]:
+            self.outbound[client_socket].push(state["outbound"])  # type: ignore
+        self.call_in_select_loop(lambda: self.sockets_list.append(client_socket))
+
+    def _finish_login(self, client_socket: socket.socket, client_address: tuple[str, int],
+                      user: dict[str, bool | str | tuple[str, int, int, int]]) -> None:
+        """
+        Reply to a login attempt of the select engine once the auth pipeline has checked the password.
+        """
+        if user["result"] is False or type(user["data"]) is not tuple:
+            # Client failed to authenticate
+            # user[data] is the error message
+            self.send_doc(client_socket, "[USER LOGIN - FAIL]", user["data"])
+            return
+
+        if not self.add_client(client_socket, user["data"]):
+            self.send_doc(client_socket, "[USER LOGIN - FAIL]", "User is already logged in.")
+            return
+
+        # Login user successful
+        # user[data] is the users account data
+        self.send_doc(client_socket, "[USER LOGIN - SUCCESS]", user["data"])
+        print(
+            f'Accepted new connection from {client_address[0]}:{client_address[1]}, action_type: [USER LOGIN], Username: {user["data"][0]}'
+        )
+
+    def _finish_registration(self, client_socket: socket.socket, client_address: tuple[str, int],
+                             create_account_status: dict[str, bool | str]) -> None:
+        """
+        Reply to a register attempt of the select engine once the account has been created.
+        """
+        if create_account_status["result"] is False:
+            # Something went wrong whilst creating the user account on the database
+            self.send_doc(client_socket, "[USER REGISTER - FAIL]", create_account_status["msg"])
+            return
+
+        # Tell the client that they have successfully created an account tn the database
+        self.send_doc(client_socket, "[USER REGISTER - SUCCESS]", create_account_status["msg"])
+        print('Created new account from {}:{}, action_type: [USER REGISTER]'.format(*client_address))
+
+    def add_client(self, client: socket.socket, user_data: tuple[str, int, int, int]) -> bool:
+        """
+        Keep track of who is logged in, this returns False if the user is already logged in.
+        """
+        with self.clients_lock:
+            if list(filter(lambda x: user_data[0] in x, list(self.clients.values()))):
+                return False
+        # The user could be logged in on another worker of the cluster.
+        # The claim waits for the coordinator's reply, which is read by the thread that also adopts handed off
+        # clients (and that needs clients_lock), so the lock can't be held while waiting
+        if self.cluster is not None and not self.cluster.claim(user_data[0]):
+            return False
+        with self.clients_lock:
+            # Another login of the same user could have finished while the claim was waiting
+            if list(filter(lambda x: user_data[0] in x, list(self.clients.values()))):
+                if self.cluster is not None:
+                    self.cluster.release(user_data[0])
+                return False
+            self.clients[client] = user_data
+            return True
+
+    async def _async_action_handler(self) -> None:
+        """
+        The asyncio engine. The already bound and listening server socket is handed over to asyncio,
+        which then calls _handle_stream_client for every new connection.
+        """
+        self.setblocking(False)
+        # asyncio listens on the socket again, so it needs the backlog too
+        server = await asyncio.start_server(self._handle_stream_client, sock=self, backlog=self.backlog)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_stream_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Read and handle every document a single client sends, until it disconnects.
+        """
+        client = StreamClient(writer, self.max_pending_bytes)
+        client_address = client.getpeername()
+        if len(self.decoders) >= self.max_connections:
+            print(f"Turned away {client_address[0]}:{client_address[1]}, the server is full")
+            client.close()
+            return
+        decoder = FrameDecoder()
+        self.decoders[client] = decoder
+        try:
+            while True:
+                # A single read can hold any number of documents
+                client_action_documents = await self.async_recv_doc_manager(reader, decoder)
+
+                if client_action_documents is False:
+                    # Disconnection, left the sockect
+                    if client in self.clients:
+                        print(f'Closed connection from User:{self.clients[client][0]}')
+                    return
+
+                for client_action_document in client_action_documents:
+                    if type(client_action_document) is not dict or type(client_action_document.get("action")) is not str:
                         continue
 
-                    if type(client_action_document["action"]) is not str:
-                        breakpoint()
+                    if client not in self.clients:
+                        # HANDLE UNAUTHENTICATED USERS
+                        # The password is checked by the auth pipeline whilst the event loop carries on
+                        await self._handle_unauthenticated_stream_document(client, client_address,
+                                                                           client_action_document)
                         continue
 
+                    # At this point the connected client has already been authenticated
                     # Handle any other action being passed to the server
-                    print(f"{client_action_document['action']}: UserName: {self.clients[user_socket][0]}")
-                    action = self.actions[client_action_document["action"]]
-                    if action is False:
+                    print(f"{client_action_document['action']}: UserName: {self.clients[client][0]}")
+                    action = self.coroutine_actions.get(client_action_document["action"])
+                    if action is None:
                         # This happends when the action type sent to the server isnt known
-                        user_socket.send(
-                            self.pkg_doc_manager("[ERROR - ACTION]",
-                                                 f"Unregistered action type {client_action_document['action']}"))
+                        self.send_doc(client, "[ERROR - ACTION]",
+                                      f"Unregistered action type {client_action_document['action']}")
                         continue
 
-                    # Start a new thread so that the action that is being sent doesn't hault reading other client messages
-                    _thread.start_new_thread(action, (user_socket, client_action_document["data"]))
-                    continue
+                    # Run the action as a task so that it doesn't hault reading other messages from this client
+                    task = asyncio.create_task(action(client, client_action_document["data"]))
+                    self.action_tasks.add(task)
+                    task.add_done_callback(self._action_task_done)
+        finally:
+            self.matchmaker.cancel(client)
+            # Logins finish and games end on other threads, they change self.clients with the lock held too
+            with self.clients_lock:
+                self.clients.pop(client, None)
+            self.decoders.pop(client, None)
+            client.close()
+
+    async def _handle_unauthenticated_stream_document(self, client: StreamClient, client_address: tuple[str, int],
+                                                      client_action_document: dict[str, object]) -> None:
+        """
+        Handle a document from an asyncio client that hasn't been authenticated yet.
+        Like the select engine the connection stays open whatever the reply is, so the client can try again.
+        """
+        if client_action_document["action"] == '[USER LOGIN]':  # Login attempt
+            data: tuple[str, str] = client_action_document["data"]  # type: ignore
+            # Looking the user up reads the database, so it is done on another thread
+            loop = asyncio.get_running_loop()
+            user = await asyncio.wrap_future(await loop.run_in_executor(self.login_threads, self.login_manager, data))
+
+            if user["result"] is False or type(user["data"]) is not tuple:
+                # Client failed to authenticate
+                self.send_doc(client, "[USER LOGIN - FAIL]", user["data"])
+                return
+
+            # keep track of who is logged in.
+            if not await loop.run_in_executor(self.login_threads, self.add_client, client, user["data"]):
+                self.send_doc(client, "[USER LOGIN - FAIL]", "User is already logged in.")
+                return
+
+            # Login user successful
+            self.send_doc(client, "[USER LOGIN - SUCCESS]", user["data"])
+            print(
+                f'Accepted new connection from {client_address[0]}:{client_address[1]}, action_type: {client_action_document["action"]}, Username: {user["data"][0]}'
+            )
+            return
+
+        if client_action_document["action"] == '[USER REGISTER]':  # Register attempt
+            data: tuple[str, str] = client_action_document["data"]  # type: ignore
+            create_account_status = await asyncio.wrap_future(
+                await asyncio.get_running_loop().run_in_executor(self.login_threads, self.registration_manager, data))
+
+            if create_account_status["result"] is False:
+                # Something went wrong whilst creating the user account on the database
+                self.send_doc(client, "[USER REGISTER - FAIL]", create_account_status["msg"])
+                return
+
+            # Tell the client that they have successfully created an account tn the database
+            self.send_doc(client, "[USER REGISTER - SUCCESS]", create_account_status["msg"])
+            print('Created new account from {}:{}, action_type: {}'.format(*client_address,
+                                                                         client_action_document["action"]))
+
+    def _action_task_done(self, task: asyncio.Task) -> None:
+        """
+        Forget about a finished action task and report it if it failed, like a failed thread would be.
+        """
+        self.action_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            traceback.print_exception(task.exception())
+
+    def _coroutine_action(self, action: Callable[..., object]) -> Callable[..., object]:
+        """
+        Turn an action into a coroutine for the asyncio engine.
+        Actions read the database and can make boards, so they run on the action threads
+        instead of holding up every other connection on the event loop (StreamClient.send works from any thread).
+        An action that arrives when every action thread is busy waits for one to be free.
+        """
 
-    def recv_doc_manager(
-        self, client_socket: socket.socket
-    ) -> dict[str, str | tuple[str, int, int, int] | list[tuple[str, int, int, int]] |
-              dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] | int | list[socket.socket]] |
-              bool] | None | bool:
+        async def coroutine_action(client: StreamClient, data: object) -> object:
+            return await asyncio.get_running_loop().run_in_executor(self.action_threads, action, client, data)
+
+        return coroutine_action
+
+    async def async_recv_doc_manager(self, reader: asyncio.StreamReader,
+                                     decoder: FrameDecoder) -> list[object] | bool:
+        """
+        The asyncio engine version of recv_doc_manager.
+        It waits for the next read and returns every document that it completed, or False on disconnect.
+        """
         try:
-            # Get the header of the package.
-            message_header = client_socket.recv(self.HEADERSIZE)
+            data = await reader.read(RECV_SIZE)
 
             # This occures if the user disconnects or sends back no data.
-            if not len(message_header):
+            if not len(data):
                 return False
-            # Remove the extra spaces that we added in the HEADERSIZE and cast the tring into a integer.
-            document_length = int(message_header.decode('utf-8').strip())
-            # Get and store the actual action document that was sent to the server.
-            doc = client_socket.recv(document_length)
+            return decoder.feed(data)
+        except:
+            return False
 
-            # Turn bytes into a python object.
-            return pickle.loads(doc)
+    def recv_doc_manager(self, client_socket: socket.socket) -> list[object] | bool:
+        """
+        Read what the client socket has sent and return every document that is now complete.
+        A partial document is kept in the client's FrameDecoder until the rest of it arrives.
+        This returns False if the client disconnected or sent something that isn't a document.
+        """
+        try:
+            data = client_socket.recv(RECV_SIZE)
+
+            # This occures if the user disconnects or sends back no data.
+            if not len(data):
+                return False
+            return self.decoders[client_socket].feed(data)
         except BlockingIOError:
-            return
+            return []
         except:
             return False
 
     def pkg_doc_manager(
-        self, action: str, document: bool | str | tuple[str, int, int, int] | list[tuple[str, int, int, int]] |
+        self,
+        action: str,
+        document: bool | str | tuple[str, int, int, int] | list[tuple[str, int, int, int]] |
         dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] | int | list[socket.socket] |
-             tuple[str, int, int, int]]
+             tuple[str, int, int, int]],
+        wire_format: str = BINARY
     ) -> bytes:
         """
         Format the document that the server wants to send to the client socket to bytes.
-        This will be done by pickling the doc object and adding the heading (length of
-        the object in bytes).
+        See protocol.py for the wire formats.
 
         action  = The action type that is being packaged up.
         document = The data attached to the action.
+        wire_format = The wire format that the client uses.
         """
         # Check if the action and its data are not left empty.
         if not action:
             raise ValueError('You can not send an empty action type')
         if not document:
             raise ValueError('You can not send an empty document')
-        doc = {"action": action, "data": document}
 
-        # This turns the python class into bytes that can be sent to the server.
-        pkged_doc = pickle.dumps(doc)
+        # This can be sent over the socket.
+        return encode_document(action, document, wire_format)
+
+    def send_doc(self, client: socket.socket, action: str, document: object) -> None:
+        """
+        Send the document to the client in the wire format that the client uses.
+        """
+        self.send_bytes(client, self.pkg_doc_manager(action, document, self.wire_format(client)))
 
-        # The header will contain the length of the pkged_doc in bytes.
-        pkged_doc_with_header = bytes(f"{len(pkged_doc):<{self.HEADERSIZE}}", 'utf-8') + pkged_doc
+    def wire_format(self, client: socket.socket) -> str:
+        """
+        The wire format that the client uses.
+        """
+        decoder = self.decoders.get(client)
+        return decoder.wire_format if decoder else BINARY
 
-        # This can be sent over the socket.
-        return pkged_doc_with_header
+    def send_bytes(self, client: socket.socket, data: bytes) -> None:
+        """
+        Send a document that is already packaged for the client's wire format.
+        """
+        if isinstance(client, StreamClient):
+            # Clients of the asyncio engine keep their own buffer
+            client.send(data)
+            return
+        outbound = self.outbound.get(client)
+        # No queue means the client has been closed or handed off to another worker
+        if outbound is not None:
+            outbound.push(data)
 
-    def registration_manager(self, user_credentials: tuple[str, str]) -> dict[str, bool | str]:
+    def registration_manager(self, user_credentials: tuple[str, str]) -> Future[dict[str, bool | str]]:
         """
         Register the username on the database only if the username isnt taken
+        The password is hashed by the auth pipeline, so this returns a future of the result
 
         user_credentials = ("username", "password")
         """
+        create_account_status: Future[dict[str, bool | str]] = Future()
         try:
-            c = self.DB.connection.cursor()
-            c.execute("SELECT username FROM users WHERE username = :username", {"username": user_credentials[0]})
-            user_credentials_from_DB: tuple[str] | None = c.fetchone()
-
             # Checks if there already a player with that username
-            if user_credentials_from_DB is None:
-                # Create new user WITH USERNAME AND PASSWORD because there is no user with the desired username
-
-                # Generate salt and hash the password
-                salt = os.urandom(24)
-                hashed_password = hashlib.pbkdf2_hmac('sha512', user_credentials[1].encode('utf-8'), salt, 100000)
-
-                c.execute("INSERT INTO  users (username, password, salt) VALUES (?, ?, ?)",
-                          (user_credentials[0], hashed_password.hex(), salt.hex()))
-                self.DB.connection.commit()
-                return {"result": True, "msg": "Account was created successfully."}
-            else:
-                return {"result": False, "msg": "Username already exists."}
+            if self.DB.username_taken(user_credentials[0]):
+                create_account_status.set_result({"result": False, "msg": "Username already exists."})
+                return create_account_status
+
+            # Create new user WITH USERNAME AND PASSWORD because there is no user with the desired username
+            # Generate salt and hash the password
+            salt = os.urandom(24)
+            hashing = self.auth_pipeline.hash_password(user_credentials[1], salt)
         except BaseException as e:
             print(e)
-            return {"result": False, "msg": "Error when creating client's account."}
-
-    def login_manager(self, user_credentials: tuple[str, str]) -> dict[str, bool | str | tuple[str, int, int, int]]:
+            create_account_status.set_result({"result": False, "msg": "Error when creating client's account."})
+            return create_account_status
+
+        if hashing is None:
+            create_account_status.set_result({"result": False, "msg": "The server is busy, please try again."})
+            return create_account_status
+
+        def create_account(hashing: Future[str]) -> None:
+            try:
+                self.DB.create_user(user_credentials[0], hashing.result(), salt.hex())
+                # New players start with a score of 0
+                self.player_changed((user_credentials[0], 0, 0, 0), None)
+                create_account_status.set_result({"result": True, "msg": "Account was created successfully."})
+            except BaseException as e:
+                print(e)
+                create_account_status.set_result({"result": False, "msg": "Error when creating client's account."})
+
+        hashing.add_done_callback(create_account)
+        return create_account_status
+
+    def login_manager(self, user_credentials: tuple[str, str]) -> Future[dict[str, bool | str | tuple[str, int, int, int]]]:
         """
         Handle the authentication of the client.
         This function will query the database for the desired username and compare hashed passwords
         if they match, this will return the desired userdata <minus the hashed password>
+        The password is hashed by the auth pipeline, so this returns a future of the result
         """
+        user: Future[dict[str, bool | str | tuple[str, int, int, int]]] = Future()
         try:
-            c = self.DB.connection.cursor()
-            c.execute("SELECT username, password, salt FROM users WHERE username = :username",
-                      {"username": user_credentials[0]})
-            user_credentials_from_DB: tuple[str, str, str] | None = c.fetchone()
+            user_credentials_from_DB: tuple[str, str, str] | None = self.DB.login_details(user_credentials[0])
 
             if user_credentials_from_DB is None:
                 # There is no accounts with the passed in username, return error
-                return {"result": False, "data": f"No user found with the username: {(user_credentials[0])}"}
+                user.set_result({"result": False, "data": f"No user found with the username: {(user_credentials[0])}"})
+                return user
 
             # Check if the user is already logged in
             if list(filter(lambda x: user_credentials[0] in x, list(self.clients.values()))):
-                return {"result": False, "data": "User is already logged in."}
+                user.set_result({"result": False, "data": "User is already logged in."})
+                return user
 
             # Hash the password with the salt from the database
-            hashed_password = hashlib.pbkdf2_hmac('sha512', user_credentials[1].encode('utf-8'),
-                                                  bytes.fromhex(user_credentials_from_DB[2]), 100000)
-            # Check if hashed passwords match
-            if user_credentials_from_DB == (user_credentials[0], hashed_password.hex(), user_credentials_from_DB[2]):
-                c.execute("SELECT username, wins, loses, games_played FROM users WHERE username = ?",
-                          (user_credentials[0],))
-                user_data: tuple[str, int, int, int] = c.fetchone()
-
-                return {"result": True, "data": user_data}  # return user data
-            else:
-                return {"result": False, "data": "Incorrect password"}  # return error
+            hashing = self.auth_pipeline.hash_password(user_credentials[1], bytes.fromhex(user_credentials_from_DB[2]))
         except BaseException as e:
             print(e)
-            return {"result": False, "data": "Error when authenticating client's account."}
+            user.set_result({"result": False, "data": "Error when authenticating client's account."})
+            return user
+
+        if hashing is None:
+            user.set_result({"result": False, "data": "The server is busy, please try again."})
+            return user
+
+        def check_password(hashing: Future[str]) -> None:
+            try:
+                # Check if hashed passwords match
+                if user_credentials_from_DB == (user_credentials[0], hashing.result(), user_credentials_from_DB[2]):
+                    user_data: tuple[str, int, int, int] = self.DB.player(user_credentials[0])
+
+                    user.set_result({"result": True, "data": user_data})  # return user data
+                else:
+                    user.set_result({"result": False, "data": "Incorrect password"})  # return error
+            except BaseException as e:
+                print(e)
+                user.set_result({"result": False, "data": "Error when authenticating client's account."})
+
+        hashing.add_done_callback(check_password)
+        return user
 
     def join_game(self, client: socket.socket, data: tuple[str, tuple[int, int]]) -> None:
         """
-        Adds the client to the waiting_queue
-         if the client is the first one in the queue they will become host
-          - the host will create the game session
-        else they will get told to join a game by the server from the host request
+        Adds the client to the matchmaker's queue
+         if a player with the same board size and a similar score (wins - loses) is waiting the game is started
+          straight away
+        else the client is told where it is in the queue and waits until someone close enough to their skill joins,
+         the longer they wait the bigger the difference in score they will accept
 
         <difficulty>  the server can't send the socket class
         """
         username, board_size = data
-        try:
-            # Add user to game queue - session
-            self.waiting_queue.add(client)
-            host = False
-            while (len(self.waiting_queue) < 2):  # This client is the only player in the game queue
-                host = True  # This make setting up the game easier as one client will be responsible for setting it up
-                if client in self.waiting_queue:  # If the client is still waiting in the for a game lobby
-                    client.send(self.pkg_doc_manager("[JOIN GAME - WAITING]", username))
-                else:
-                    # "Client left the queue"
-                    return
-
-            if host:
-                gameID = uuid.uuid1()
-                Game_Board_Data: dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] | int |
-                                      list[socket.socket]] = {
-                                          'id': gameID,
-                                          'player_data': [],
-                                          'board': [],
-                                          'player_turn': 1,
-                                      }
-                # Create the game board
-                for _ in range(board_size[0]):
-                    Game_Board_Data['board'].append([0] * board_size[1])
-                # Shuffle the board
-                self.shuffle_board(Game_Board_Data['board'])
-                # Get the players
-                players: list[socket.socket] = []
-                for _ in range(2):  # 2 player game
-                    player_clinet = self.waiting_queue.pop()
-                    players.append(player_clinet)
-                    # Let the clinet know that they are getting connected to a game.
-                    # The socket client and their user_data
-                    # If Game_Board_Data['player_data'] is not list[tuple[str, int, int, int]], then continue
-                    Game_Board_Data['player_data'].append(self.clients[player_clinet])  # type: ignore
-                for _, client in enumerate(players):
-                    client.send(self.pkg_doc_manager("[JOIN GAME - SUCCESS]", Game_Board_Data))
-                Game_Board_Data['clients'] = players
-
-                # Add the Game_Board_Data to the ongoing games data record
-                self.ongoing_games[gameID] = Game_Board_Data
+        if not (type(board_size) in (tuple, list) and len(board_size) == 2 and
+                all(type(side) is int and MIN_BOARD_SIZE <= side <= MAX_BOARD_SIZE for side in board_size)):
+            self.send_doc(client, "[JOIN GAME - FAIL]",
+                          f"Boards can have {MIN_BOARD_SIZE} to {MAX_BOARD_SIZE} rows and columns")
             return
-        except:
-            self.waiting_queue.remove(client)
+        _, wins, loses, _ = self.clients[client]
+        self.matchmaker.join(client, username, board_size, wins - loses)
+
+    def send_waiting(self, ticket: Ticket, progress: dict[str, int | float]) -> None:
+        """
+        Tell a waiting client where it is in the queue and how long it should have to wait
+        """
+        self.send_doc(ticket.client, "[JOIN GAME - WAITING]", progress)
+
+    def create_game(self, tickets: list[Ticket]) -> None:
+        """
+        Start a game session between the 2 players that the matchmaker paired up
+        If a player disconnected after they were paired up, the other player goes back in the queue
+        """
+        with self.clients_lock:
+            player_data = [self.clients.get(ticket.client) for ticket in tickets]
+        if None in player_data:
+            for ticket, user_data in zip(tickets, player_data):
+                if user_data is not None:
+                    self.matchmaker.requeue(ticket)
             return
+        board_size = tickets[0].board_size
+        gameID = uuid.uuid1()
+        Game_Board_Data: dict[str, uuid.UUID | list[tuple[str, int, int, int]] | Board | int |
+                              list[socket.socket]] = {
+                                  'id': gameID,
+                                  'player_data': [],
+                                  'board': [],
+                                  'player_turn': 1,
+                                  'seq': 0,
+                              }
+        # Take a shuffled game board from the pool
+        board = self.puzzles.take(board_size[0], board_size[1])
+        Game_Board_Data['board'] = board
+        # Get the players
+        players: list[socket.socket] = []
+        for ticket, user_data in zip(tickets, player_data):  # 2 player game
+            players.append(ticket.client)
+            # Let the clinet know that they are getting connected to a game.
+            # The socket client and their user_data
+            # If Game_Board_Data['player_data'] is not list[tuple[str, int, int, int]], then continue
+            Game_Board_Data['player_data'].append(user_data)  # type: ignore
+        # The clients can't be sent, so they are only added to the server's copy of the game,
+        # hints keeps the fewest presses solution of each player that asked for a hint (see get_hint)
+        game_session = dict(Game_Board_Data, board=board, clients=players, hints={})
+        # Add the game to the ongoing games data record before anyone can make a move in it,
+        # moves wait for the lock so every player gets the game before the first move
+        with self.games_lock:
+            self.ongoing_games[gameID] = game_session
+            for _, client in enumerate(players):
+                # The pickle format can't send a Board, those clients get it as rows of 0s and 1s
+                if self.wire_format(client) == PICKLE:
+                    self.send_doc(client, "[JOIN GAME - SUCCESS]", dict(Game_Board_Data, board=board.to_rows()))
+                else:
+                    self.send_doc(client, "[JOIN GAME - SUCCESS]", Game_Board_Data)
 
     def cancel_game(self, client: socket.socket, username: str) -> None:
         """
         Remove client from waiting queue
         """
-        if client in self.waiting_queue:
-            self.waiting_queue.remove(client)
-            client.send(self.pkg_doc_manager("[CANCEL GAME - SUCCESS]", "Cancelled"))
+        if self.matchmaker.cancel(client):
+            self.send_doc(client, "[CANCEL GAME - SUCCESS]", "Cancelled")
         else:
-            client.send(self.pkg_doc_manager("[CANCEL GAME - FAIL]", "Not waiting for a game"))
+            self.send_doc(client, "[CANCEL GAME - FAIL]", "Not waiting for a game")
         return
 
-    def take_turn(self, client: socket.socket,
-                  data: dict[str, uuid.UUID | list[tuple[str, int, int, int]] | list[list[int]] | int |
-                             list[socket.socket] | tuple[str, int, int, int]]):
+    def take_turn(self, client: socket.socket, data: tuple[uuid.UUID, int, int, int], legacy: bool = False) -> None:
         """
-        - The clinet will pass the game id that they want to updata
-        - Then the server will send both clients the updated board
-
-        <difficulty>  the server can't send the socket class so i have to create a clone of the data that the client sent
+        - The clinet will pass the game id, the cell (row, col) that they want to press and the move's seq number
+        - The server presses the cell on its own board, the client never sends a board
+        - Then the server will send both clients the move, whose turn it is next and the winner if there is one
+
+        seq = The number of moves that have been made in the game including this one, a move with the wrong
+              seq (a double click or a move from an old board) is turned down.
+        legacy = The move came from a [TAKE TURN] (see legacy_take_turn), it is turned down with the game as it is
+                 instead of a [MOVE - FAIL].
         """
-        try:
+        game_id, row, col, seq = data
+        with self.games_lock:
+            game = self.ongoing_games.get(game_id)
+            clients: list[socket.socket] = game["clients"] if game else []  # type: ignore
+            if game is None or client not in clients:
+                self.refuse_move(client, None, "You are not in this game", legacy)
+                return
+            if clients[game["player_turn"] - 1] != client:
+                self.refuse_move(client, game, "It is not your turn", legacy)
+                return
+            board: Board = game["board"]  # type: ignore
+            if type(row) is not int or type(col) is not int or not (0 <= row < board.height and 0 <= col < board.width):
+                self.refuse_move(client, game, "That cell is not on the board", legacy)
+                return
+            if seq != game["seq"] + 1:
+                self.refuse_move(client, game, "That move is out of date", legacy)
+                return
+
             # Update game board
-            self.ongoing_games[data["id"]]["board"] = data["board"]
+            self.switch_cell(board, row, col)
+            game["seq"] = seq
+            self.update_hints(game, row * board.width + col)
             """
             Update player turn
             example: 
@@ -365,186 +990,285 @@ class SocketServer(socket.socket):
                 1 % 2 = 1, + 1 = 2 turn
                 2 % 2 = 0, + 1 = 1 turn 
             """
-            data["player_turn"] = (data["player_turn"] % 2) + 1
-            self.ongoing_games[data["id"]]["player_turn"] = data["player_turn"]
+            game["player_turn"] = (game["player_turn"] % 2) + 1
 
             # Check if any players won
-            is_winner = self.check_if_winner(self.ongoing_games[data["id"]]["board"])  # type: ignore
-
+            is_winner = self.check_if_winner(board)
             if is_winner != 0:
-                # Notifiy players that the game has a winner
-                data["winner"] = is_winner
-                # Go through all players in the current game
-                clients: list[socket.socket] = self.ongoing_games[data["id"]]["clients"]  # type: ignore
-                for i, client in enumerate(clients):
-                    # Update database
-                    if i + 1 == data["winner"]:
-                        # This client won the game
-                        self.update_user_data_after_game(client, True)
-                    else:
-                        # This client lost or drew
-                        self.update_user_data_after_game(client)
-                    data["updated_user_data"] = self.clients[client]
-                    client.send(self.pkg_doc_manager("[GAME - END]", data))
-
                 # Close game session
-                del self.ongoing_games[data["id"]]
+                del self.ongoing_games[game_id]
+
+            # Only the move is sent, both clients press the same cell on their copy of the board
+            move: dict[str, uuid.UUID | int | tuple[str, int, int, int]] = {
+                'id': game_id,
+                'row': row,
+                'col': col,
+                'seq': seq,
+                'player_turn': game["player_turn"],
+                'winner': is_winner,
+            }
+            # Clients that use the pickle format may be from before moves, they get the whole game like they used to
+            full_game = None
+            if any(self.wire_format(player) == PICKLE for player in clients):
+                full_game = self.legacy_game_data(game, move)
+
+            if is_winner == 0:
+                # The move is sent with the lock held, otherwise the next move (made on another thread as soon as
+                # a player sees this one) could reach the other player first. Sending never waits for the client
+                for client in clients:
+                    if full_game is not None and self.wire_format(client) == PICKLE:
+                        self.send_doc(client, "[GAME - TURN]", full_game)
+                    else:
+                        self.send_doc(client, "[GAME - MOVE]", move)
                 return
 
-            clients: list[socket.socket] = self.ongoing_games[data["id"]]["clients"]  # type: ignore
-            for client in clients:
-                client.send(self.pkg_doc_manager("[GAME - TURN]", data))
+        # Notifiy players that the game has a winner once the result is written
+        self.update_user_data_after_game(clients, game["player_data"], is_winner, move, full_game)
+
+    def legacy_take_turn(self, client: socket.socket, data: dict[str, object]) -> None:
+        """
+        Clients from before moves send [TAKE TURN] with their whole game data, the board with their press on it.
+        The board is only used to work out which cell was pressed, then it is a normal move.
+        """
+        try:
+            game_id, rows, seq = data["id"], data["board"], data["seq"] + 1  # type: ignore
+            pressed = Board.from_rows(rows)  # type: ignore
+        except (KeyError, TypeError, IndexError, ValueError):
+            self.refuse_move(client, None, "That is not a move", True)
             return
-        except:
-            # Close game session
-            if type(data["id"]) is uuid.UUID:
-                del self.ongoing_games[data["id"]]
-            raise
+        with self.games_lock:
+            game = self.ongoing_games.get(game_id)
+            board: Board | None = game["board"] if game else None  # type: ignore
+            cell = None
+            if board is not None and (pressed.height, pressed.width) == (board.height, board.width):
+                cell = self.pressed_cell(board, pressed)
+            if cell is None:
+                self.refuse_move(client, game, "That is not a move", True)
+                return
+        self.take_turn(client, (game_id, cell[0], cell[1], seq), legacy=True)
 
-    def check_if_winner(self, board: list[list[int]]) -> int:
+    def pressed_cell(self, before: Board, after: Board) -> tuple[int, int] | None:
         """
-        checks if there is a winning state
+        The (row, col) that was pressed to turn the before board into the after board, None if one press can't.
         """
+        changed = before.bits ^ after.bits
+        if not changed:
+            return None
+        # The first cell that changed is the pressed cell, the one above it or the one left of it
+        first = (changed & -changed).bit_length() - 1
+        for cell in (first, first + 1, first + before.width):
+            if cell >= before.cells:
+                continue
+            row, col = divmod(cell, before.width)
+            board = before.copy()
+            board.press(row, col)
+            if board.bits == after.bits:
+                return row, col
+        return None
+
+    def legacy_game_data(self, game: dict, move: dict[str, uuid.UUID | int | tuple[str, int, int, int]] | None = None
+                         ) -> dict[str, object]:
+        """
+        The game data that was sent before moves, with the whole board. Call this with the games_lock held.
+        """
+        return dict(move or {}, id=game["id"], player_data=game["player_data"], board=game["board"].to_rows(),
+                    player_turn=game["player_turn"], seq=game["seq"])
 
-        if all(all(item % 2 == 0 for item in items) for items in board):
-            return 1
-        elif all(all(item % 2 == 1 for item in items) for items in board):
-            return 2
-        else:
-            return 0  # no end state (the game is still playable - ongoing)
-
-    def init_coeff_matrix(self, x: int, y: int) -> list[list[int]]:
-        matrix = [[0 for _ in range(x * y + 1)] for _ in range(x * y)]
-        for i in range(x):
-            for j in range(y):
-                k = i * y + j
-                matrix[k][k] = 1
-                if i > 0:
-                    matrix[(i - 1) * y + j][k] = 1
-                if i < x - 1:
-                    matrix[(i + 1) * y + j][k] = 1
-                if j > 0:
-                    matrix[i * y + j - 1][k] = 1
-                if j < y - 1:
-                    matrix[i * y + j + 1][k] = 1
-        return matrix
-
-    def solve(self, matrix: list[list[int]]) -> list[list[list[int]]]:
-        cells = len(matrix) * len(matrix[0])
-        coeff_rank, matrix_rank = 0, 0
-        coeff_matrix = self.init_coeff_matrix(len(matrix), len(matrix[0]))
-        # Add our problem to coefficient matrix
-        for i in range(len(matrix)):
-            for j in range(len(matrix[i])):
-                coeff_matrix[i * len(matrix[i]) + j][cells] = matrix[i][j] & 1  # Convert to binary
-
-        # Conversion of augmented matrix to ladder matrix
-        for i, y in zip(range(cells), range(cells)):
-            x = i
-            for j in range(i + 1, cells):
-                if coeff_matrix[j][i] > coeff_matrix[x][i]:
-                    x = j
-            if x - i:  # Exchange matrix row data
-                for k in range(y, cells + 1):
-                    coeff_matrix[i][k] ^= coeff_matrix[x][k]
-                    coeff_matrix[x][k] ^= coeff_matrix[i][k]
-                    coeff_matrix[i][k] ^= coeff_matrix[x][k]
-            if coeff_matrix[i][y] == 0:
-                i -= 1
+    def refuse_move(self, client: socket.socket, game: dict | None, reason: str, legacy: bool) -> None:
+        """
+        Turn a move down. Clients from before moves don't know [MOVE - FAIL], they are sent the game as it is
+        instead so their board is put back. Call this with the games_lock held.
+        """
+        if not legacy:
+            self.send_doc(client, "[MOVE - FAIL]", reason)
+        elif game is not None:
+            self.send_doc(client, "[GAME - TURN]", self.legacy_game_data(game))
+
+    def get_hint(self, client: socket.socket, game_id: uuid.UUID) -> None:
+        """
+        Tell the player a cell to press next, it is from the way to win the board that needs the fewest presses
+        (player 1 wins when every cell is even, player 2 when every cell is odd).
+        The solution is kept with the game so asking again is nearly free, take_turn keeps it up to date.
+        """
+        with self.games_lock:
+            game = self.ongoing_games.get(game_id)
+            clients: list[socket.socket] = game["clients"] if game else []  # type: ignore
+            if game is None or client not in clients:
+                self.send_doc(client, "[GET HINT - FAIL]", "You are not in this game")
+                return
+            player = clients.index(client) + 1
+            board: Board = game["board"]  # type: ignore
+            hints: dict[int, int | None] = game["hints"]  # type: ignore
+            if player not in hints:
+                hints[player] = fewest_presses(board, odd=player == 2)
+            presses = hints[player]
+            width = board.width
+
+        if presses is None:
+            self.send_doc(client, "[GET HINT - FAIL]", "There is no way for you to win this board")
+            return
+        # The first cell of the solution
+        row, col = divmod((presses & -presses).bit_length() - 1, width)
+        self.send_doc(client, "[GET HINT - SUCCESS]", {'row': row, 'col': col, 'presses': presses.bit_count()})
+
+    def update_hints(self, game: dict, cell: int) -> None:
+        """
+        Update the kept hints of a game after a cell was pressed. Call this with the games_lock held.
+
+        Pressing a cell XORs it into every solution. If the cell was in the fewest presses solution,
+        that solution without it is still the one with the fewest presses. If it wasn't, another solution
+        could be shorter now, so the hint is worked out again the next time it's asked for.
+        """
+        board: Board = game["board"]
+        hints: dict[int, int | None] = game["hints"]
+        unique = not solver_for(board.height, board.width).null_basis
+        for player, presses in list(hints.items()):
+            if presses is None:
+                # Pressing a cell doesn't change whether the board can be won
                 continue
-            # Elimination
-            for j in range(i + 1, cells):
-                if coeff_matrix[j][y]:
-                    for k in range(y, cells + 1):
-                        coeff_matrix[j][k] ^= coeff_matrix[i][k]
-
-        # Computation of Rank of Coefficient Matrix and Rank of Extended Matrix
-        solution = []
-        for i in range(cells):
-            rank1, rank2 = 0, 0
-            for j in range(cells + 1):
-                if j < cells:
-                    rank1 |= coeff_matrix[i][j]
-                rank2 |= coeff_matrix[i][j]
-            coeff_rank += rank1
-            matrix_rank += rank2
-
-        # Enumeration and Replacement Solution
-        if coeff_rank >= matrix_rank:
-            temp = [0 for _ in range(cells)]
-            for i in range(1 << (cells - coeff_rank), 0, -1):
-                for j in range(cells - 1, coeff_rank, -1):
-                    coeff_matrix[j - 1][cells] += coeff_matrix[j][cells] >> 1
-                    coeff_matrix[j][cells] &= 1
-                for j in range(cells):
-                    temp[j] = coeff_matrix[j][cells]
-                for j in range(cells - 1, -1, -1):
-                    for k in range(j - 1, -1, -1):
-                        if coeff_matrix[k][j]:
-                            temp[k] ^= temp[j]
-
-                temp2d = [[0 for _ in range(len(matrix[0]))] for _ in range(len(matrix))]
-                for j in range(len(temp2d)):
-                    for k in range(len(temp2d[j])):
-                        temp2d[j][k] = temp[j * len(temp2d[j]) + k]
-                solution.append(temp2d)
-                coeff_matrix[cells - 1][cells] += 1
-        return solution
-
-    def shuffle_board(self, board: list[list[int]]) -> list[list[int]]:
-        # Randomize game board
-        for row in board:
-            for i in range(len(row)):
-                row[i] = random.randint(1, 2)
-        # Check if the board is solvable
-        solutions = self.solve(board)
-        if len(solutions) == 0:
-            return self.shuffle_board(board)
-        elif all(all(item % 2 == 0 for item in items) for items in board):
-            return self.shuffle_board(board)
-        elif all(all(item % 2 == 1 for item in items) for items in board):
-            return self.shuffle_board(board)
+            if presses >> cell & 1 or unique:
+                hints[player] = presses ^ (1 << cell)
+            else:
+                del hints[player]
+
+    def switch_cell(self, board: Board, x: int, y: int) -> Board:
+        """
+        Press the cell, this switches the cell and the cells above, below, left and right of it
+        """
+        board.press(x, y)
         return board
 
-    def update_user_data_after_game(self, client: socket.socket, won: bool = False) -> None:
+    def check_if_winner(self, board: Board) -> int:
+        """
+        checks if there is a winning state, the board keeps count of its odd cells so this doesn't look at them
+        """
+        return board.winner  # 0 is no end state (the game is still playable - ongoing)
+
+    def update_user_data_after_game(self, clients: list[socket.socket], players: list[tuple[str, int, int, int]],
+                                    winner: int, move: dict[str, uuid.UUID | int | tuple[str, int, int, int]],
+                                    full_game: dict[str, object] | None = None) -> None:
+        """
+        Update the players data on the server and the database after a game, then send them the last move
+        with their new stats in a [GAME - END]. Clients that use the pickle format get the full_game instead
+        (see take_turn).
+        players = The players' user data from when the game started, they may have disconnected since.
+        Both players' results are written together by the result writer, this doesn't wait for it,
+        the players are told when their results are written (straight away with "async" durability).
         """
-        Update the players data on the server and the database after a game 
+        results = [(player, i + 1 == winner) for i, player in enumerate(players)]
+
+        def game_recorded(written: Future[list[tuple[str, int, int, int] | None]]) -> None:
+            try:
+                updated_players = written.result()
+            except BaseException:
+                updated_players = [None] * len(players)
+            for client, old_player, player, (_, won) in zip(clients, players, updated_players, results):
+                if player is None:
+                    # The result wasn't written (or the player isn't in the database any more),
+                    # the game is still over and the player keeps the stats they had
+                    player = old_player
+                else:
+                    print(player[0], "won" if won else "lost")
+                    # Update client's data on the server, unless they have disconnected
+                    with self.clients_lock:
+                        if client in self.clients:
+                            self.clients[client] = player
+                    # A win is one more point and a loss one less
+                    score = player[1] - player[2]
+                    self.player_changed(player, score - 1 if won else score + 1)
+                end = full_game if full_game is not None and self.wire_format(client) == PICKLE else move
+                self.send_doc(client, "[GAME - END]", dict(end, updated_user_data=player))
+
+        self.results.submit(results).add_done_callback(game_recorded)
+
+    def player_changed(self, player: tuple[str, int, int, int], old_score: int | None) -> None:
+        """
+        Move a player to their new place in the ranks and the leaderboard, old_score is None for a new player.
+        The other workers of a cluster are told as well, they keep their own.
+        """
+        self.scores.move(old_score, player[1] - player[2])
+        self.leaderboard.update(player)
+        if self.cluster is not None:
+            self.cluster.player_changed(player, old_score)
+
+    def get_all_player_stats(self, client: socket.socket, username: str) -> None:
+        """
+        Query the database for all users statistics and return them in an array
         """
         try:
-            c = self.DB.connection.cursor()
-            if won:
-                c.execute("UPDATE users SET wins = wins+1, games_played=games_played+1 WHERE username = :username",
-                          {"username": self.clients[client][0]})
-                self.DB.connection.commit()
-                print(self.clients[client][0], "won")
-            else:
-                c.execute("UPDATE users SET loses=loses+1, games_played=games_played+1 WHERE username = :username",
-                          {"username": self.clients[client][0]})
-                self.DB.connection.commit()
-                print(self.clients[client][0], "lost")
+            user_credentials_from_DB: list[tuple[str, int, int, int]] = self.DB.all_players()
 
-            c.execute("SELECT username, wins, loses, games_played FROM users WHERE username = ?",
-                      (self.clients[client][0],))
-            user_credentials_from_DB: tuple[str, int, int, int] = c.fetchone()
+            self.send_doc(client, "[GET ALL PLAYER STATS - SUCCESS]", user_credentials_from_DB)
+        except:
+            self.send_doc(client, "[GET ALL PLAYER STATS - FAIL]", "Error whilst getting all player statistics")
 
-            # Update client's data on the server
-            self.clients[client] = user_credentials_from_DB
+    def get_leaderboard_page(self, client: socket.socket, data: tuple[tuple[int, str] | None, int]) -> None:
+        """
+        Send one page of the leaderboard, best score (wins - loses) first.
+        - data is (after, limit), after is the "next" of the page before (None for the first page)
+          and limit is how many players the page should have
+        - The reply has the players of the page as (username, wins, loses, games_played) and "next",
+          where the page after this one starts (None if this is the last page)
+        Only the page is read from the database and sent, however many players there are.
+        """
+        try:
+            after, limit = data
+            if type(limit) is not int or not 0 < limit <= MAX_LEADERBOARD_PAGE_SIZE:
+                self.send_doc(client, "[GET LEADERBOARD PAGE - FAIL]",
+                              f"A page can have 1 to {MAX_LEADERBOARD_PAGE_SIZE} players")
+                return
+            if after is not None:
+                score, username = after
+                if type(score) is not int or type(username) is not str:
+                    raise ValueError("after is not a (score, username) pair")
+                after = (score, username)
+            # The first page is the one asked for the most, it is kept in memory
+            page = self.leaderboard.first_page(limit) if after is None else None
+            players, next_page = page if page is not None else self.DB.leaderboard_page(after, limit)
+            self.send_doc(client, "[GET LEADERBOARD PAGE - SUCCESS]", {"players": players, "next": next_page})
         except:
-            raise
+            self.send_doc(client, "[GET LEADERBOARD PAGE - FAIL]", "Error whilst getting the leaderboard")
 
-    def get_all_player_stats(self, client: socket.socket, username: str) -> None:
+    def get_player_rank(self, client: socket.socket, username: str) -> None:
         """
-        Query the database for all users statistics and return them in an array
+        Send a player's rank and score and the players right above and below them on the leaderboard.
+        - The reply has "rank" (players with the same score share a rank), "score", "players"
+          as (username, wins, loses, games_played) in leaderboard order and "position", where the player is in "players"
+        The rank comes from the in memory score counts and the players from the score index,
+        so this doesn't get slower with more players.
         """
         try:
-            c = self.DB.connection.cursor()
-            c.execute("SELECT username, wins, loses, games_played FROM users")
-            user_credentials_from_DB: list[tuple[str, int, int, int]] = c.fetchall()
+            if type(username) is not str:
+                raise ValueError("The username is not a string")
+            player, above, below = self.DB.player_and_neighbours(username, self.RANK_NEIGHBOURS)
+            if player is None:
+                self.send_doc(client, "[GET PLAYER RANK - FAIL]", f"Could not find {username}")
+                return
+            score = player[4]
+            self.send_doc(client, "[GET PLAYER RANK - SUCCESS]", {
+                "rank": self.scores.rank(score),
+                "score": score,
+                "players": above + [player[:4]] + below,
+                "position": len(above),
+            })
+        except:
+            self.send_doc(client, "[GET PLAYER RANK - FAIL]", "Error whilst getting the player's rank")
 
-            client.send(self.pkg_doc_manager("[GET ALL PLAYER STATS - SUCCESS]", user_credentials_from_DB))
+    def get_leaderboard(self, client: socket.socket, data: dict[str, str | None]) -> None:
+        """
+        Send the best players of the leaderboard, data has the "version" of the last reply the client got (or None).
+        - "[GET LEADERBOARD - NOT MODIFIED]" if nothing changed since then
+        - "[GET LEADERBOARD - CHANGES]" with the players that changed and the usernames that were "removed"
+        - "[GET LEADERBOARD - SUCCESS]" with all of them
+        The replies come from memory already packaged, so asking again between games costs next to nothing.
+        """
+        try:
+            version = data["version"]
+            if version is not None and type(version) is not str:
+                raise ValueError("The version is not a string")
+            self.send_bytes(client, self.leaderboard.reply(version, self.wire_format(client)))
         except:
-            client.send(
-                self.pkg_doc_manager("[GET ALL PLAYER STATS - FAIL]", "Error whilst getting all player statistics"))
+            self.send_doc(client, "[GET LEADERBOARD - FAIL]", "Error whilst getting the leaderboard")
 
 
 def signal_handler(sig, frame):
@@ -556,5 +1280,68 @@ def signal_handler(sig, frame):
 
 
 if __name__ == "__main__":  # Only run this code if this python file is the root file execution
+    parser = argparse.ArgumentParser(description="Lights Out socket server")
+    parser.add_argument("--engine", choices=["select", "asyncio"], default="select",
+                        help="select: one thread per message, asyncio: one event loop for every connection")
+    parser.add_argument("--action-threads", type=int, default=16,
+                        help="how many actions can run at the same time with the asyncio engine (default: 16)")
+    parser.add_argument("--kdf-workers", type=int, default=None,
+                        help="number of processes that hash passwords (default: one per core)")
+    parser.add_argument("--kdf-queue-limit", type=int, default=64,
+                        help="how many logins can wait for a free hashing process before they are turned away")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of server processes that share the port (select engine only)")
+    parser.add_argument("--host", default=None,
+                        help="address to listen on (default: this computer's hostname, use \"\" for every address)")
+    parser.add_argument("--port", type=int, default=4201, help="port to listen on")
+    parser.add_argument("--backlog", type=int, default=128,
+                        help="how many new connections can wait to be accepted")
+    parser.add_argument("--max-connections", type=int, default=1000,
+                        help="how many clients can be connected at once (per worker)")
+    parser.add_argument("--max-pending-bytes", type=int, default=4 * 1024 * 1024,
+                        help="how much can wait to be sent to a client before it is dropped for being too slow")
+    parser.add_argument("--db", default="application.db",
+                        help="sqlite database file to use, it is made if it doesn't exist (default: application.db)")
+    parser.add_argument("--db-readers", type=int, default=4,
+                        help="how many connections can read the database at the same time (per worker)")
+    parser.add_argument("--result-flush-ms", type=float, default=5,
+                        help="how long the result of a finished game waits for other games, they are written together")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="normal",
+                        help="full: sync every commit, normal: sync the WAL now and then, "
+                             "async: end games before their results are written (default: normal)")
+    parser.add_argument("--solver-cache", default=None,
+                        help="file to save the solver's work for every board size in, so restarts are faster")
+    parser.add_argument("--puzzle-pool", type=int, default=8,
+                        help="how many boards of every size to make before they are needed (0 to make them when a game starts)")
+    parser.add_argument("--solver-memo-mb", type=float, default=8,
+                        help="how many MB the solutions of boards that were seen before can use")
+    args = parser.parse_args()
+    if args.workers > 1 and args.engine != "select":
+        parser.error("--workers only works with the select engine")
+
+    server_options = {
+        "engine": args.engine,
+        "kdf_workers": args.kdf_workers,
+        "kdf_queue_limit": args.kdf_queue_limit,
+        "host": args.host,
+        "port": args.port,
+        "backlog": args.backlog,
+        "max_connections": args.max_connections,
+        "max_pending_bytes": args.max_pending_bytes,
+        "database": args.db,
+        "db_readers": args.db_readers,
+        "result_flush_interval": args.result_flush_ms / 1000,
+        "durability": args.durability,
+        "solver_cache": args.solver_cache,
+        "puzzle_pool": args.puzzle_pool,
+        "solver_memo_bytes": int(args.solver_memo_mb * 1024 * 1024),
+        "action_threads": args.action_threads,
+    }
+    if args.workers > 1:
+        # The supervisor forks the workers and keeps the logged in users and the matchmaking queue for all of them
+        run_cluster(args.workers, **server_options)
+        sys.exit(0)
+
     signal.signal(signal.SIGINT, signal_handler)
-    server = SocketServer()
+    signal.signal(signal.SIGTERM, signal_handler)
+    server = SocketServer(**server_options)
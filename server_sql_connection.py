@@ -1,9 +1,13 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-# This is just making a connection to the database and setting it up
+# Everything the server reads from and writes to the database goes through here
 
 import sqlite3  # used to talk to the SQL database
+import threading  # used to let one thread write at a time
+import queue  # used to share the read connections between threads
+from contextlib import contextmanager  # used to hand out connections with "with"
+from typing import Iterator
 
 # `users` table schema:
 # username: max 32 characters, unique, string
@@ -12,41 +16,256 @@ import sqlite3  # used to talk to the SQL database
 # wins: unsigned int, default 0
 # loses: unsigned int, default 0
 # games_played: unsigned int, default 0
+# score: wins - loses, worked out by sqlite (a generated column) and indexed so the leaderboard can be read a page at a time
+
+# The queries are always sent with exactly the same text, so every connection only compiles each of them once and
+# keeps the prepared statement in its statement cache (sqlite3's cached_statements) for the next time
+SELECT_USERNAME = "SELECT username FROM users WHERE username = ?"
+SELECT_LOGIN = "SELECT username, password, salt FROM users WHERE username = ?"
+SELECT_PLAYER = "SELECT username, wins, loses, games_played FROM users WHERE username = ?"
+SELECT_ALL_PLAYERS = "SELECT username, wins, loses, games_played FROM users"
+INSERT_USER = "INSERT INTO users (username, password, salt) VALUES (?, ?, ?)"
+UPDATE_WIN = "UPDATE users SET wins = wins + 1, games_played = games_played + 1 WHERE username = ?"
+UPDATE_LOSS = "UPDATE users SET loses = loses + 1, games_played = games_played + 1 WHERE username = ?"
+# sqlite 3.35 and later can send the changed row back from the UPDATE, so it doesn't have to be read again
+RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+RETURNING_PLAYER = " RETURNING username, wins, loses, games_played"
+SELECT_FIRST_PAGE = ("SELECT username, wins, loses, games_played, score FROM users "
+                     "ORDER BY score DESC, username LIMIT ?")
+SELECT_SAME_SCORE_BELOW = ("SELECT username, wins, loses, games_played, score FROM users "
+                           "WHERE score = ? AND username > ? ORDER BY username LIMIT ?")
+SELECT_LOWER_SCORES = ("SELECT username, wins, loses, games_played, score FROM users "
+                       "WHERE score < ? ORDER BY score DESC, username LIMIT ?")
+SELECT_SAME_SCORE_ABOVE = ("SELECT username, wins, loses, games_played FROM users "
+                           "WHERE score = ? AND username < ? ORDER BY username DESC LIMIT ?")
+SELECT_HIGHER_SCORES = ("SELECT username, wins, loses, games_played FROM users "
+                        "WHERE score > ? ORDER BY score, username DESC LIMIT ?")
+SELECT_SCORE_COUNTS = "SELECT score, COUNT(*) FROM users GROUP BY score"
+SELECT_PLAYER_WITH_SCORE = "SELECT username, wins, loses, games_played, score FROM users WHERE username = ?"
+
+# Set on every connection
+PRAGMAS = [
+    # With WAL a commit only appends to the -wal file, readers don't block the writer and the writer doesn't block readers
+    "PRAGMA journal_mode = WAL",
+    # Up to 16MB of pages are kept in memory per connection (negative means KB)
+    "PRAGMA cache_size = -16384",
+    "PRAGMA temp_store = MEMORY",
+]
 
 
 class SqlServerConnection():
+    """
+    The database of the server, safe to use from any thread.
+    - Reads use one of a few read connections, so reads from different threads run at the same time
+    - Writes go through one write connection, one at a time, and are committed when the "with" block ends
+
+    database_credential = The path of the sqlite database file, it is made if it doesn't exist.
+    readers = How many read connections there can be at most.
+    busy_timeout = How many milliseconds to wait for another process (a worker of a cluster) that is writing.
+    synchronous = "NORMAL" only syncs the WAL to the disk when it is copied back into the database, a power cut can
+                  lose the last commits but never corrupts the database. "FULL" syncs every commit.
+    """
 
-    def __init__(self, database_credential: str = "application.db") -> None:
-        # Connect with the database
-        # check_same_thread needs to be false because it will be running on different threads.
-        # Production
-        self.connection = sqlite3.connect(database_credential, check_same_thread=False)
-        # Testing
-        # self.connection = sqlite3.connect(":memory:")
+    def __init__(self, database_credential: str = "application.db", readers: int = 4,
+                 busy_timeout: int = 5000, synchronous: str = "NORMAL") -> None:
+        if synchronous not in ("NORMAL", "FULL"):
+            raise ValueError(f"synchronous can't be {synchronous}")
+        self.database_credential = database_credential
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        # check_same_thread needs to be false because the connections are used by different threads (one at a time)
+        self.connection = self._connect()
+        self.write_lock = threading.RLock()
+        # Every connection to :memory: is a database of its own, so everything has to use the write connection
+        self.in_memory = database_credential == ":memory:"
+        self.readers = 0 if self.in_memory else readers
+        # The read connections that aren't being used, more are made when they are all busy up to self.readers
+        self.idle_readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self.reader_count = 0
+        self.reader_lock = threading.Lock()
         # Drop DB
         # self.drop_db()
         # Init DB
         self.setup_db()
 
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.database_credential, check_same_thread=False, cached_statements=64)
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    @contextmanager
+    def writing(self) -> Iterator[sqlite3.Connection]:
+        """
+        with db.writing() as c: ... gets the write connection to itself, what was written is committed at the end
+        of the block or rolled back if something was raised.
+        """
+        with self.write_lock:
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    @contextmanager
+    def reading(self) -> Iterator[sqlite3.Connection]:
+        """
+        with db.reading() as c: ... gets a read connection to itself for the block.
+        """
+        if not self.readers:
+            with self.write_lock:
+                yield self.connection
+            return
+        try:
+            connection = self.idle_readers.get_nowait()
+        except queue.Empty:
+            with self.reader_lock:
+                make_one = self.reader_count < self.readers
+                if make_one:
+                    self.reader_count += 1
+            # Every read connection is busy and there can't be any more, wait for one
+            connection = self._connect() if make_one else self.idle_readers.get()
+        try:
+            yield connection
+        finally:
+            self.idle_readers.put(connection)
+
+    def close(self) -> None:
+        with self.reader_lock:
+            while not self.idle_readers.empty():
+                self.idle_readers.get_nowait().close()
+                self.reader_count -= 1
+        with self.write_lock:
+            self.connection.close()
+
     def setup_db(self) -> None:
         # This will create the users and leader board table in the sql database if they dont already exists
-        c = self.connection.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            username VARCHAR(32) NOT NULL UNIQUE,
-            password VARCHAR(128) NOT NULL UNIQUE,
-            salt VARCHAR(24) NOT NULL UNIQUE,
-            wins INT UNSIGNED DEFAULT 0,
-            loses INT UNSIGNED DEFAULT 0,
-            games_played INT UNSIGNED DEFAULT 0
-        );
-        """)
-        self.connection.commit()
+        with self.writing() as c:
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                username VARCHAR(32) NOT NULL UNIQUE,
+                password VARCHAR(128) NOT NULL UNIQUE,
+                salt VARCHAR(24) NOT NULL UNIQUE,
+                wins INT UNSIGNED DEFAULT 0,
+                loses INT UNSIGNED DEFAULT 0,
+                games_played INT UNSIGNED DEFAULT 0,
+                score INT GENERATED ALWAYS AS (wins - loses) VIRTUAL
+            );
+            """)
+            # Databases from before the leaderboard pages don't have the score column yet
+            # (table_xinfo is needed to see generated columns, table_info leaves them out)
+            columns = [column[1] for column in c.execute("PRAGMA table_xinfo(users)")]
+            if "score" not in columns:
+                c.execute("ALTER TABLE users ADD COLUMN score INT GENERATED ALWAYS AS (wins - loses) VIRTUAL")
+            # The leaderboard order, best score first and players with the same score by username
+            c.execute("CREATE INDEX IF NOT EXISTS users_by_score ON users (score DESC, username)")
+
+    def username_taken(self, username: str) -> bool:
+        with self.reading() as c:
+            return c.execute(SELECT_USERNAME, (username,)).fetchone() is not None
+
+    def login_details(self, username: str) -> tuple[str, str, str] | None:
+        """
+        The (username, password hash, salt) of the user, None if there is no such user.
+        """
+        with self.reading() as c:
+            return c.execute(SELECT_LOGIN, (username,)).fetchone()
+
+    def player(self, username: str) -> tuple[str, int, int, int] | None:
+        """
+        The (username, wins, loses, games_played) of the user, None if there is no such user.
+        """
+        with self.reading() as c:
+            return c.execute(SELECT_PLAYER, (username,)).fetchone()
+
+    def all_players(self) -> list[tuple[str, int, int, int]]:
+        with self.reading() as c:
+            return c.execute(SELECT_ALL_PLAYERS).fetchall()
+
+    def create_user(self, username: str, password: str, salt: str) -> None:
+        """
+        Add a user, this raises sqlite3.IntegrityError if the username is taken.
+        """
+        with self.writing() as c:
+            c.execute(INSERT_USER, (username, password, salt))
+
+    def record_games(self, results: list[tuple[str, bool]]) -> list[tuple[str, int, int, int] | None]:
+        """
+        Add a win or a loss to every (username, won) in one transaction, so they all share one commit.
+        Returns every user's (username, wins, loses, games_played) after their result, None if there is no such user.
+        """
+        players = []
+        with self.writing() as c:
+            for username, won in results:
+                if RETURNING:
+                    players.append(c.execute((UPDATE_WIN if won else UPDATE_LOSS) + RETURNING_PLAYER,
+                                             (username,)).fetchone())
+                else:
+                    c.execute(UPDATE_WIN if won else UPDATE_LOSS, (username,))
+                    players.append(c.execute(SELECT_PLAYER, (username,)).fetchone())
+        return players
+
+    def leaderboard_page(self, after: tuple[int, str] | None,
+                         limit: int) -> tuple[list[tuple[str, int, int, int]], tuple[int, str] | None]:
+        """
+        One page of the leaderboard as (username, wins, loses, games_played) and where the next page starts,
+        None if this is the last page.
+        after is where the page starts, the (score, username) of the last player of the page before or None for the first page.
+
+        Every query starts reading users_by_score where the page starts and stops after the page,
+        so a page costs the same however far down the leaderboard it is.
+        """
+        with self.reading() as c:
+            # One more player than the page is read to know if there is a next page
+            if after is None:
+                rows = c.execute(SELECT_FIRST_PAGE, (limit + 1,)).fetchall()
+            else:
+                score, username = after
+                # The rest of the players with the same score, then the players below them.
+                # One query with an OR would read every player with that score first, and most players have the same few scores
+                rows = c.execute(SELECT_SAME_SCORE_BELOW, (score, username, limit + 1)).fetchall()
+                if len(rows) <= limit:
+                    rows += c.execute(SELECT_LOWER_SCORES, (score, limit + 1 - len(rows))).fetchall()
+        next_page = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_page = (rows[-1][4], rows[-1][0])
+        return [row[:4] for row in rows], next_page
+
+    def score_counts(self) -> dict[int, int]:
+        """
+        How many players have every score, the server keeps these in memory to rank players (see leaderboard.py).
+        """
+        with self.reading() as c:
+            return dict(c.execute(SELECT_SCORE_COUNTS).fetchall())
+
+    def player_and_neighbours(self, username: str, count: int) -> tuple[tuple[str, int, int, int, int] | None,
+                                                                         list[tuple[str, int, int, int]],
+                                                                         list[tuple[str, int, int, int]]]:
+        """
+        The player as (username, wins, loses, games_played, score) and up to count players right above and
+        right below them on the leaderboard, in leaderboard order. The player is None if there is no such user.
+        Like leaderboard_page every query starts reading users_by_score at the player.
+        """
+        with self.reading() as c:
+            player = c.execute(SELECT_PLAYER_WITH_SCORE, (username,)).fetchone()
+            if player is None:
+                return None, [], []
+            score = player[4]
+            # Read up the leaderboard from the player, the same score first
+            above = c.execute(SELECT_SAME_SCORE_ABOVE, (score, username, count)).fetchall()
+            if len(above) < count:
+                above += c.execute(SELECT_HIGHER_SCORES, (score, count - len(above))).fetchall()
+        above.reverse()
+        below = self.leaderboard_page((score, username), count)[0]
+        return player, above, below
 
     def drop_db(self) -> None:
         # This will drop the users and leader board table in the sql database
-        c = self.connection.cursor()
-        c.execute("""
-        DROP TABLE IF EXISTS users;
-        """)
-        self.connection.commit()
\ No newline at end of file
+        with self.writing() as c:
+            c.execute("""
+            DROP TABLE IF EXISTS users;
+            """)
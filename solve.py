@@ -1,3 +1,22 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Solves Lights Out boards: which cells have to be pressed to make every cell even
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Iterator
+
+from board import Board
+
+import json  # used to save the eliminations to disk
+import os  # used to replace the saved eliminations in one go
+import random  # used to make the boards for the benchmark
+import sys  # used to read the command line
+import threading  # used to share the eliminations between the server's threads
+import time  # used to time the benchmark
+
+
 def switch_cell(matrix: list[list[int]], x: int, y: int) -> None:
     matrix[x][y] += 1
     if x > 0:
@@ -25,7 +44,730 @@ def init_coeff_matrix(x: int, y: int) -> list[list[int]]:
                 matrix[i * y + j + 1][k] = 1
     return matrix
 
-def solve(matrix: list[list[int]]) -> list[list[list[int]]]:
+def init_coeff_rows(x: int, y: int) -> list[int]:
+    """
+    The coefficient matrix of init_coeff_matrix with every row as one int, bit k is column k.
+    """
+    rows = [0] * (x * y)
+    for i in range(x):
+        for j in range(y):
+            k = i * y + j
+            bit = 1 << k
+            rows[k] |= bit
+            if i > 0:
+                rows[(i - 1) * y + j] |= bit
+            if i < x - 1:
+                rows[(i + 1) * y + j] |= bit
+            if j > 0:
+                rows[i * y + j - 1] |= bit
+            if j < y - 1:
+                rows[i * y + j + 1] |= bit
+    return rows
+
+def board_vector(matrix: Board | list[list[int]]) -> int:
+    """
+    The board as one int, bit k is whether cell k (row * width + column) is odd.
+    """
+    if isinstance(matrix, Board):
+        return matrix.bits
+    width = len(matrix[0])
+    vector = 0
+    for i, row in enumerate(matrix):
+        for j, item in enumerate(row):
+            if item & 1:
+                vector |= 1 << (i * width + j)
+    return vector
+
+def board_size(matrix: Board | list[list[int]]) -> tuple[int, int]:
+    if isinstance(matrix, Board):
+        return matrix.height, matrix.width
+    return len(matrix), len(matrix[0])
+
+
+def fewest_of(presses: int, null_basis: list[int], null_weights: list[int]) -> int:
+    """
+    The solution with the fewest presses out of presses XOR every mix of the null space basis.
+
+    The mixes are gone through in Gray code order, so the next one only XORs in one more basis vector, and the number
+    of presses is kept up to date from how many of that vector's cells were pressed before instead of making every solution.
+    """
+    best = presses
+    weight = best_weight = presses.bit_count()
+    for i in range(1, 1 << len(null_basis)):
+        # The lowest set bit of i is the basis vector that changes between Gray codes i - 1 and i
+        k = (i & -i).bit_length() - 1
+        null = null_basis[k]
+        # The cells of the vector that were pressed aren't any more and the others are
+        weight += null_weights[k] - 2 * (presses & null).bit_count()
+        presses ^= null
+        if weight < best_weight:
+            best, best_weight = presses, weight
+    return best
+
+
+class Elimination():
+    """
+    Everything about the press matrix of one board size that doesn't depend on the board, so it is only worked out once.
+
+    rows = The ladder form that solve reduces the press matrix to, one int per row.
+    upper = The rows of the ladder form without the diagonal and everything left of it.
+    range_basis = The press patterns that every board that can be solved is made from.
+    transform = The row operations that made the ladder form, bit k of transform[i] means board cell k was XORed into row i,
+                so the augmented column of a board is one product with it.
+    coeff_rank = How many rows of the ladder form aren't 0.
+    pseudo_inverse = Multiplying a solvable board by this gives a way to solve it, one int per cell.
+    null_basis = The ways to press cells that don't change the board, every solution is one solution XOR some of these.
+                 The press matrix is symmetric, so a board can be solved exactly when it is even with every one of these.
+    """
+
+    def __init__(self, height: int, width: int) -> None:
+        self.height = height
+        self.width = width
+        self.cells = height * width
+
+        # The same elimination as solve_list, the pivot of column i is always row i
+        rows = init_coeff_rows(height, width)
+        transform = [1 << i for i in range(self.cells)]
+        for i in range(self.cells):
+            bit = 1 << i
+            if not rows[i] & bit:
+                for x in range(i + 1, self.cells):
+                    if rows[x] & bit:
+                        rows[i], rows[x] = rows[x], rows[i]
+                        transform[i], transform[x] = transform[x], transform[i]
+                        break
+                else:
+                    continue
+            for j in range(i + 1, self.cells):
+                if rows[j] & bit:
+                    rows[j] ^= rows[i]
+                    transform[j] ^= transform[i]
+        self.rows = rows
+        self.transform = transform
+        self.coeff_rank = sum(1 for row in rows if row)
+
+        # The reduced row echelon form gives the pseudo inverse and the null space
+        rows = init_coeff_rows(height, width)
+        inverse = [1 << i for i in range(self.cells)]
+        pivots = []
+        for column in range(self.cells):
+            bit = 1 << column
+            rank = len(pivots)
+            pivot = next((k for k in range(rank, self.cells) if rows[k] & bit), None)
+            if pivot is None:
+                continue
+            rows[rank], rows[pivot] = rows[pivot], rows[rank]
+            inverse[rank], inverse[pivot] = inverse[pivot], inverse[rank]
+            for k in range(self.cells):
+                if k != rank and rows[k] & bit:
+                    rows[k] ^= rows[rank]
+                    inverse[k] ^= inverse[rank]
+            pivots.append(column)
+        # The free cells aren't pressed, each pivot cell is pressed when its row of the inverse says so
+        self.pseudo_inverse = [0] * self.cells
+        for rank, column in enumerate(pivots):
+            self.pseudo_inverse[column] = inverse[rank]
+        self.null_basis = []
+        for free in sorted(set(range(self.cells)) - set(pivots)):
+            vector = 1 << free
+            for rank, column in enumerate(pivots):
+                if rows[rank] >> free & 1:
+                    vector |= 1 << column
+            self.null_basis.append(vector)
+        self._derive()
+
+    def _derive(self) -> None:
+        """
+        Work out what is quick to get from the rest, so it doesn't have to be saved.
+        """
+        # The part of every row to the right of the diagonal, that is what back substitution reads
+        self.upper = [row >> (j + 1) << (j + 1) for j, row in enumerate(self.rows)]
+        # The press patterns of the pivot cells are a basis of every board that can be solved
+        # (only the pivot cells have a row in the pseudo inverse)
+        presses = init_coeff_rows(self.height, self.width)
+        pivots = [k for k, row in enumerate(self.pseudo_inverse) if row]
+        self.range_basis = [presses[k] for k in pivots]
+        # How many cells every null space vector presses
+        self.null_weights = [null.bit_count() for null in self.null_basis]
+        # Which mix of the range basis makes the all odd board, None if it can't be made
+        all_odd = (1 << self.cells) - 1
+        self.all_odd_index = None
+        if self.is_solvable(all_odd):
+            presses = self.press(all_odd)
+            self.all_odd_index = sum(1 << i for i, k in enumerate(pivots) if presses >> k & 1)
+
+    def augmented(self, vector: int) -> list[int]:
+        """
+        The augmented column of the ladder form for a board.
+        """
+        return [(row & vector).bit_count() & 1 for row in self.transform]
+
+    def is_solvable(self, vector: int) -> bool:
+        return not any((null & vector).bit_count() & 1 for null in self.null_basis)
+
+    def press(self, vector: int) -> int:
+        """
+        One way to solve a solvable board, bit k is whether cell k is pressed.
+        """
+        presses = 0
+        for k, row in enumerate(self.pseudo_inverse):
+            if (row & vector).bit_count() & 1:
+                presses |= 1 << k
+        return presses
+
+    def fewest_presses(self, vector: int) -> int | None:
+        """
+        The solution of a board that needs the fewest presses, None if it can't be solved.
+        Every solution is the pseudo inverse's one XOR a mix of the null space basis.
+        """
+        if not self.is_solvable(vector):
+            return None
+        return fewest_of(self.press(vector), self.null_basis, self.null_weights)
+
+    def random_vector(self, rng: random.Random) -> int:
+        """
+        A random board that can be solved and isn't all even or all odd, every one of them is as likely.
+        Every mix of the range basis is a different board that can be solved, so a random mix is picked
+        and the 2 that would end the game straight away are skipped over instead of being tried again.
+        """
+        # Mix 0 is the all even board
+        skipped = [0] if self.all_odd_index is None else [0, self.all_odd_index]
+        choices = (1 << len(self.range_basis)) - len(skipped)
+        if choices <= 0:
+            raise ValueError(f"Every {self.height}x{self.width} board that can be solved is already won")
+        index = rng.randrange(choices)
+        for skip in skipped:
+            if index >= skip:
+                index += 1
+
+        vector = 0
+        for basis in self.range_basis:
+            if index & 1:
+                vector ^= basis
+            index >>= 1
+        return vector
+
+    def to_dict(self) -> dict:
+        return {
+            "height": self.height, "width": self.width, "rows": self.rows, "transform": self.transform,
+            "coeff_rank": self.coeff_rank, "pseudo_inverse": self.pseudo_inverse, "null_basis": self.null_basis
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Elimination":
+        elimination = cls.__new__(cls)
+        elimination.height, elimination.width = data["height"], data["width"]
+        elimination.cells = elimination.height * elimination.width
+        for name in ("rows", "transform", "coeff_rank", "pseudo_inverse", "null_basis"):
+            setattr(elimination, name, data[name])
+        if len(elimination.rows) != elimination.cells or len(elimination.pseudo_inverse) != elimination.cells:
+            raise ValueError(f"The saved elimination of a {elimination.height}x{elimination.width} board is broken")
+        elimination._derive()
+        return elimination
+
+
+class EliminationCache():
+    """
+    The eliminations of the board sizes that were used last, the one that was used longest ago is dropped when it's full.
+
+    max_size = How many board sizes are kept.
+    """
+
+    # Saved files with another version are ignored
+    VERSION = 1
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.eliminations: OrderedDict[tuple[int, int], Elimination] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.eliminations)
+
+    def get(self, height: int, width: int) -> Elimination:
+        key = (height, width)
+        with self.lock:
+            elimination = self.eliminations.get(key)
+            if elimination is not None:
+                self.hits += 1
+                self.eliminations.move_to_end(key)
+                return elimination
+            self.misses += 1
+        # Work it out without the lock so other board sizes don't have to wait
+        elimination = Elimination(height, width)
+        self._add(elimination)
+        return elimination
+
+    def _add(self, elimination: Elimination) -> None:
+        with self.lock:
+            self.eliminations[(elimination.height, elimination.width)] = elimination
+            self.eliminations.move_to_end((elimination.height, elimination.width))
+            while len(self.eliminations) > self.max_size:
+                self.eliminations.popitem(last=False)
+
+    def warm(self, sizes: list[tuple[int, int]], path: str | None = None) -> None:
+        """
+        Work out the eliminations of the board sizes before anyone needs them.
+        If a path is given the saved ones are loaded from it first, and it is saved again if any were missing.
+        """
+        if path is not None and os.path.exists(path):
+            self.load(path)
+        with self.lock:
+            missing = [size for size in sizes if size not in self.eliminations]
+        for height, width in missing:
+            self._add(Elimination(height, width))
+        if path is not None and missing:
+            self.save(path)
+
+    def load(self, path: str) -> int:
+        """
+        Add the eliminations saved in the file, this returns how many were loaded.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != self.VERSION:
+                return 0
+            eliminations = [Elimination.from_dict(item) for item in data["eliminations"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not load the saved eliminations from {path}: {e}")
+            return 0
+        for elimination in eliminations:
+            self._add(elimination)
+        return len(eliminations)
+
+    def save(self, path: str) -> None:
+        with self.lock:
+            eliminations = [elimination.to_dict() for elimination in self.eliminations.values()]
+        # Write to another file first so a server that starts at the same time never reads half a file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"version": self.VERSION, "eliminations": eliminations}, file)
+        os.replace(temporary_path, path)
+
+
+# Shared by everything that solves boards
+eliminations = EliminationCache()
+
+# Boards with more cells than this are solved by light chasing, the full elimination grows too fast past it
+CHASE_CELLS = 14 * 14
+# Past this many null space vectors a light chased hint is just a solution, not the one with the fewest presses
+MAX_HINT_NULLITY = 16
+
+
+class LightChase():
+    """
+    Solves boards by light chasing, for boards that are too big for an Elimination.
+
+    Once the presses of the first row are picked, the only press that can fix an odd cell is the one below it,
+    so every other press follows from the first row. Every press is an affine function of the first row presses,
+    and the bottom row is left all even exactly when the first row solves a width x width system, so only that
+    system has to be eliminated. A board is then solved by chasing it down twice, one XOR of whole rows at a time.
+
+    pseudo_inverse = Multiplying what is left on the bottom row (chasing with no first row presses) by this gives
+                     the first row presses, one int per column.
+    checks = What is left on the bottom row has to be even with each of these for the board to be solvable.
+    null_basis = The ways to press cells that don't change the board, as presses of every cell.
+    """
+
+    def __init__(self, height: int, width: int) -> None:
+        self.height = height
+        self.width = width
+        self.cells = height * width
+        self.full_row = (1 << width) - 1
+
+        # What pressing each cell of the first row on its own leaves on the bottom row, after chasing an all even board
+        columns = [self._chase(0, 1 << k)[1] for k in range(width)]
+        # Equation j says which first row presses switch bottom cell j
+        equations = [0] * width
+        for k, column in enumerate(columns):
+            for j in range(width):
+                if column >> j & 1:
+                    equations[j] |= 1 << k
+
+        # Reduced row echelon form, inverse keeps track of which bottom cells made every equation
+        inverse = [1 << j for j in range(width)]
+        pivots = []
+        for column in range(width):
+            bit = 1 << column
+            rank = len(pivots)
+            pivot = next((k for k in range(rank, width) if equations[k] & bit), None)
+            if pivot is None:
+                continue
+            equations[rank], equations[pivot] = equations[pivot], equations[rank]
+            inverse[rank], inverse[pivot] = inverse[pivot], inverse[rank]
+            for k in range(width):
+                if k != rank and equations[k] & bit:
+                    equations[k] ^= equations[rank]
+                    inverse[k] ^= inverse[rank]
+            pivots.append(column)
+        self.pseudo_inverse = [0] * width
+        for rank, column in enumerate(pivots):
+            self.pseudo_inverse[column] = inverse[rank]
+        # The equations that were eliminated to nothing, the board has to be even with them as well
+        self.checks = inverse[len(pivots):]
+        self.null_basis = []
+        for free in sorted(set(range(width)) - set(pivots)):
+            first_row = 1 << free
+            for rank, column in enumerate(pivots):
+                if equations[rank] >> free & 1:
+                    first_row |= 1 << column
+            self.null_basis.append(self._chase(0, first_row)[0])
+        self.null_weights = [null.bit_count() for null in self.null_basis]
+
+    def _spread(self, row: int) -> int:
+        """
+        The cells of a row that pressing the cells of row switches (each pressed cell and its left and right).
+        """
+        return row ^ (row << 1 & self.full_row) ^ (row >> 1)
+
+    def _chase(self, vector: int, first_row: int) -> tuple[int, int]:
+        """
+        Press first_row and then every cell below an odd cell, this returns every press and what is left on the bottom row.
+        """
+        presses = first_row
+        above, row = 0, first_row
+        for i in range(self.height - 1):
+            # The presses on row i + 1 that make every cell of row i even
+            below = (vector >> (i * self.width) & self.full_row) ^ self._spread(row) ^ above
+            presses |= below << ((i + 1) * self.width)
+            above, row = row, below
+        left = (vector >> ((self.height - 1) * self.width) & self.full_row) ^ self._spread(row) ^ above
+        return presses, left
+
+    def is_solvable(self, vector: int) -> bool:
+        left = self._chase(vector, 0)[1]
+        return not any((check & left).bit_count() & 1 for check in self.checks)
+
+    def press(self, vector: int) -> int | None:
+        """
+        One way to solve the board, bit k is whether cell k is pressed. None if it can't be solved.
+        """
+        left = self._chase(vector, 0)[1]
+        if any((check & left).bit_count() & 1 for check in self.checks):
+            return None
+        first_row = 0
+        for k, row in enumerate(self.pseudo_inverse):
+            if (row & left).bit_count() & 1:
+                first_row |= 1 << k
+        return self._chase(vector, first_row)[0]
+
+    def fewest_presses(self, vector: int) -> int | None:
+        """
+        The solution with the fewest presses, or just a solution if the null space is too big to go through.
+        """
+        presses = self.press(vector)
+        if presses is None or len(self.null_basis) > MAX_HINT_NULLITY:
+            return presses
+        return fewest_of(presses, self.null_basis, self.null_weights)
+
+    def random_vector(self, rng: random.Random) -> int:
+        """
+        A random board that can be solved and isn't all even or all odd, every one of them is as likely.
+        The board is what random presses do to an all even board.
+        """
+        if self.cells - len(self.null_basis) < 2:
+            # Only the all even board and maybe one other can be made
+            raise ValueError(f"Every {self.height}x{self.width} board that can be solved is already won")
+        all_odd = (1 << self.cells) - 1
+        vector = 0
+        # With this many cells the 2 boards that are already won are next to impossible, so they are just tried again
+        while vector in (0, all_odd):
+            vector = self.board_of(rng.getrandbits(self.cells))
+        return vector
+
+    def board_of(self, presses: int) -> int:
+        """
+        The cells that the presses switch, row by row.
+        """
+        vector, above = 0, 0
+        for i in range(self.height):
+            row = presses >> (i * self.width) & self.full_row
+            below = presses >> ((i + 1) * self.width) & self.full_row
+            vector |= (self._spread(row) ^ above ^ below) << (i * self.width)
+            above = row
+        return vector
+
+
+@lru_cache(maxsize=64)
+def light_chase(height: int, width: int) -> LightChase:
+    return LightChase(height, width)
+
+def solver_for(height: int, width: int) -> Elimination | LightChase:
+    """
+    The cached Elimination of the board size, or its LightChase if the board is too big.
+    """
+    if height * width > CHASE_CELLS:
+        return light_chase(height, width)
+    return eliminations.get(height, width)
+
+class Symmetries():
+    """
+    The ways a board of one size can be turned or flipped onto itself, 8 for a square board and 4 for any other.
+
+    Every transform is kept as a table for every byte of a board's bits, so moving a whole board is one lookup
+    per 8 cells instead of one step per cell. inverses moves a board back again.
+    The tables of the transforms themselves are packed side by side (see canonical), only that is kept of them.
+    """
+
+    def __init__(self, height: int, width: int) -> None:
+        self.height = height
+        self.width = width
+        self.cells = height * width
+        transforms: list[list[list[int]]] = []
+        self.inverses: list[list[list[int]]] = []
+        for transpose in ((False, True) if height == width else (False,)):
+            for flip_rows in (False, True):
+                for mirror in (False, True):
+                    # Where every cell goes
+                    moves = []
+                    for k in range(self.cells):
+                        i, j = divmod(k, width)
+                        if transpose:
+                            i, j = j, i
+                        if mirror:
+                            j = width - 1 - j
+                        if flip_rows:
+                            i = height - 1 - i
+                        moves.append(i * width + j)
+                    undo = [0] * self.cells
+                    for k, moved in enumerate(moves):
+                        undo[moved] = k
+                    transforms.append(self._tables(moves))
+                    self.inverses.append(self._tables(undo))
+        # Every transform of a byte side by side in one int, cells bits each,
+        # so one pass over a board's bytes gives every way of turning it at once
+        self.packed = [
+            [sum(table[byte] << (index * self.cells) for index, table in enumerate(tables)) for byte in range(256)]
+            for tables in zip(*transforms)
+        ]
+
+    def _tables(self, moves: list[int]) -> list[list[int]]:
+        tables = []
+        for start in range(0, self.cells, 8):
+            table = [0] * 256
+            for byte in range(1, 256):
+                # A byte's cells are its lowest cell and the cells of the byte without it
+                lowest = (byte & -byte).bit_length() - 1
+                moved = 1 << moves[start + lowest] if start + lowest < self.cells else 0
+                table[byte] = table[byte & (byte - 1)] | moved
+            tables.append(table)
+        return tables
+
+    @staticmethod
+    def apply(tables: list[list[int]], vector: int) -> int:
+        moved = 0
+        for table in tables:
+            moved |= table[vector & 0xFF]
+            vector >>= 8
+        return moved
+
+    def canonical(self, vector: int) -> tuple[int, int]:
+        """
+        The smallest board the board can be turned into, and which transform turns it into that.
+        """
+        packed = 0
+        for table, byte in zip(self.packed, vector.to_bytes(len(self.packed), "little")):
+            packed |= table[byte]
+        full = (1 << self.cells) - 1
+        # The first transform leaves the board as it is
+        best, best_index = vector, 0
+        for index in range(1, len(self.inverses)):
+            moved = packed >> (index * self.cells) & full
+            if moved < best:
+                best, best_index = moved, index
+        return best, best_index
+
+
+@lru_cache(maxsize=16)
+def board_symmetries(height: int, width: int) -> Symmetries:
+    return Symmetries(height, width)
+
+
+class SolutionMemo():
+    """
+    Solver results of boards that were seen before. A board and every board it can be turned or flipped into
+    share one entry, the board is turned into the smallest of them (as bits) and the result is turned back after.
+    This works because turning a solution the same way as its board gives a solution of the turned board.
+
+    max_bytes = Roughly how much memory the entries can use, the one that was used longest ago goes first.
+    max_cells = Bigger boards aren't kept, they are seldom seen twice.
+    """
+
+    # A rough size of everything an entry needs apart from its ints
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_cells: int = 64) -> None:
+        self.max_bytes = max_bytes
+        self.max_cells = max_cells
+        self.entries: OrderedDict[tuple[str, int, int, int], tuple[int | None, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, kind: str, height: int, width: int, vector: int,
+               compute: Callable[[int], int | None]) -> int | None:
+        """
+        The result of compute for the board, compute is only called if the board (or one of its turns) is new.
+        kind keeps the results of different computes apart.
+        """
+        if height * width > self.max_cells:
+            return compute(vector)
+        symmetries = board_symmetries(height, width)
+        canonical, index = symmetries.canonical(vector)
+        key = (kind, height, width, canonical)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if entry is None:
+            result = compute(canonical)
+            size = self.ENTRY_OVERHEAD + sys.getsizeof(canonical) + sys.getsizeof(result)
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = (result, size)
+                    self.bytes += size
+                    while self.bytes > self.max_bytes and self.entries:
+                        self.bytes -= self.entries.popitem(last=False)[1][1]
+        else:
+            result = entry[0]
+        if result is None:
+            return None
+        return symmetries.apply(symmetries.inverses[index], result)
+
+    def stats(self) -> dict[str, int | float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": len(self.entries), "bytes": self.bytes}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+# Shared by the hints, the server and the tools that solve boards
+memo = SolutionMemo()
+
+def is_solvable(matrix: Board | list[list[int]]) -> bool:
+    """
+    Whether the board can be made all even, without working out how.
+    """
+    return solver_for(*board_size(matrix)).is_solvable(board_vector(matrix))
+
+def count_solutions(matrix: Board | list[list[int]]) -> int:
+    """
+    How many solutions solve would give, every solution is one of them XOR any mix of the null space basis.
+    """
+    solver = solver_for(*board_size(matrix))
+    if not solver.is_solvable(board_vector(matrix)):
+        return 0
+    return 1 << len(solver.null_basis)
+
+def solution(matrix: Board | list[list[int]]) -> list[list[int]] | None:
+    """
+    One way to press the cells that makes the board all even, None if there isn't one.
+    """
+    height, width = board_size(matrix)
+    solver = solver_for(height, width)
+
+    def press(vector: int) -> int | None:
+        return solver.press(vector) if solver.is_solvable(vector) else None
+
+    presses = memo.lookup("solution", height, width, board_vector(matrix), press)
+    if presses is None:
+        return None
+    return [[presses >> (i * width + j) & 1 for j in range(width)] for i in range(height)]
+
+def fewest_presses(matrix: Board | list[list[int]], odd: bool = False) -> int | None:
+    """
+    The solution of the board that needs the fewest presses as a bitmask of the cells (bit k is cell
+    row * width + column), None if it can't be solved. With odd it makes the board all odd instead of all even.
+    """
+    height, width = board_size(matrix)
+    vector = board_vector(matrix)
+    if odd:
+        vector ^= (1 << (height * width)) - 1
+    return memo.lookup("fewest", height, width, vector, solver_for(height, width).fewest_presses)
+
+def random_board(height: int, width: int, rng: random.Random | None = None) -> list[list[int]]:
+    """
+    A random board of 1s (odd) and 2s (even) that can be solved and isn't already won, made in one go with no retries.
+    Every such board is as likely as the others, like picking random boards until one is fine.
+    Pass a seeded random.Random to get the same boards every time.
+    """
+    vector = solver_for(height, width).random_vector(random if rng is None else rng)
+    return [[1 if vector >> (i * width + j) & 1 else 2 for j in range(width)] for i in range(height)]
+
+def new_board(height: int, width: int, rng: random.Random | None = None) -> Board:
+    """
+    random_board as a Board, that is what the games are played on.
+    """
+    return Board(height, width, solver_for(height, width).random_vector(random if rng is None else rng))
+
+def iter_solutions(matrix: Board | list[list[int]]) -> Iterator[list[list[int]]]:
+    """
+    The solutions of solve one at a time, the next one is only worked out when it is asked for.
+    """
+    height, width = board_size(matrix)
+    cells = height * width
+    elimination = eliminations.get(height, width)
+    rows, upper, coeff_rank = elimination.rows, elimination.upper, elimination.coeff_rank
+    # The augmented column, it is kept apart because the enumeration uses it as a counter
+    augmented = elimination.augmented(board_vector(matrix))
+
+    # Computation of Rank of Extended Matrix
+    matrix_rank = sum(1 for row, value in zip(rows, augmented) if row or value)
+    if coeff_rank < matrix_rank:
+        return
+
+    # Enumeration and Replacement Solution
+    for _ in range(1 << (cells - coeff_rank)):
+        # The bottom rows of the augmented column count up in binary, the last row is the lowest bit
+        for j in range(cells - 1, coeff_rank, -1):
+            augmented[j - 1] += augmented[j] >> 1
+            augmented[j] &= 1
+
+        # Back substitution, a cell's value is XORed with every value to its right that its row has a 1 for.
+        # XOR works on every bit on its own, so each bit of the values is solved as a bitmask of the cells
+        # (the values are 0 or 1 unless the counter has carried past the top row)
+        temp = [0] * cells
+        for plane in range(max(augmented).bit_length()):
+            solved = 0
+            for j in range(cells - 1, -1, -1):
+                if ((augmented[j] >> plane) ^ (upper[j] & solved).bit_count()) & 1:
+                    solved |= 1 << j
+                    temp[j] |= 1 << plane
+
+        # Work out the next solution from the counter only once this one has been used
+        yield [temp[j * width:(j + 1) * width] for j in range(height)]
+        augmented[cells - 1] += 1
+
+def solve(matrix: Board | list[list[int]], lazy: bool = False) -> list[list[list[int]]] | Iterator[list[list[int]]]:
+    """
+    Every way to press the cells that makes the board all even, [] if there isn't one.
+    With lazy they are yielded one at a time instead (see iter_solutions), a board can have thousands of them.
+
+    This gives exactly the same solutions in the same order as solve_list (the original solver).
+    The ladder form of the board size comes from the cache, so only the augmented column is worked out for the board.
+    Use is_solvable or count_solutions if the solutions themselves aren't needed.
+    """
+    if lazy:
+        return iter_solutions(matrix)
+    return list(iter_solutions(matrix))
+
+def solve_list(matrix: list[list[int]]) -> list[list[list[int]]]:
+    """
+    The original solver, it works on a list of lists one element at a time.
+    It is kept to check solve against and to benchmark it.
+    """
     cells = len(matrix) * len(matrix[0])
     coeff_rank, matrix_rank = 0, 0
     coeff_matrix = init_coeff_matrix(len(matrix), len(matrix[0]))
@@ -87,10 +829,49 @@ def solve(matrix: list[list[int]]) -> list[list[list[int]]]:
             coeff_matrix[cells - 1][cells] += 1
     return solution
 
+def benchmark(sizes: range = range(3, 15), boards: int = 5) -> None:
+    """
+    Time solve against solve_list on random boards of every size and check that they give the same solutions.
+    The elimination of a board size is only worked out once, so it is timed on its own.
+    """
+    print(f"{'board':>7}{'solve_list ms':>15}{'elimination ms':>16}{'solve ms':>11}{'speedup':>10}")
+    for size in sizes:
+        rng = random.Random(size)
+        tests = [[[rng.randint(1, 2) for _ in range(size)] for _ in range(size)] for _ in range(boards)]
+        started = time.perf_counter()
+        eliminations.get(size, size)
+        elimination_time = (time.perf_counter() - started) * 1000
+        timings = []
+        results = []
+        for solver in (solve_list, solve):
+            started = time.perf_counter()
+            results.append([solver(board) for board in tests])
+            timings.append((time.perf_counter() - started) / boards * 1000)
+        if results[0] != results[1]:
+            raise AssertionError(f"solve and solve_list don't agree on a {size}x{size} board")
+        print(f"{f'{size}x{size}':>7}{timings[0]:>15.2f}{elimination_time:>16.2f}{timings[1]:>11.3f}"
+              f"{timings[0] / timings[1]:>9.0f}x")
 
-example = [[0, 1, 0], [1, 1, 1], [0, 1, 0], [0, 0, 0], [0, 0, 0]]
+def benchmark_large(sizes: tuple[int, ...] = (16, 32, 64, 128, 256), boards: int = 5) -> None:
+    """
+    Time light chasing on big random boards and check that the solutions work.
+    """
+    print(f"{'board':>9}{'setup ms':>10}{'solution ms':>13}")
+    for size in sizes:
+        rng = random.Random(size)
+        started = time.perf_counter()
+        chase = LightChase(size, size)
+        setup_time = (time.perf_counter() - started) * 1000
+        tests = [chase.random_vector(rng) for _ in range(boards)]
+        started = time.perf_counter()
+        solutions = [chase.press(vector) for vector in tests]
+        solve_time = (time.perf_counter() - started) / boards * 1000
+        if any(presses is None or chase.board_of(presses) != vector for vector, presses in zip(tests, solutions)):
+            raise AssertionError(f"Light chasing didn't solve a {size}x{size} board")
+        print(f"{f'{size}x{size}':>9}{setup_time:>10.2f}{solve_time:>13.3f}")
 
-print(solve(example))
+
+example = [[0, 1, 0], [1, 1, 1], [0, 1, 0], [0, 0, 0], [0, 0, 0]]
 
 # Output:
 out = [
@@ -151,3 +932,39 @@ out = [
         [1, 1, 1],
     ],
 ]
+
+if __name__ == "__main__":  # Only run this code if this python file is the root file execution
+    import argparse  # used to read the options from the command line
+
+    parser = argparse.ArgumentParser(description="Solve Lights Out boards, with no options it solves the example board.")
+    parser.add_argument("--benchmark", action="store_true", help="time the solvers on random boards of every size")
+    parser.add_argument("--batch", metavar="OUT.npy",
+                        help="solve many boards at once with numpy and write the results to this file as they are worked out")
+    parser.add_argument("--size", type=int, nargs=2, default=(5, 5), metavar=("ROWS", "COLUMNS"),
+                        help="board size of the batch (default: 5 5)")
+    parser.add_argument("--input", metavar="BOARDS.npy",
+                        help="boards to solve, (count, rows, columns) numbers or (count, bytes) packed bits "
+                             "(default: random boards)")
+    parser.add_argument("--count", type=int, default=1000000, help="random boards to make without --input (default: 1000000)")
+    parser.add_argument("--chunk", type=int, default=65536, help="boards worked on at once (default: 65536)")
+    parser.add_argument("--seed", type=int, help="seed of the random boards")
+    options = parser.parse_args()
+
+    if options.batch:
+        import batch_solve  # used to solve the boards in batches, it needs numpy
+
+        batch_solve.require_numpy()
+        # Only the chunk that is being solved is read from the file
+        boards = None if options.input is None else batch_solve.np.load(options.input, mmap_mode="r")
+        batch_solve.solve_to_file(options.batch, *options.size, boards=boards, count=options.count,
+                                  chunk_size=options.chunk, seed=options.seed)
+    elif options.benchmark:
+        benchmark()
+        print()
+        benchmark_large()
+        import batch_solve  # used to compare the batch solver too, if numpy is there
+        if batch_solve.np is not None:
+            print()
+            batch_solve.benchmark_batch()
+    else:
+        print(solve(example))
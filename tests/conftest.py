@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Shared by the tests
+
+from server_sql_connection import SqlServerConnection
+
+import random  # used to make up the players
+
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = SqlServerConnection(str(tmp_path / "application.db"))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def players(database):
+    """
+    60 players in the database with only a few different scores, so most of them share a score with others.
+    """
+    rng = random.Random(21)
+    made = []
+    for i in range(60):
+        username = f"player{rng.randrange(10**6):06d}"
+        database.create_user(username, f"password{i}", f"salt{i}")
+        wins, loses = rng.randrange(4), rng.randrange(4)
+        with database.writing() as c:
+            c.execute("UPDATE users SET wins = ?, loses = ?, games_played = ? WHERE username = ?",
+                      (wins, loses, wins + loses, username))
+        made.append((username, wins, loses, wins + loses))
+    return made
+
+
+@pytest.fixture
+def leaderboard(players):
+    # The players in leaderboard order, best score (wins - loses) first and the same score by username
+    return sorted(players, key=lambda player: (player[2] - player[1], player[0]))
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# The in memory ranks and top of the leaderboard
+
+from leaderboard import LeaderboardCache, ScoreTree, leaderboard_key
+from protocol import BINARY, FrameDecoder
+
+import random  # used to make up the scores
+
+import pytest
+
+
+def sorted_rank(scores: list[int], score: int) -> int:
+    # 1 + how many players have a better score, what sorting everyone would give
+    return 1 + sum(1 for other in scores if other > score)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rank_matches_sorting_everyone(seed):
+    rng = random.Random(seed)
+    scores = [rng.randint(-20, 20) for _ in range(200)]
+    tree = ScoreTree({score: scores.count(score) for score in set(scores)})
+    assert len(tree) == len(scores)
+    for score in range(-30, 31):
+        assert tree.rank(score) == sorted_rank(scores, score)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rank_after_moves(seed):
+    rng = random.Random(seed)
+    scores = [rng.randint(-3, 3) for _ in range(50)]
+    tree = ScoreTree({score: scores.count(score) for score in set(scores)})
+    for _ in range(500):
+        i = rng.randrange(len(scores))
+        # Mostly a win or a loss, now and then a new player or a score far outside the tree
+        if rng.random() < 0.05:
+            new = rng.randint(-1000, 1000)
+            scores.append(new)
+            tree.move(None, new)
+        else:
+            new = scores[i] + rng.choice((-1, 1)) * (1 if rng.random() < 0.9 else rng.randint(50, 500))
+            tree.move(scores[i], new)
+            scores[i] = new
+        score = rng.choice(scores)
+        assert tree.rank(score) == sorted_rank(scores, score)
+    assert len(tree) == len(scores)
+    for score in (min(scores) - 1, max(scores) + 1, *scores):
+        assert tree.rank(score) == sorted_rank(scores, score)
+
+
+def test_empty_tree():
+    tree = ScoreTree()
+    assert len(tree) == 0
+    assert tree.rank(0) == 1
+    tree.add(5)
+    assert tree.rank(5) == 1
+    assert tree.rank(4) == 2
+    tree.add(5, -1)
+    assert tree.rank(4) == 1 and not tree.counts
+
+
+def test_ranks_of_the_database(database, leaderboard):
+    tree = ScoreTree(database.score_counts())
+    scores = [wins - loses for _, wins, loses, _ in leaderboard]
+    for score in set(scores):
+        assert tree.rank(score) == sorted_rank(scores, score)
+
+
+def decode(reply: bytes) -> tuple[str, dict]:
+    doc = FrameDecoder(BINARY).feed(reply)[0]
+    return doc["action"], doc["data"]
+
+
+def apply_changes(players: list[tuple], changes: dict) -> list[tuple]:
+    # What a client does with a [GET LEADERBOARD - CHANGES]
+    by_username = {player[0]: player for player in players}
+    for username in changes["removed"]:
+        del by_username[username]
+    for player in changes["players"]:
+        by_username[player[0]] = player
+    return sorted(by_username.values(), key=leaderboard_key)
+
+
+def play(database, cache: LeaderboardCache, rng: random.Random, usernames: list[str]) -> None:
+    # A game ends, the result is written and the cache is told, like the server does
+    for player in database.record_games([(username, rng.random() < 0.5) for username in usernames]):
+        cache.update(player)
+
+
+def test_replies_by_version(database, leaderboard):
+    cache = LeaderboardCache(database.leaderboard_page, size=10, history=3)
+    action, data = decode(cache.reply(None, BINARY))
+    assert action == "[GET LEADERBOARD - SUCCESS]"
+    assert data["players"] == leaderboard[:10]
+    version = data["version"]
+    # The same reply is only encoded once per version
+    assert cache.reply(version, BINARY) is cache.reply(version, BINARY)
+    assert decode(cache.reply(version, BINARY)) == ("[GET LEADERBOARD - NOT MODIFIED]", {"version": version})
+    # A version the cache never gave out (another server's) gets everything
+    assert decode(cache.reply("other.1", BINARY))[0] == "[GET LEADERBOARD - SUCCESS]"
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_changes_bring_an_old_version_up_to_date(database, players, seed):
+    rng = random.Random(seed)
+    usernames = [player[0] for player in players]
+    cache = LeaderboardCache(database.leaderboard_page, size=10, history=3)
+    versions = [decode(cache.reply(None, BINARY))[1]]
+    for _ in range(30):
+        play(database, cache, rng, rng.sample(usernames, 2))
+        action, latest = decode(cache.reply(None, BINARY))
+        assert latest["players"] == database.leaderboard_page(None, 10)[0]
+        for old in versions[-5:]:
+            action, data = decode(cache.reply(old["version"], BINARY))
+            if old["version"] == latest["version"]:
+                assert action == "[GET LEADERBOARD - NOT MODIFIED]"
+            elif old["version"] in cache.snapshots:
+                assert action == "[GET LEADERBOARD - CHANGES]"
+                assert apply_changes(old["players"], data) == latest["players"]
+            else:
+                # Too old, the whole leaderboard is sent again
+                assert action == "[GET LEADERBOARD - SUCCESS]"
+                assert data["players"] == latest["players"]
+        versions.append(latest)
+
+
+@pytest.mark.parametrize("limit", [1, 5, 10])
+def test_first_page_matches_the_database(database, players, limit):
+    rng = random.Random(limit)
+    usernames = [player[0] for player in players]
+    cache = LeaderboardCache(database.leaderboard_page, size=10)
+    for _ in range(30):
+        assert cache.first_page(limit) == database.leaderboard_page(None, limit)
+        # The players at the top lose most, so players fall off the bottom of the cache and it has to be read again
+        top = [player[0] for player in database.leaderboard_page(None, 3)[0]]
+        play(database, cache, rng, [rng.choice(top), rng.choice(usernames)])
+    assert cache.first_page(11) is None
+
+
+def test_new_players(database):
+    cache = LeaderboardCache(database.leaderboard_page, size=3)
+    assert decode(cache.reply(None, BINARY))[1]["players"] == []
+    for i, username in enumerate("cbad"):
+        database.create_user(username, f"password{i}", f"salt{i}")
+        cache.update(database.player(username))
+    cache.update(database.record_games([("a", True)])[0])
+    assert cache.players == [("a", 1, 0, 1), ("b", 0, 0, 0), ("c", 0, 0, 0)]
+    assert cache.first_page(3) == database.leaderboard_page(None, 3) == (cache.players, (0, "c"))
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Who the matchmaker pairs up and when
+
+from matchmaking import Matchmaker, Ticket
+
+import pytest
+
+
+class Recorder():
+    """
+    The games and progress messages a matchmaker sends.
+    """
+
+    def __init__(self) -> None:
+        self.games: list[list[str]] = []
+        self.progress: list[tuple[str, dict]] = []
+
+    def on_match(self, tickets: list[Ticket]) -> None:
+        self.games.append([ticket.username for ticket in tickets])
+
+    def send_progress(self, ticket: Ticket, progress: dict) -> None:
+        self.progress.append((ticket.username, progress))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def matchmaker(recorder):
+    # The sweep thread never wakes up during a test, the tests sweep themselves
+    return Matchmaker(recorder.on_match, recorder.send_progress, progress_interval=5, sweep_interval=3600,
+                      base_tolerance=2, widen_rate=1)
+
+
+def wait(matchmaker: Matchmaker, username: str, seconds: float) -> None:
+    """
+    Pretend the player joined the queue seconds ago.
+    """
+    ticket = matchmaker.tickets[username]
+    ticket.joined_at -= seconds
+    ticket.last_progress_at -= seconds
+
+
+def sweep(matchmaker: Matchmaker) -> tuple[list[list[str]], list[tuple[str, dict]]]:
+    with matchmaker.condition:
+        matches, due = matchmaker._sweep()
+    return [[ticket.username for ticket in match] for match in matches], \
+        [(ticket.username, progress) for ticket, progress in due]
+
+
+def test_only_the_same_board_size_is_paired(matchmaker, recorder):
+    matchmaker.join("a", "a", (3, 3), 0)
+    matchmaker.join("b", "b", (4, 4), 0)
+    matchmaker.join("c", "c", [3, 4], 0)
+    assert recorder.games == []
+    matchmaker.join("d", "d", (4, 4), 0)
+    assert recorder.games == [["b", "d"]]
+    assert sorted(matchmaker.tickets) == ["a", "c"]
+    assert sorted(matchmaker.buckets) == [(3, 3), (3, 4)]
+
+
+def test_the_closest_score_is_picked(matchmaker, recorder):
+    for username, score in [("far", -2), ("close", 4), ("closer", 6)]:
+        matchmaker.join(username, username, (3, 3), score)
+    # "far" and "close" are too far apart to play each other straight away, "closer" is within 2 of "close"
+    assert recorder.games == [["close", "closer"]]
+    matchmaker.join("new", "new", (3, 3), -1)
+    assert recorder.games[-1] == ["far", "new"]
+    assert not matchmaker.tickets and not matchmaker.buckets
+
+
+def test_ties_go_to_the_longest_waiting(matchmaker, recorder):
+    matchmaker.join("first", "first", (3, 3), 10)
+    matchmaker.join("second", "second", (3, 3), 14)
+    wait(matchmaker, "first", 1)
+    matchmaker.join("new", "new", (3, 3), 12)
+    assert recorder.games == [["first", "new"]]
+
+
+def test_tolerance_widens_while_waiting(matchmaker, recorder):
+    matchmaker.join("low", "low", (3, 3), 0)
+    matchmaker.join("high", "high", (3, 3), 10)
+    assert recorder.games == []
+    wait(matchmaker, "low", 5)
+    assert sweep(matchmaker)[0] == []
+    # 2 + 1 * 8 seconds covers the difference in score
+    wait(matchmaker, "low", 3)
+    assert sweep(matchmaker)[0] == [["low", "high"]]
+    assert not matchmaker.tickets and not matchmaker.buckets
+
+
+def test_cancel(matchmaker, recorder):
+    matchmaker.join("a", "a", (3, 3), 0)
+    assert matchmaker.is_waiting("a")
+    assert matchmaker.cancel("a")
+    assert not matchmaker.cancel("a")
+    assert not matchmaker.is_waiting("a") and not matchmaker.buckets
+    matchmaker.join("b", "b", (3, 3), 0)
+    assert recorder.games == []
+
+
+def test_joining_twice_keeps_one_ticket(matchmaker, recorder):
+    matchmaker.join("a", "a", (3, 3), 0)
+    matchmaker.join("a", "a", (3, 3), 0)
+    assert len(matchmaker.buckets[(3, 3)]) == 1
+    assert recorder.games == []
+
+
+def test_requeue_keeps_the_wait(matchmaker, recorder):
+    ticket = Ticket("a", "a", (3, 3), 0, 99)
+    ticket.joined_at -= 20
+    matchmaker.requeue(ticket)
+    assert matchmaker.tickets["a"].joined_at == ticket.joined_at
+    # A new player would need 2 + 20 of tolerance to get in straight away
+    matchmaker.join("b", "b", (3, 3), 21)
+    assert recorder.games == [["a", "b"]]
+
+
+def test_progress(matchmaker, recorder):
+    matchmaker.join("a", "a", (3, 3), 0)
+    matchmaker.join("b", "b", (3, 3), 100)
+    assert recorder.progress == [("a", {"position": 1, "estimated_wait": 0.0}),
+                                 ("b", {"position": 2, "estimated_wait": 0.0})]
+    # Nobody is due another message until progress_interval has passed
+    assert sweep(matchmaker)[1] == []
+    wait(matchmaker, "b", 6)
+    assert sweep(matchmaker)[1] == [("b", {"position": 2, "estimated_wait": 0.0})]
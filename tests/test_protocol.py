@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Documents sent with both wire formats have to come back the same
+
+from board import Board
+from protocol import ACTIONS, BINARY, BINARY_HEADER, HEADERSIZE, PICKLE, FrameDecoder, encode_document
+
+import os  # used by the pickle that must not be loaded
+import pickle  # used to make pickles the server has to turn down
+import uuid  # used to send the game ids
+
+import pytest
+
+DOCUMENTS = [
+    None,
+    True,
+    False,
+    0,
+    -1,
+    127,
+    -128,
+    128,
+    2**31,
+    -2**63,
+    2**200,
+    -2**200,
+    1.5,
+    "",
+    "id",
+    "ü" * 300,
+    b"\x00\xff",
+    ("username", 1, 2, 3),
+    [],
+    [[1, 2], [3, 4]],
+    [[0, 1, 0], [1, 0, 1]],
+    {"players": [("a", 1, 0, 1)], "next": (0, "a"), "removed": [], "id": uuid.uuid4(), "nested": {1: [None, (True,)]}},
+]
+# The pickle format can't send a Board, the server sends those clients rows
+BOARDS = [
+    Board(3, 3, 0),
+    Board(3, 4, 0b101101011001),
+    Board(64, 64, (1 << 4096) - 1),
+    {"board": Board(5, 7, 0x1671), "player_turn": 2, "id": uuid.uuid4()},
+]
+
+
+@pytest.mark.parametrize("wire_format", [BINARY, PICKLE])
+@pytest.mark.parametrize("document", DOCUMENTS, ids=repr)
+def test_round_trip(wire_format, document):
+    data = encode_document("[GAME - MOVE]", document, wire_format)
+    assert FrameDecoder(wire_format).feed(data) == [{"action": "[GAME - MOVE]", "data": document}]
+
+
+@pytest.mark.parametrize("document", BOARDS, ids=repr)
+def test_boards_round_trip(document):
+    data = encode_document("[JOIN GAME - SUCCESS]", document)
+    assert FrameDecoder().feed(data) == [{"action": "[JOIN GAME - SUCCESS]", "data": document}]
+
+
+def test_lists_of_int_lists_stay_lists():
+    rows = [[5, 6], [7, 8]]
+    data = FrameDecoder().feed(encode_document("[GAME - MOVE]", rows))[0]["data"]
+    assert data == rows and type(data) is list
+
+
+@pytest.mark.parametrize("wire_format", [BINARY, PICKLE])
+def test_every_action(wire_format):
+    data = b"".join(encode_document(action, {"seq": i}, wire_format) for i, action in enumerate(ACTIONS))
+    docs = FrameDecoder(wire_format).feed(data)
+    assert docs == [{"action": action, "data": {"seq": i}} for i, action in enumerate(ACTIONS)]
+
+
+@pytest.mark.parametrize("wire_format", [BINARY, PICKLE])
+def test_wire_format_is_worked_out_from_the_first_byte(wire_format):
+    decoder = FrameDecoder()
+    assert decoder.feed(encode_document("[USER LOGIN]", ("user", "password"), wire_format)) == \
+        [{"action": "[USER LOGIN]", "data": ("user", "password")}]
+    assert decoder.wire_format == wire_format
+
+
+@pytest.mark.parametrize("wire_format", [BINARY, PICKLE])
+def test_frames_split_over_reads(wire_format):
+    documents = [{"row": i, "col": i + 1, "id": uuid.uuid4()} for i in range(5)]
+    data = b"".join(encode_document("[GAME - MOVE]", document, wire_format) for document in documents)
+    decoder = FrameDecoder(wire_format)
+    docs = []
+    for i in range(len(data)):
+        docs += decoder.feed(data[i:i + 1])
+    assert [doc["data"] for doc in docs] == documents
+    assert not decoder.buffer
+
+
+def test_restricted_unpickler_allows_uuids():
+    game_id = uuid.uuid4()
+    pickled = pickle.dumps({"action": "[GET HINT]", "data": game_id})
+    data = bytes(f"{len(pickled):<{HEADERSIZE}}", "utf-8") + pickled
+    assert FrameDecoder().feed(data) == [{"action": "[GET HINT]", "data": game_id}]
+
+
+class RunsCode():
+    def __reduce__(self):
+        return os.system, ("echo this should never run",)
+
+
+@pytest.mark.parametrize("document", [RunsCode(), Board(3, 3, 1)], ids=["os.system", "Board"])
+def test_restricted_unpickler_turns_down_classes(document):
+    pickled = pickle.dumps({"action": "[JOIN GAME]", "data": document})
+    with pytest.raises(pickle.UnpicklingError):
+        FrameDecoder().feed(bytes(f"{len(pickled):<{HEADERSIZE}}", "utf-8") + pickled)
+
+
+def test_other_protocol_versions_are_turned_down():
+    data = bytearray(encode_document("[JOIN GAME]", None))
+    data[1] += 1
+    with pytest.raises(ValueError):
+        FrameDecoder().feed(bytes(data))
+
+
+def test_unknown_actions_are_turned_down():
+    with pytest.raises(ValueError):
+        encode_document("[NOT AN ACTION]", None)
+    data = bytearray(encode_document("[JOIN GAME]", None))
+    BINARY_HEADER.pack_into(data, 0, data[0], data[1], len(ACTIONS), 1)
+    with pytest.raises(ValueError):
+        FrameDecoder().feed(bytes(data))
+
+
+def test_broken_boards_are_turned_down():
+    data = encode_document("[GAME - TURN]", Board(3, 3, 0))
+    with pytest.raises(ValueError):
+        # The padding bits after the last cell
+        FrameDecoder().feed(data[:-1] + bytes([data[-1] | 0x80]))
+    # The frame is cut short inside the board but its length says that is all of it
+    short = bytearray(data[:-1])
+    BINARY_HEADER.pack_into(short, 0, short[0], short[1], int.from_bytes(short[2:4], "big"), len(short) - 8)
+    with pytest.raises(ValueError):
+        FrameDecoder().feed(bytes(short))
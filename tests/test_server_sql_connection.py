@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# The leaderboard pages read from the score index
+
+import pytest
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 59, 60, 100])
+def test_pages_cover_the_leaderboard_once(database, leaderboard, limit):
+    found = []
+    after = None
+    pages = 0
+    while True:
+        page, after = database.leaderboard_page(after, limit)
+        pages += 1
+        assert 0 < len(page) <= limit
+        found += page
+        if after is None:
+            break
+        # Where the next page starts is the last player of this one
+        assert after == (page[-1][1] - page[-1][2], page[-1][0])
+    assert found == leaderboard
+    assert pages == -(-len(leaderboard) // limit)
+
+
+def test_a_page_can_start_in_the_middle_of_a_score(database, leaderboard):
+    for i, player in enumerate(leaderboard[:-1]):
+        page, _ = database.leaderboard_page((player[1] - player[2], player[0]), 5)
+        assert page == leaderboard[i + 1:i + 6]
+
+
+def test_empty_leaderboard(database):
+    assert database.leaderboard_page(None, 10) == ([], None)
+
+
+@pytest.mark.parametrize("count", [1, 2, 5])
+def test_player_and_neighbours(database, leaderboard, count):
+    for i, (username, wins, loses, games_played) in enumerate(leaderboard):
+        player, above, below = database.player_and_neighbours(username, count)
+        assert player == (username, wins, loses, games_played, wins - loses)
+        assert above == leaderboard[max(i - count, 0):i]
+        assert below == leaderboard[i + 1:i + 1 + count]
+    assert database.player_and_neighbours("nobody", count) == (None, [], [])
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# The solver checked against trying every way to press the cells of small boards
+
+from functools import lru_cache
+
+from board import Board
+from solve import CHASE_CELLS, MAX_HINT_NULLITY, Elimination, count_solutions, fewest_presses, is_solvable, \
+    light_chase, new_board, solution, solve, solve_list
+
+import random  # used to pick the boards that are checked
+
+import pytest
+
+SIZES = [(3, 3), (3, 4), (4, 3), (4, 4), (3, 5)]
+# Sizes past CHASE_CELLS, so they are solved by light chasing, with and without a null space
+CHASE_SIZES = [(15, 15), (16, 16), (20, 20), (19, 24)]
+
+
+@lru_cache(maxsize=None)
+def brute_force(height: int, width: int) -> dict[int, list[int]]:
+    """
+    Every board (as Board.bits) and every set of presses (as a bitmask of the cells) that makes it all even.
+    Pressing a set of cells switches the XOR of their press masks, so trying every set once covers every board.
+    """
+    masks = []
+    for cell in range(height * width):
+        board = Board(height, width)
+        board.press(*divmod(cell, width))
+        masks.append(board.bits)
+    solutions: dict[int, list[int]] = {}
+    switched = 0
+    # Gray code order, every set of presses differs from the one before by one cell
+    for step in range(1 << (height * width)):
+        presses = step ^ (step >> 1)
+        if step:
+            switched ^= masks[((step & -step).bit_length() - 1)]
+        solutions.setdefault(switched, []).append(presses)
+    return solutions
+
+
+def as_mask(presses: list[list[int]]) -> int:
+    width = len(presses[0])
+    return sum(pressed << (i * width + j) for i, row in enumerate(presses) for j, pressed in enumerate(row))
+
+
+def boards(height: int, width: int, count: int = 40) -> list[Board]:
+    """
+    Some random boards of the size, solvable or not, and the all even and all odd boards.
+    """
+    rng = random.Random(height * 100 + width)
+    cells = height * width
+    return [Board(height, width, 0), Board(height, width, (1 << cells) - 1)] + \
+        [Board(height, width, rng.getrandbits(cells)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_solve_gives_every_solution(height, width):
+    table = brute_force(height, width)
+    for board in boards(height, width):
+        found = [as_mask(presses) for presses in solve(board)]
+        assert len(found) == len(set(found))
+        assert set(found) == set(table.get(board.bits, []))
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_solve_matches_the_original_solver(height, width):
+    for board in boards(height, width, 10):
+        assert solve(board) == solve_list(board.to_rows())
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_solution_is_a_solution(height, width):
+    table = brute_force(height, width)
+    for board in boards(height, width):
+        presses = solution(board)
+        if board.bits not in table:
+            assert presses is None
+            continue
+        assert as_mask(presses) in table[board.bits]
+        # Pressing them makes the board all even
+        for i, row in enumerate(presses):
+            for j, pressed in enumerate(row):
+                if pressed:
+                    board.press(i, j)
+        assert board.winner == 1
+
+
+def test_solve_takes_lists_of_rows():
+    rows = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert solve(rows) == solve(Board.from_rows(rows))
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_solvable_and_count_without_solving(height, width):
+    table = brute_force(height, width)
+    for board in boards(height, width):
+        assert is_solvable(board) == (board.bits in table)
+        assert count_solutions(board) == len(table.get(board.bits, []))
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_every_solvable_board_has_the_same_count(height, width):
+    # The solutions of a board are one of them XOR the null space, so it is the same for every board
+    counts = {len(presses) for presses in brute_force(height, width).values()}
+    assert len(counts) == 1
+    assert count_solutions(Board(height, width, 0)) == counts.pop()
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+@pytest.mark.parametrize("odd", [False, True])
+def test_fewest_presses(height, width, odd):
+    table = brute_force(height, width)
+    everything = (1 << (height * width)) - 1
+    for board in boards(height, width):
+        # Making the board all odd is making the board with every cell switched all even
+        solutions = table.get(board.bits ^ everything if odd else board.bits)
+        presses = fewest_presses(board, odd=odd)
+        if solutions is None:
+            assert presses is None
+            continue
+        assert presses in solutions
+        assert presses.bit_count() == min(solution.bit_count() for solution in solutions)
+
+
+@pytest.mark.parametrize("height, width", SIZES)
+def test_hint_without_its_first_press_is_still_the_fewest(height, width):
+    # The server keeps a player's hint after they press a cell of it (see SocketServer.update_hints)
+    table = brute_force(height, width)
+    for board in boards(height, width):
+        presses = fewest_presses(board)
+        if not presses:
+            continue
+        cell = (presses & -presses).bit_length() - 1
+        board.press(*divmod(cell, width))
+        assert (presses ^ (1 << cell)).bit_count() == min(solution.bit_count() for solution in table[board.bits])
+
+
+@lru_cache(maxsize=None)
+def elimination(height: int, width: int) -> Elimination:
+    return Elimination(height, width)
+
+
+def chase_boards(height: int, width: int, count: int = 10) -> list[Board]:
+    """
+    Random boards of a light chased size, half of them made to be solvable
+    (most random boards can't be solved when the size has a null space).
+    """
+    rng = random.Random(height * 100 + width)
+    return boards(height, width, count) + [new_board(height, width, rng) for _ in range(count)]
+
+
+def pressed(board: Board, presses: int) -> Board:
+    board = Board(board.height, board.width, board.bits)
+    for cell in range(board.height * board.width):
+        if presses >> cell & 1:
+            board.press(*divmod(cell, board.width))
+    return board
+
+
+@pytest.mark.parametrize("height, width", CHASE_SIZES)
+def test_light_chase_matches_elimination(height, width):
+    assert height * width > CHASE_CELLS
+    full = elimination(height, width)
+    for board in chase_boards(height, width):
+        solvable = full.is_solvable(board.bits)
+        assert is_solvable(board) == solvable
+        assert count_solutions(board) == (1 << len(full.null_basis) if solvable else 0)
+        presses = solution(board)
+        if not solvable:
+            assert presses is None
+            continue
+        assert pressed(board, as_mask(presses)).winner == 1
+
+
+@pytest.mark.parametrize("height, width", CHASE_SIZES)
+@pytest.mark.parametrize("odd", [False, True])
+def test_light_chase_fewest_presses(height, width, odd):
+    assert len(light_chase(height, width).null_basis) <= MAX_HINT_NULLITY
+    full = elimination(height, width)
+    everything = (1 << (height * width)) - 1
+    for board in chase_boards(height, width):
+        vector = board.bits ^ everything if odd else board.bits
+        best = full.fewest_presses(vector)
+        presses = fewest_presses(board, odd=odd)
+        if best is None:
+            assert presses is None
+            continue
+        assert pressed(board, presses).bits == (everything if odd else 0)
+        # There can be more than one with the fewest presses
+        assert presses.bit_count() == best.bit_count()
+
+
+def test_light_chase_hint_past_the_max_nullity():
+    # 30x30 boards have 20 null space vectors, going through every mix of them is too slow for a hint
+    chase = light_chase(30, 30)
+    assert len(chase.null_basis) > MAX_HINT_NULLITY
+    for board in chase_boards(30, 30, 3):
+        presses = fewest_presses(board)
+        # The hint is just the solution that light chasing found
+        assert presses == chase.press(board.bits)
+        if presses is not None:
+            assert pressed(board, presses).winner == 1